@@ -0,0 +1,541 @@
+"""
+Offline benchmark of the data fetching functions.
+
+Runs the collectors of data-fetching-0 and the daily fetch and weekly
+report of data-fetching-1 against synthetic (or recorded) API responses,
+with GCS and BigQuery replaced by in-memory stand-ins, and reports wall
+time, request count per endpoint and peak memory per scenario.
+
+    python benchmark/bench.py --repos 10,100,1000 --output after.json \\
+        --baseline before.json
+
+Running through the stand-in server of mock_server.py, to go through
+real HTTP with its latency, rate limits and failures:
+
+    python benchmark/mock_server.py --repos 1000 --latency 50 &
+    python benchmark/bench.py --server http://127.0.0.1:8080
+
+Cold start, import of main.py and time to its first request in fresh
+interpreters:
+
+    python benchmark/bench.py --cold-start --output cold.json
+
+Recording live responses for later replay (needs a real conf):
+
+    python benchmark/bench.py --record recorded.json --conf config.json
+    python benchmark/bench.py --fixtures recorded.json
+"""
+
+import argparse
+import collections
+import contextlib
+import datetime
+import fnmatch
+import importlib.util
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+from fixtures import SyntheticApi, RecordedApi
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = {
+    "data-fetching-0": os.path.join(
+        ROOT, "functions", "data-fetching-0", "main.py"),
+    "data-fetching-1": os.path.join(
+        ROOT, "functions", "data-fetching-1", "main.py"),
+}
+DEFAULT_CONF = {
+    "github_token": "benchmark",
+    "maven": {
+        "project_id": "benchmark",
+        "artifacts": [
+            "com.vesoft:client", "com.vesoft:nebula-spark-connector",
+            "com.vesoft:nebula-exchange", "com.vesoft:nebula-algorithm"]},
+    "go": {"modules": [
+        "github.com/vesoft-inc/nebula-go/v3",
+        "github.com/vesoft-inc/nebula-importer"]},
+    "dockerhub_tags": {"host_concurrency": 4},
+}
+REPORT_DAYS = 7
+SHARD_REPOS = 25
+
+
+class Blob:
+    """in-memory google.cloud.storage.Blob"""
+    # generations are unique across buckets, as scenarios recreate them
+    generations = itertools.count(1)
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def generation(self):
+        return self.bucket.generations.get(self.name)
+
+    def exists(self, client=None):
+        return self.name in self.bucket.objects
+
+    def reload(self, client=None):
+        if not self.exists():
+            from google.cloud.exceptions import NotFound
+            raise NotFound(self.name)
+
+    def download_as_string(self, client=None, if_generation_not_match=None,
+            **kwargs):
+        self.reload()
+        if if_generation_not_match == self.generation:
+            from google.cloud.exceptions import NotModified
+            raise NotModified(self.name)
+        return self.bucket.objects[self.name]
+
+    download_as_bytes = download_as_string
+
+    def upload_from_string(self, data, content_type=None,
+            if_generation_match=None, **kwargs):
+        if if_generation_match is not None \
+                and if_generation_match != (self.generation or 0):
+            from google.cloud.exceptions import PreconditionFailed
+            raise PreconditionFailed(self.name)
+        if isinstance(data, str):
+            data = data.encode()
+        self.bucket.objects[self.name] = data
+        self.bucket.generations[self.name] = next(self.generations)
+
+    def open(self, mode="r", chunk_size=None, **kwargs):
+        """
+        reader, or writer of the object created once closed as BlobWriter's,
+        in text or binary mode
+        """
+        if mode in ("r", "rb"):
+            reader = io.BytesIO(self.download_as_bytes())
+            return reader if mode == "rb" \
+                else io.TextIOWrapper(reader, encoding="utf-8")
+        writer = BlobWriter(self, chunk_size or 40 * 1024 * 1024)
+        return writer if mode == "wb" \
+            else io.TextIOWrapper(writer, encoding="utf-8")
+
+    def delete(self, client=None):
+        self.reload()
+        del self.bucket.objects[self.name]
+
+
+class BlobWriter(io.BytesIO):
+    """
+    binary writer of google.cloud.storage.Blob.open("wb"), the buffer is
+    "uploaded" every chunk_size like a resumable upload
+    """
+    def __init__(self, blob, chunk_size):
+        super().__init__()
+        self.blob = blob
+        self.chunk_size = chunk_size
+        self.chunks = []
+
+    def write(self, b):
+        n = super().write(b)
+        if self.tell() >= self.chunk_size:
+            self.chunks.append(self.getvalue())
+            self.seek(0)
+            self.truncate()
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.chunks.append(self.getvalue())
+            self.blob.upload_from_string(b"".join(self.chunks))
+            self.chunks = []
+        super().close()
+
+
+class Bucket:
+    """in-memory google.cloud.storage.Bucket"""
+    def __init__(self, name):
+        self.name = name
+        self.objects = {}
+        self.generations = {}
+
+    def blob(self, name):
+        return Blob(self, name)
+
+    get_blob = blob
+
+    def list_blobs(self, prefix=None, match_glob=None, **kwargs):
+        return [
+            Blob(self, name) for name in sorted(self.objects)
+            if (prefix is None or name.startswith(prefix))
+            and (match_glob is None or fnmatch.fnmatchcase(name, match_glob))]
+
+
+class StorageClient:
+    """in-memory google.cloud.storage.Client, buckets live per scenario"""
+    buckets = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, Bucket(name))
+
+    get_bucket = bucket
+
+    def list_blobs(self, bucket, prefix=None, match_glob=None, **kwargs):
+        if isinstance(bucket, str):
+            bucket = self.bucket(bucket)
+        return bucket.list_blobs(prefix=prefix, match_glob=match_glob)
+
+
+class LoadJob:
+    errors = None
+
+    def result(self, *args, **kwargs):
+        return self
+
+
+class BigQueryClient:
+    """BigQuery stand-in recording the load jobs it is given"""
+    jobs = []
+    # tables partitioned by day, as bigquery/README.md creates them
+    partitioned = True
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def load_table_from_uri(self, source_uris, destination, **kwargs):
+        self.jobs.append((source_uris, destination))
+        return LoadJob()
+
+    def get_table(self, table_id):
+        return types.SimpleNamespace(
+            table_id=table_id,
+            time_partitioning=self.partitioned or None)
+
+    def load_table_from_file(self, file_obj, destination, **kwargs):
+        self.jobs.append((file_obj.read(), destination))
+        return LoadJob()
+
+
+class Transport:
+    """
+    Serves every request sent by requests (and so PyGithub) from the
+    fixtures api, or without api passes it through, and records the
+    response when recording.
+    """
+    def __init__(self, api=None, recording=None):
+        # imported here, not to be preloaded for --cold-start measurements
+        import requests
+
+        self.api = api
+        self.recording = recording
+        self.requests = collections.Counter()
+        self.send = requests.adapters.HTTPAdapter.send
+
+    def __call__(self, adapter, request, **kwargs):
+        import requests
+
+        if self.api is None:
+            response = self.send(adapter, request, **kwargs)
+            endpoint = SyntheticApi().route(request.method, request.url)[0]
+            endpoint = endpoint or "unknown"
+            if self.recording is not None:
+                RecordedApi.record(
+                    self.recording, request.method, request.url, endpoint,
+                    response)
+            self.requests[endpoint] += 1
+            return response
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode()
+        endpoint, fixture = self.api.handle(request.method, request.url, body)
+        self.requests[endpoint] += 1
+        response = requests.models.Response()
+        response.status_code = fixture.status
+        response.headers = requests.structures.CaseInsensitiveDict(
+            fixture.headers)
+        response._content = fixture.content()
+        response.url = request.url
+        response.request = request
+        response.reason = "OK" if fixture.status < 400 else "Error"
+        response.encoding = "utf-8"
+        response.connection = adapter
+        return response
+
+    @contextlib.contextmanager
+    def installed(self):
+        import requests
+
+        def send(adapter, request, **kwargs):
+            return self(adapter, request, **kwargs)
+
+        requests.adapters.HTTPAdapter.send = send
+        try:
+            yield self
+        finally:
+            requests.adapters.HTTPAdapter.send = self.send
+
+
+def load_function(name):
+    """
+    import main.py of a function under its own module name, with the copy
+    of common.py of its folder as deployed, clients are replaced on the
+    modules it uses (or their lazy import proxies)
+    """
+    module_name = name.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, FUNCTIONS[name])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    sys.modules.pop("common", None)
+    sys.path.insert(0, os.path.dirname(FUNCTIONS[name]))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+        sys.modules.pop("common", None)
+    module.storage.Client = StorageClient
+    module.bigquery.Client = BigQueryClient
+    return module
+
+
+def new_scenario(module, conf):
+    """fresh bucket holding only the conf"""
+    StorageClient.buckets = {}
+    BigQueryClient.jobs = []
+    StorageClient().bucket(module.BUCKET).blob(
+        "conf/config.json").upload_from_string(json.dumps(conf))
+
+
+def run_data_fetching_0(module):
+    data_fetcher = module.DataFetcher()
+    record_folder = data_fetcher.collect()
+    data_fetcher.load_data(record_folder)
+    return data_fetcher.metrics.summary()
+
+
+def run_data_fetching_0_sharded(module):
+    """coordinator, workers and merge of a sharded run on a local queue"""
+    blob = StorageClient().bucket(module.BUCKET).blob("conf/config.json")
+    conf = json.loads(blob.download_as_string())
+    conf["sharding"] = dict(
+        {"repos_per_shard": SHARD_REPOS}, **conf.get("sharding", {}),
+        enabled=True, queue="local")
+    blob.upload_from_string(json.dumps(conf))
+    module.data_fetch({}, None)
+
+
+def run_data_fetching_1_daily(module):
+    data_fetcher = module.DataFetcher(module.RunContext())
+    module.run_daily_fetch(data_fetcher)
+    return data_fetcher.metrics.summary()
+
+
+def run_data_fetching_1_report(module):
+    weekly_report = module.DataFetcher(module.RunContext())
+    right = datetime.date.today() - datetime.timedelta(days=1)
+    left = right - datetime.timedelta(days=REPORT_DAYS - 1)
+    weekly_report.get_report_data(left=str(left), right=str(right))
+    weekly_report.generate_report()
+    return weekly_report.metrics.summary()
+
+
+SCENARIOS = (
+    ("data-fetching-0", "collect", run_data_fetching_0),
+    ("data-fetching-0", "sharded", run_data_fetching_0_sharded),
+    ("data-fetching-1", "daily", run_data_fetching_1_daily),
+    ("data-fetching-1", "report", run_data_fetching_1_report),
+)
+
+
+def measure_cold_start(name):
+    """
+    In a fresh interpreter: import main.py and run until the first request,
+    the conf download. Prints import and first request seconds as JSON.
+    """
+    started_at = time.perf_counter()
+    module = load_function(name)
+    imported_at = time.perf_counter()
+    new_scenario(module, DEFAULT_CONF)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # creating the real storage client imports it, lazily or not
+        importlib.import_module("google.cloud.storage")
+        if name == "data-fetching-0":
+            module.DataFetcher().conf
+        else:
+            module.RunContext().conf
+    first_request_at = time.perf_counter()
+    print(json.dumps({
+        "import_seconds": round(imported_at - started_at, 3),
+        "first_request_seconds": round(first_request_at - started_at, 3),
+        "modules": len(sys.modules)}))
+
+
+def cold_start(name, runs=5):
+    """median of measure_cold_start over runs fresh interpreters"""
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c",
+                f"import bench; bench.measure_cold_start({ name !r})"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        key: sorted(result[key] for result in results)[runs // 2]
+        for key in results[0]}
+
+
+def measure(run, module, transport, verbose=False):
+    """wall time, requests and peak traced memory of one scenario"""
+    transport.requests.clear()
+    output = contextlib.nullcontext() if verbose \
+        else contextlib.redirect_stdout(io.StringIO())
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    error = None
+    with output:
+        try:
+            metrics = run(module)
+        except Exception as e:
+            metrics = None
+            error = f"{ type(e).__name__ }: { e }"
+    wall_time = time.perf_counter() - started_at
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+        "wall_time": round(wall_time, 3),
+        "requests": sum(transport.requests.values()),
+        "requests_by_endpoint": dict(sorted(transport.requests.items())),
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+        "gcs_objects": sum(
+            len(bucket.objects) for bucket in StorageClient.buckets.values()),
+        "bq_load_jobs": len(BigQueryClient.jobs),
+    }
+    if metrics is not None:
+        result["stages"] = {
+            stage: stats["seconds"]
+            for stage, stats in metrics.get("stages", {}).items()}
+    if error:
+        result["error"] = error
+    return result
+
+
+def compare(results, baseline):
+    """print before/after of scenarios found in both result sets"""
+    print(f"{ 'scenario':<34}{ 'metric':<24}{ 'before':>12}"
+          f"{ 'after':>12}{ 'change':>10}")
+    for key, after in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for metric in ("wall_time", "requests", "peak_memory_mb",
+                "import_seconds", "first_request_seconds"):
+            if metric not in after:
+                continue
+            old, new = before.get(metric, 0), after.get(metric, 0)
+            change = f"{ (new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{ key:<34}{ metric:<24}{ old:>12}{ new:>12}{ change:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--repos", default="10,100",
+        help="comma separated org sizes to run the synthetic scenarios at")
+    parser.add_argument("--releases", type=int, default=10)
+    parser.add_argument("--assets", type=int, default=6)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument(
+        "--functions", default=",".join(FUNCTIONS),
+        help="comma separated functions to benchmark")
+    parser.add_argument(
+        "--fixtures", help="replay responses recorded with --record")
+    parser.add_argument(
+        "--record", help="run against live APIs and record responses here")
+    parser.add_argument(
+        "--server", help="base url of a running mock_server.py to run against")
+    parser.add_argument(
+        "--conf", help="conf/config.json to run with, default is synthetic")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare with")
+    parser.add_argument("--cold-start", action="store_true",
+        help="measure import and time to first request of the functions "
+             "in fresh interpreters, instead of the scenarios")
+    parser.add_argument("--verbose", action="store_true",
+        help="keep the logs of the functions")
+    args = parser.parse_args(argv)
+
+    conf = DEFAULT_CONF
+    if args.conf:
+        with open(args.conf) as f:
+            conf = json.load(f)
+    if args.server:
+        server = args.server.rstrip("/")
+        conf = dict(conf,
+            github_base_url=server, dockerhub_base_url=f"{ server }/v2/",
+            maven=dict(conf.get("maven", {}), endpoint=server),
+            go=dict(conf.get("go", {}), proxy=server))
+    functions = args.functions.split(",")
+    if args.cold_start:
+        results = {}
+        for name in functions:
+            results[f"{ name }:cold_start"] = cold_start(name)
+            print(f"{ name }:cold_start", json.dumps(
+                results[f"{ name }:cold_start"]))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if args.baseline:
+            with open(args.baseline) as f:
+                compare(results, json.load(f))
+        return
+    modules = {name: load_function(name) for name in functions}
+
+    recording = {} if args.record else None
+    if args.server:
+        apis = [("server", None)]
+    elif args.record or args.fixtures:
+        apis = [("recorded", RecordedApi(args.fixtures) if args.fixtures
+            else None)]
+    else:
+        apis = [(f"repos={ repos }", SyntheticApi(
+                org=conf.get("github_orgnization", "vesoft-inc"),
+                repos=int(repos), releases=args.releases, assets=args.assets,
+                images=args.images))
+            for repos in args.repos.split(",")]
+
+    results = {}
+    for label, api in apis:
+        transport = Transport(api, recording)
+        with transport.installed():
+            for name, scenario, run in SCENARIOS:
+                if name not in modules:
+                    continue
+                key = f"{ name }:{ scenario }:{ label }"
+                new_scenario(modules[name], conf)
+                results[key] = measure(
+                    run, modules[name], transport, verbose=args.verbose)
+                print(f"{ key:<34}{ results[key]['wall_time']:>8.3f}s "
+                      f"{ results[key]['requests']:>7} requests "
+                      f"{ results[key]['peak_memory_mb']:>8.2f} MB"
+                      + (f"  { results[key]['error'] }"
+                         if "error" in results[key] else ""))
+
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(recording, f, indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
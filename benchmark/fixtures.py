@@ -0,0 +1,436 @@
+"""
+Synthetic and recorded responses of the APIs used by the data fetching
+functions, so that collectors can be driven without hitting live APIs.
+
+SyntheticApi generates GitHub REST/GraphQL/search and Docker Hub responses
+for an org scaled by repos, releases and images. RecordedApi replays
+responses recorded from live APIs by bench.py --record.
+"""
+
+import datetime
+import json
+import re
+
+from urllib.parse import urlparse, parse_qs, urlencode
+
+
+GITHUB_API = "https://api.github.com"
+
+SEARCH_WINDOW_PATTERN = re.compile(
+    r"repo:(?P<org>[^/ ]+)/(?P<repo>\S+) is:(?P<kind>pr|issue)"
+    r"(?: is:(?P<state>open|closed))? (?P<field>merged|created|closed):"
+    r"(?P<left>\d{4}-\d\d-\d\d)\.\.(?P<right>\d{4}-\d\d-\d\d)")
+GRAPHQL_REPO_PATTERN = re.compile(r'repository\(owner:"([^"]+)", name:"([^"]+)"\)')
+
+
+def iso(timestamp):
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class Response:
+    """status, headers and JSON (or text) body of a response"""
+    def __init__(self, status=200, body=None, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = dict(headers or {})
+
+    def content(self):
+        if isinstance(self.body, str):
+            return self.body.encode()
+        return json.dumps(self.body).encode()
+
+
+class SyntheticApi:
+    """
+    Routes requests of the GitHub and Docker Hub APIs to generated data of
+    an org with `repos` repos, `releases` releases per repo with `assets`
+    assets each, `prs` merged PRs and `issues` opened/closed issues per repo
+    and search window, `members` org members and `images` Docker Hub images.
+    Pages hold `page_size` items when the client doesn't ask for a size, and
+    at most `max_page_size`.
+    Maven Central Statistics and the Go module proxy are served as well.
+    """
+    def __init__(self, org="vesoft-inc", repos=10, releases=10, assets=6,
+            prs=5, issues=3, members=10, images=20, search_limit=100000,
+            page_size=None, max_page_size=100,
+            github_api=GITHUB_API):
+        self.org = org
+        self.repos = repos
+        self.releases = releases
+        self.assets = assets
+        self.prs = prs
+        self.issues = issues
+        self.members = members
+        self.images = images
+        self.search_limit = search_limit
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.github_api = github_api.rstrip("/")
+        self.now = datetime.datetime.utcnow().replace(microsecond=0)
+        self.routes = [
+            ("GET", r"/rate_limit$", "github:rate_limit", self.rate_limit),
+            ("GET", r"/orgs/([^/]+)$", "github:orgs", self.organization),
+            ("GET", r"/orgs/([^/]+)/repos$", "github:orgs/repos", self.org_repos),
+            ("GET", r"/orgs/([^/]+)/members$", "github:orgs/members",
+                self.org_members),
+            ("GET", r"/repos/([^/]+)/([^/]+)$", "github:repos", self.repo),
+            ("GET", r"/repos/([^/]+)/([^/]+)/traffic/clones$",
+                "github:traffic/clones", self.clones),
+            ("GET", r"/repos/([^/]+)/([^/]+)/releases$", "github:releases",
+                self.repo_releases),
+            ("GET", r"/repos/([^/]+)/([^/]+)/releases/(\d+)/assets$",
+                "github:releases/assets", self.release_assets),
+            ("GET", r"/repos/([^/]+)/([^/]+)/contributors$",
+                "github:contributors", self.contributors),
+            ("GET", r"/repos/([^/]+)/([^/]+)/issues/(\d+)$", "github:issues",
+                self.issue),
+            ("GET", r"/search/issues$", "github:search", self.search_issues),
+            ("POST", r"/graphql$", "github:graphql", self.graphql),
+            ("GET", r"/v2/repositories/([^/]+)/?$", "dockerhub:repositories",
+                self.dockerhub_repositories),
+            ("GET", r"/v2/repositories/([^/]+)/([^/]+)/tags/?$",
+                "dockerhub:tags", self.dockerhub_tags),
+            ("GET", r"/service/local/stats/timeline$", "maven:stats",
+                self.maven_stats),
+            ("GET", r"/(.+)/@v/list$", "go:list", self.go_versions),
+            ("GET", r"/(.+)/@latest$", "go:latest", self.go_latest),
+        ]
+        self.routes = [
+            (method, re.compile(pattern), name, handler)
+            for method, pattern, name, handler in self.routes]
+
+    def route(self, method, url):
+        """returns (endpoint name, handler, path match) of a request"""
+        path = urlparse(url).path
+        for route_method, pattern, name, handler in self.routes:
+            if route_method != method:
+                continue
+            match = pattern.search(path)
+            if match:
+                return name, handler, match
+        return None, None, None
+
+    def handle(self, method, url, body=None, page_size=None):
+        """returns (endpoint name, Response) of a request"""
+        name, handler, match = self.route(method, url)
+        if handler is None:
+            return "unknown", Response(404, {"message": "Not Found"})
+        params = {
+            key: values[0]
+            for key, values in parse_qs(urlparse(url).query).items()}
+        response = handler(
+            match, params=params, body=body, url=url,
+            page_size=page_size or self.page_size)
+        response.headers.setdefault("Content-Type", "application/json")
+        if name.startswith("github:"):
+            # PyGithub fetches /rate_limit when responses come without these
+            response.headers.setdefault("X-RateLimit-Limit", "5000")
+            response.headers.setdefault("X-RateLimit-Remaining", "4999")
+            response.headers.setdefault("X-RateLimit-Reset", str(int(
+                (self.now + datetime.timedelta(hours=1)).timestamp())))
+        return name, response
+
+    # helpers
+
+    @staticmethod
+    def base_url(url):
+        """
+        url without query, and without the default port of the scheme as
+        PyGithub only follows links on the port of its base url
+        """
+        parsed = urlparse(url)
+        netloc = parsed.hostname
+        if parsed.port and (parsed.scheme, parsed.port) not in (
+                ("http", 80), ("https", 443)):
+            netloc = f"{ netloc }:{ parsed.port }"
+        return f"{ parsed.scheme }://{ netloc }{ parsed.path }"
+
+    def paginate(self, url, params, items, page_size=None, default=30):
+        """GitHub style page of items with the Link header of next page"""
+        per_page = min(
+            int(params.get("per_page", page_size or default)),
+            self.max_page_size)
+        page = int(params.get("page", 1))
+        chunk = items[(page - 1) * per_page:page * per_page]
+        headers = {}
+        if page * per_page < len(items):
+            base = self.base_url(url)
+            query = dict(params, page=page + 1, per_page=per_page)
+            headers["Link"] = f'<{ base }?{ urlencode(query) }>; rel="next"'
+        return Response(200, chunk, headers)
+
+    def repo_names(self):
+        return [f"repo-{ index }" for index in range(self.repos)]
+
+    def user(self, user_id):
+        return {
+            "login": f"user-{ user_id }", "id": user_id,
+            "url": f"{ self.github_api }/users/user-{ user_id }",
+            "type": "User"}
+
+    def repository(self, name):
+        index = int(name.rsplit("-", 1)[-1]) if name[-1].isdigit() else 0
+        updated_at = self.now - datetime.timedelta(days=index % 30)
+        return {
+            "id": 100000 + index, "name": name,
+            "full_name": f"{ self.org }/{ name }",
+            "private": False, "archived": False, "fork": False,
+            "owner": {"login": self.org, "id": 1, "type": "Organization"},
+            "url": f"{ self.github_api }/repos/{ self.org }/{ name }",
+            "html_url": f"https://github.com/{ self.org }/{ name }",
+            "open_issues_count": index % 17,
+            "pushed_at": iso(updated_at), "updated_at": iso(updated_at),
+            "created_at": "2019-05-15T00:00:00Z"}
+
+    # GitHub
+
+    def rate_limit(self, match, **kwargs):
+        reset = int((self.now + datetime.timedelta(hours=1)).timestamp())
+        resources = {
+            "core": {"limit": 5000, "remaining": 4999, "reset": reset},
+            "search": {
+                "limit": self.search_limit, "remaining": self.search_limit,
+                "reset": reset},
+            "graphql": {"limit": 5000, "remaining": 4999, "reset": reset}}
+        return Response(200, {"resources": resources, "rate": resources["core"]})
+
+    def organization(self, match, **kwargs):
+        org = match.group(1)
+        return Response(200, {
+            "login": org, "id": 1,
+            "url": f"{ self.github_api }/orgs/{ org }",
+            "repos_url": f"{ self.github_api }/orgs/{ org }/repos",
+            "public_repos": self.repos})
+
+    def org_repos(self, match, params, url, page_size, **kwargs):
+        return self.paginate(
+            url, params,
+            [self.repository(name) for name in self.repo_names()], page_size)
+
+    def repo(self, match, **kwargs):
+        if match.group(2) not in self.repo_names():
+            return Response(404, {"message": "Not Found"})
+        return Response(200, self.repository(match.group(2)))
+
+    def org_members(self, match, params, url, page_size, **kwargs):
+        return self.paginate(
+            url, params,
+            [self.user(user_id) for user_id in range(1, self.members + 1)],
+            page_size)
+
+    def clones(self, match, **kwargs):
+        clones = [{
+                "timestamp": iso(datetime.datetime.combine(
+                    self.now.date() - datetime.timedelta(days=delta),
+                    datetime.time())),
+                "count": 10 + delta, "uniques": 3 + delta}
+            for delta in range(14, 0, -1)]
+        return Response(200, {
+            "count": sum(clone["count"] for clone in clones),
+            "uniques": sum(clone["uniques"] for clone in clones),
+            "clones": clones})
+
+    def release(self, org, repo, index):
+        release_id = 1000 * (int(repo.rsplit("-", 1)[-1]) + 1) + index
+        url = f"{ self.github_api }/repos/{ org }/{ repo }/releases/{ release_id }"
+        return {
+            "id": release_id, "tag_name": f"v{ index }.0.0",
+            "name": f"v{ index }.0.0", "url": url,
+            "assets_url": f"{ url }/assets",
+            "html_url": f"https://github.com/{ org }/{ repo }/releases/v{ index }.0.0",
+            "draft": False, "prerelease": False,
+            "created_at": "2021-01-01T00:00:00Z",
+            "published_at": "2021-01-01T00:00:00Z"}
+
+    def repo_releases(self, match, params, url, page_size, **kwargs):
+        org, repo = match.group(1), match.group(2)
+        return self.paginate(
+            url, params,
+            [self.release(org, repo, index)
+                for index in range(self.releases, 0, -1)],
+            page_size)
+
+    def release_assets(self, match, params, url, page_size, **kwargs):
+        org, repo, release_id = match.groups()
+        tag = f"v{ int(release_id) % 1000 }.0.0"
+        assets = []
+        for index in range(self.assets):
+            name = f"{ repo }-{ tag }.{ index }.x86_64.rpm"
+            assets.append({
+                "id": int(release_id) * 100 + index, "name": name,
+                "url": f"{ self.github_api }/repos/{ org }/{ repo }/releases/assets/{ release_id }{ index }",
+                "browser_download_url":
+                    f"https://github.com/{ org }/{ repo }/releases/download/{ tag }/{ name }",
+                "download_count": int(release_id) % 97 + index,
+                "size": 1024, "state": "uploaded"})
+        # checksum files are skipped by the collector
+        assets.append(dict(assets[-1], name=f"{ repo }-{ tag }.sha256sum.txt"))
+        return self.paginate(url, params, assets, page_size)
+
+    def contributors(self, match, params, url, page_size, **kwargs):
+        contributors = [
+            dict(self.user(user_id), contributions=user_id % 5 + 1)
+            for user_id in range(1, self.members + 1)]
+        contributors += [
+            dict(self.user(1000 + index), contributions=index % 3 + 1)
+            for index in range(self.prs)]
+        return self.paginate(url, params, contributors, page_size)
+
+    def issue_item(self, org, repo, number, user_id, created_at, closed_at,
+            pull_request=False):
+        item = {
+            "id": number, "number": number, "title": f"issue { number }",
+            "user": self.user(user_id),
+            "url": f"{ self.github_api }/repos/{ org }/{ repo }/issues/{ number }",
+            "html_url": f"https://github.com/{ org }/{ repo }/"
+                        f"{ 'pull' if pull_request else 'issues' }/{ number }",
+            "state": "closed" if closed_at else "open",
+            "created_at": iso(created_at),
+            "closed_at": iso(closed_at) if closed_at else None}
+        if pull_request:
+            item["pull_request"] = {"html_url": item["html_url"]}
+        return item
+
+    def issue(self, match, **kwargs):
+        org, repo, number = match.group(1), match.group(2), int(match.group(3))
+        item = self.issue_item(
+            org, repo, number, 1000 + number % 7,
+            self.now - datetime.timedelta(days=3), self.now)
+        item["closed_by"] = self.user(1 + number % self.members)
+        return Response(200, item)
+
+    def search_issues(self, match, params, url, page_size, **kwargs):
+        window = SEARCH_WINDOW_PATTERN.search(params.get("q", ""))
+        if window is None:
+            return Response(422, {"message": "Validation Failed"})
+        left = datetime.datetime.strptime(window.group("left"), "%Y-%m-%d")
+        org, repo = window.group("org"), window.group("repo")
+        items = []
+        if window.group("kind") == "pr":
+            for index in range(self.prs):
+                # every other PR is from an org member
+                user_id = 1 + index % self.members if index % 2 \
+                    else 1000 + index
+                items.append(self.issue_item(
+                    org, repo, 10 * index + 1, user_id,
+                    left - datetime.timedelta(days=3),
+                    left + datetime.timedelta(hours=12), pull_request=True))
+        else:
+            closed = window.group("state") == "closed"
+            for index in range(self.issues):
+                number = 10 * index + (3 if closed else 5)
+                items.append(self.issue_item(
+                    org, repo, number, 1000 + index,
+                    left + datetime.timedelta(hours=1),
+                    left + datetime.timedelta(hours=12) if closed else None))
+        page = self.paginate(url, params, items, page_size)
+        page.body = {
+            "total_count": len(items), "incomplete_results": False,
+            "items": page.body}
+        return page
+
+    def graphql(self, match, body=None, **kwargs):
+        query = json.loads(body or "{}").get("query", "")
+        repository = GRAPHQL_REPO_PATTERN.search(query)
+        if repository is None:
+            return Response(200, {"errors": [{"message": "unknown query"}]})
+        seed = len(repository.group(2))
+        counts = {
+            "all_pr_count": 100 + seed, "open_pr_count": seed,
+            "merged_pr_count": 90, "all_issue_count": 200 + seed,
+            "open_issue_count": 20 + seed, "closed_issue_count": 180}
+        return Response(200, {"data": {"repository": {
+            key: {"totalCount": count} for key, count in counts.items()}}})
+
+    # Docker Hub
+
+    def dockerhub_page(self, url, params, items, page_size):
+        per_page = min(
+            int(params.get("page_size", page_size or 10)),
+            self.max_page_size)
+        page = int(params.get("page", 1))
+        base = self.base_url(url)
+        next_page = None
+        if page * per_page < len(items):
+            next_page = f"{ base }?{ urlencode(dict(params, page=page + 1)) }"
+        return Response(200, {
+            "count": len(items), "next": next_page,
+            "previous": None,
+            "results": items[(page - 1) * per_page:page * per_page]})
+
+    def dockerhub_repositories(self, match, params, url, page_size, **kwargs):
+        namespace = match.group(1)
+        images = [{
+                "user": namespace, "name": f"image-{ index }",
+                "namespace": namespace, "repository_type": "image",
+                "status": 1, "is_private": False, "star_count": index,
+                "pull_count": 1000 * (index + 1),
+                "last_updated": iso(self.now - datetime.timedelta(days=index))}
+            for index in range(self.images)]
+        return self.dockerhub_page(url, params, images, page_size)
+
+    def dockerhub_tags(self, match, params, url, page_size, **kwargs):
+        tags = [{
+                "name": f"v{ index }.0.0", "full_size": 100000 + index,
+                "last_updated": iso(self.now - datetime.timedelta(days=index)),
+                "tag_last_pushed": iso(
+                    self.now - datetime.timedelta(days=index))}
+            for index in range(self.releases)]
+        return self.dockerhub_page(url, params, tags, page_size)
+
+
+    # Maven Central Statistics and Go module proxy
+
+    def maven_stats(self, match, params, **kwargs):
+        total = 1000 + len(params.get("a", "")) * 10
+        if params.get("t") == "ip":
+            total //= 10
+        return Response(200, {"data": {"total": total}})
+
+    def go_versions(self, match, **kwargs):
+        return Response(200, "\n".join(
+            f"v{ index }.0.0" for index in range(self.releases)),
+            {"Content-Type": "text/plain"})
+
+    def go_latest(self, match, **kwargs):
+        return Response(200, {
+            "Version": f"v{ self.releases - 1 }.0.0",
+            "Time": iso(self.now)})
+
+
+class RecordedApi:
+    """
+    Replays responses recorded by bench.py --record, keyed by
+    "<METHOD> <url without scheme and port>", unknown requests get 404.
+    """
+    def __init__(self, path):
+        with open(path) as f:
+            self.responses = json.load(f)
+
+    @staticmethod
+    def key(method, url):
+        parsed = urlparse(url)
+        query = f"?{ parsed.query }" if parsed.query else ""
+        return f"{ method } { parsed.hostname }{ parsed.path }{ query }"
+
+    def handle(self, method, url, body=None, page_size=None):
+        recorded = self.responses.get(self.key(method, url))
+        if recorded is None:
+            return "unknown", Response(404, {"message": "Not Found"})
+        return recorded["endpoint"], Response(
+            recorded["status"], recorded["body"], recorded["headers"])
+
+    @classmethod
+    def record(cls, responses, method, url, endpoint, response):
+        """add a live requests response to the responses dict"""
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        responses[cls.key(method, url)] = {
+            "endpoint": endpoint, "status": response.status_code,
+            "headers": {
+                key: value for key, value in response.headers.items()
+                if key.lower() in ("link", "content-type")
+                    or key.lower().startswith("x-ratelimit")},
+            "body": body}
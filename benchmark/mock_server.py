@@ -0,0 +1,280 @@
+"""
+Local stand-in of the GitHub and Docker Hub APIs for load testing the
+collectors against orgs much larger than vesoft-inc, with latency, rate
+limits and failures the collectors have to cope with.
+
+    python benchmark/mock_server.py --repos 2000 --latency 50 \\
+        --core-limit 5000 --search-limit 30 --window 60 \\
+        --inject 429:0.01,403:0.01,502:0.02
+
+Point the functions at it with conf:
+
+    {"github_base_url": "http://127.0.0.1:8080",
+     "dockerhub_base_url": "http://127.0.0.1:8080/v2/"}
+
+or run the benchmark through it with bench.py --server.
+"""
+
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fixtures import SyntheticApi, Response
+
+
+# injected 403s are secondary rate limits, as primary ones come from budgets
+INJECTED_MESSAGES = {
+    403: "You have exceeded a secondary rate limit. "
+         "Please wait a few minutes before you try again.",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Server Error",
+    503: "Service Unavailable",
+    504: "We couldn't respond to your request in time.",
+}
+
+
+class RateLimits:
+    """
+    Fixed window budgets per resource like GitHub's, graphql and search
+    have their own, the rest of GitHub shares core.
+    """
+    def __init__(self, limits, window):
+        self.limits = limits
+        self.window = window
+        self.lock = threading.Lock()
+        self.used = collections.Counter()
+        self.reset_at = {}
+
+    @staticmethod
+    def resource(endpoint):
+        if endpoint in ("github:search", "github:graphql"):
+            return endpoint.split(":")[1]
+        if endpoint.startswith("github:"):
+            return "core"
+        return endpoint.split(":")[0]
+
+    def window_of(self, resource, now):
+        if self.reset_at.get(resource, 0) <= now:
+            self.reset_at[resource] = int(now) + self.window
+            self.used[resource] = 0
+        return self.reset_at[resource]
+
+    def take(self, endpoint):
+        """returns (allowed, rate limit headers) of a request"""
+        resource = self.resource(endpoint)
+        limit = self.limits.get(resource)
+        if not limit:
+            return True, {}
+        with self.lock:
+            reset_at = self.window_of(resource, time.time())
+            allowed = self.used[resource] < limit
+            if allowed:
+                self.used[resource] += 1
+            remaining = limit - self.used[resource]
+        return allowed, {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset_at),
+            "X-RateLimit-Resource": resource}
+
+    def status(self):
+        """resources of /rate_limit"""
+        now = time.time()
+        with self.lock:
+            return {
+                resource: {
+                    "limit": limit,
+                    "reset": self.window_of(resource, now),
+                    "remaining": limit - self.used[resource]}
+                for resource, limit in self.limits.items() if limit}
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, api, rate_limits, latency=0, jitter=0,
+            inject=None, retry_after=1, seed=None):
+        super().__init__(address, MockHandler)
+        self.api = api
+        self.rate_limits = rate_limits
+        self.latency = latency
+        self.jitter = jitter
+        self.inject = inject or {}
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.statuses = collections.Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{ host }:{ port }"
+
+    def injected_status(self):
+        with self.lock:
+            draw = self.random.random()
+        for status, rate in self.inject.items():
+            if draw < rate:
+                return status
+            draw -= rate
+        return None
+
+    def respond(self, method, url, body):
+        """(endpoint, Response) of a request after latency and failures"""
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = self.latency + self.jitter * self.random.random()
+            if delay:
+                time.sleep(delay)
+            endpoint = self.api.route(method, url)[0] or "unknown"
+            if endpoint == "github:rate_limit":
+                # /rate_limit doesn't count against the limits
+                resources = self.rate_limits.status()
+                response = Response(200, {
+                    "resources": resources,
+                    "rate": resources.get("core", {})})
+                headers = {}
+            else:
+                allowed, headers = self.rate_limits.take(endpoint)
+                injected = self.injected_status()
+                if not allowed:
+                    response = Response(
+                        403 if endpoint.startswith("github:") else 429,
+                        {"message": "API rate limit exceeded",
+                         "documentation_url": "https://docs.github.com/rest"
+                            "/overview/resources-in-the-rest-api#rate-limiting"})
+                elif injected:
+                    response = Response(injected, {"message":
+                        INJECTED_MESSAGES.get(injected, "Injected failure")})
+                    if injected in (403, 429):
+                        response.headers["Retry-After"] = str(self.retry_after)
+                else:
+                    endpoint, response = self.api.handle(method, url, body)
+            response.headers.setdefault("Content-Type", "application/json")
+            response.headers.update(headers)
+            with self.lock:
+                self.requests[endpoint] += 1
+                self.statuses[response.status] += 1
+            return endpoint, response
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": dict(sorted(self.requests.items())),
+                "statuses": {
+                    str(status): count
+                    for status, count in sorted(self.statuses.items())},
+                "max_in_flight": self.max_in_flight}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def handle_request(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else None
+        url = f"http://{ self.headers.get('Host', self.server.url) }{ self.path }"
+        if self.path == "/_stats":
+            response = Response(200, self.server.stats())
+        else:
+            _, response = self.server.respond(method, url, body)
+        content = response.content()
+        self.send_response(response.status)
+        for key, value in response.headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_inject(value):
+    """"429:0.01,502:0.02" to {429: 0.01, 502: 0.02}"""
+    inject = {}
+    for item in filter(None, (value or "").split(",")):
+        status, rate = item.split(":")
+        inject[int(status)] = float(rate)
+    return inject
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--org", default="vesoft-inc")
+    parser.add_argument("--repos", type=int, default=1000)
+    parser.add_argument("--releases", type=int, default=10)
+    parser.add_argument("--assets", type=int, default=6)
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0,
+        help="milliseconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0,
+        help="random milliseconds added on top of latency")
+    parser.add_argument("--core-limit", type=int, default=5000)
+    parser.add_argument("--search-limit", type=int, default=30)
+    parser.add_argument("--graphql-limit", type=int, default=5000)
+    parser.add_argument("--dockerhub-limit", type=int, default=0,
+        help="requests per window of Docker Hub, 0 is unlimited")
+    parser.add_argument("--window", type=int, default=60,
+        help="seconds of a rate limit window (GitHub core is 3600)")
+    parser.add_argument("--inject", default="",
+        help='failure rates by status, like "403:0.01,429:0.01,502:0.02"')
+    parser.add_argument("--retry-after", type=int, default=1,
+        help="Retry-After seconds of injected 403 and 429")
+    parser.add_argument("--page-size", type=int, default=None,
+        help="items per page when the client doesn't ask for a size")
+    parser.add_argument("--max-page-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    api = SyntheticApi(
+        org=args.org, repos=args.repos, releases=args.releases,
+        assets=args.assets, members=args.members, images=args.images,
+        search_limit=args.search_limit, page_size=args.page_size,
+        max_page_size=args.max_page_size,
+        github_api=f"http://{ args.host }:{ args.port }")
+    rate_limits = RateLimits({
+            "core": args.core_limit, "search": args.search_limit,
+            "graphql": args.graphql_limit, "dockerhub": args.dockerhub_limit},
+        args.window)
+    server = MockServer(
+        (args.host, args.port), api, rate_limits,
+        latency=args.latency / 1000, jitter=args.jitter / 1000,
+        inject=parse_inject(args.inject), retry_after=args.retry_after,
+        seed=args.seed)
+    print(f"Serving { args.repos } repos of { args.org } on { server.url }, "
+          f"stats on { server.url }/_stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats()))
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+-- Daily release series rebuilt from github_release_delta_records, where a
+-- tag only has a row on the days its asset counts changed: each row is
+-- valid from its date to the day before the next row of its tag (or to
+-- yesterday), and is repeated over these days only, so the scan is the
+-- delta rows once. Days before the first delta come from the full
+-- snapshots of github_release_records.
+CREATE OR REPLACE VIEW `nebula-insights.nebula_insights.github_release_daily` AS
+WITH delta_start AS (
+  SELECT MIN(date) AS date
+  FROM `nebula-insights.nebula_insights.github_release_delta_records`
+),
+delta AS (
+  SELECT repo, tag, count, assets, date AS valid_from,
+    COALESCE(
+      DATE_SUB(
+        LEAD(date) OVER (PARTITION BY repo, tag ORDER BY date),
+        INTERVAL 1 DAY),
+      DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)) AS valid_to
+  FROM `nebula-insights.nebula_insights.github_release_delta_records`
+)
+SELECT repo, date, tag, count, assets
+FROM `nebula-insights.nebula_insights.github_release_records`
+WHERE date < (SELECT date FROM delta_start)
+UNION ALL
+SELECT repo, date, tag, count, assets
+FROM delta,
+  UNNEST(GENERATE_DATE_ARRAY(valid_from, valid_to)) AS date
@@ -12,10 +12,11 @@ PER_PAGE = 50
 class DockerHubClient:
     """ Wrapper to communicate with docker hub API """
     def __init__(self, auth_token=None):
-        self.config = {'auth_token': auth_token}
-        self.auth_token = self.config.get('auth_token')
+        self.auth_token = auth_token
 
-    def do_request(self, url, method='GET', data={}):
+    def do_request(self, url, method='GET', data=None):
+        if data is None:
+            data = {}
         valid_methods = ['GET', 'POST']
         if method not in valid_methods:
             raise ValueError('Invalid HTTP request method')
@@ -33,15 +34,14 @@ class DockerHubClient:
             content = json.loads(resp.content.decode())
         return {'content': content, 'code': resp.status_code}
 
-    def login(self, username=None, password=None, save_config=True):
+    def login(self, username=None, password=None):
+        """the token of the login is kept by the instance, see get_token()"""
         data = {'username': username, 'password': password}
         self.auth_token = None
         resp = self.do_request(DOCKER_HUB_API_ENDPOINT + 'users/login/',
                                'POST', data)
         if resp['code'] == 200:
             self.auth_token = resp['content']['token']
-            if save_config:
-                self.config.set('auth_token', self.auth_token)
         return resp['code'] == 200
 
     def get_token(self):
@@ -63,29 +63,62 @@ In a closer look, it should be like this, where Google Cloud Storage is involved
 """
 
 
+import time
+
+# cold start of an instance is measured from here, see Metrics.cold_start()
+IMPORT_STARTED_AT = time.perf_counter()
+
 import base64
+import calendar
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import gzip
+import io
+import itertools
+import email.utils
 import json
-import requests
+import os
+import queue
+import random
+import re
+import threading
 
-from google.cloud import storage, bigquery
+from urllib.parse import urlparse, parse_qs, unquote
 
-from github import Github, RateLimitExceededException, GithubException
-from urllib3 import Retry
+# vendored copy of functions/common/common.py, see "Shared code" in README.md
+from common import (
+    _LazyImport, gcloud_exceptions, github, requests, Metrics, get_client,
+    CONF_CACHE, RetryPolicy)
 
-from urllib.parse import urlparse, parse_qs
+storage = _LazyImport("google.cloud.storage")
+bigquery = _LazyImport("google.cloud.bigquery")
+pubsub_v1 = _LazyImport("google.cloud.pubsub_v1")
+oss2 = _LazyImport("oss2")
+urllib3 = _LazyImport("urllib3")
 
 # docker_hub_client
 DOCKER_HUB_API_ENDPOINT = "https://hub.docker.com/v2/"
 PER_PAGE = 50
 # docker_hub_client
 
+# conf "github_base_url" and "dockerhub_base_url" override these, to point
+# collectors at GitHub Enterprise or a local stand-in server
+GITHUB_API_ENDPOINT = "https://api.github.com"
+
 BUCKET = "nebula-insights"
 GCS_RECORD_NAME = {
     "github_clone": "github_clone_stats.json",
     "github_release": "github_release_stats.json",
+    "github_release_delta": "github_release_delta_stats.json",
     "github_issue_pr": "github_issue_pr_stats.json",
-    "dockerhub_image": "dockerhub_image_stats.json"
+    "dockerhub_image": "dockerhub_image_stats.json",
+    "dockerhub_tag": "dockerhub_tag_stats.json",
+    "aliyunoss_download": "aliyunoss_download_stats.json",
+    "pypi_download": "pypi_download_stats.json",
+    "maven_download": "maven_download_stats.json",
+    "go_module": "go_module_stats.json"
 }
 
 GCP_PROJECT = "nebula-insights"
@@ -93,14 +126,38 @@ BQ_DATASET = "nebula_insights"
 BQ_TABLE_NAME = {
     "github_clone": "github_clone_records",
     "github_release": "github_release_records",
+    "github_release_delta": "github_release_delta_records",
     "github_pr_issue": "github_pr_issue_records",
-    "dockerhub_image": "dockerhub_image_records"
+    "dockerhub_image": "dockerhub_image_records",
+    "dockerhub_tag": "dockerhub_tag_records",
+    "aliyunoss_download": "aliyunoss_download_records",
+    "pypi_download": "pypi_download_records",
+    "maven_download": "maven_download_records",
+    "go_module": "go_module_records"
 }
 GCP_LOCATION = "asia-east2"
 
+# the org and namespace collected unless conf lists "github_orgs" and
+# "dockerhub_namespaces"
 GH_ORG = "vesoft-inc"
 DH_USER = "vesoft"
+# orgs of GitHub, and namespaces of Docker Hub, collected at the same time
+ORG_WORKERS = 4
 DH_RETRY = 5
+# retries of DockerHubClient: exponential backoff with full jitter, from
+# DH_BACKOFF seconds up to DH_BACKOFF_MAX, unless the response tells when
+# to come back, which is not waited for beyond DH_WAIT_MAX
+DH_BACKOFF = 1
+DH_BACKOFF_MAX = 32
+DH_WAIT_MAX = 120
+# retried by DockerHubClient only, its session doesn't retry
+DH_RETRY_STATUS = (429, 500, 502, 503, 504)
+# tags of images, conf "dockerhub_tags": {"host_concurrency": 4} enables them
+DH_TAGS_PER_PAGE = 100
+# most requests in flight to docker hub, see AdaptiveLimit
+DH_HOST_CONCURRENCY = 4
+# last_updated of the images whose tags were archived by the former runs
+DH_TAG_STATE_NAME = "state/dockerhub_images.json"
 DEBUG = False
 
 GH_REPO_EXCLUDE_LIST = [
@@ -111,35 +168,662 @@ GH_REPO_EXCLUDE_LIST = [
     ".github"
 ]
 
+# aliyunoss access log, fields before ObjectName:
+# RemoteIP Reserved Reserved [Time] "RequestURL" HTTPStatus SentBytes
+# RequestTime "Referer" "UserAgent" "HostName" "RequestID" "LoggingFlag"
+# "RequesterAliyunID" "Operation" "BucketName" "ObjectName" ...
+OSS_LOG_PATTERN = re.compile(
+    rb'^\S+ \S+ \S+ \[(\d\d)/(\w{3})/(\d{4}):[^\]]*\] "[^"]*" (\d{3}) \S+ \S+ '
+    rb'"[^"]*" "[^"]*" "[^"]*" "[^"]*" "[^"]*" "[^"]*" '
+    rb'"([^"]*)" "[^"]*" "([^"]*)"')
+OSS_VERSION_PATTERN = re.compile(
+    r'(\d+\.\d+\.\d+(?:-(?:rc|beta|alpha|ga)\.?\d*)?)', re.IGNORECASE)
+OSS_MONTHS = {
+    month.encode(): index + 1 for index, month in enumerate((
+        "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+        "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"))}
+OSS_READ_CHUNK = 1 << 20
+
+# pooled http session shared by docker hub, graphql, maven and go requests
+HTTP_POOL_SIZE = 16
+HTTP_WORKERS = 8
+HTTP_TIMEOUT = 60
+MAVEN_STATS_ENDPOINT = "https://oss.sonatype.org"
+GO_PROXY = "https://proxy.golang.org"
+
+# endpoint names of requests sent with the pooled session, first match wins
+METRICS_ENDPOINTS = [
+    (re.compile(r"/v2/repositories/[^/]+/[^/]+/tags"), "dockerhub:tags"),
+    (re.compile(r"/v2/repositories/"), "dockerhub:repositories"),
+    (re.compile(r"/graphql"), "github:graphql"),
+    (re.compile(r"/service/local/stats/"), "maven:stats"),
+    (re.compile(r"/@v/list$"), "go:list"),
+    (re.compile(r"/@latest$"), "go:latest"),
+]
+METRICS_RECORD_NAME = "_metrics.json"
+
+# sharded runs, conf "sharding": {"enabled": true, ...} overrides these
+SHARD_REPOS = 50
+SHARD_TOPIC = "nebula-insights-shard-topic"
+# partial records of the shards: records/<date>/_shards/<shard id>/
+SHARD_FOLDER = "_shards"
+
+# conf "release_snapshots": "delta" archives only the release tags whose
+# asset counts changed since the state of the former runs
+RELEASE_STATE_NAME = "state/github_releases.json"
+
+# conf "change_detection" collects issues/PRs of a repo only when its
+# listing changed since the former runs, see RepoState, releases are not
+# covered and always collected
+REPO_STATE_NAME = "state/github_repos.json"
+# state of the repos of a shard, applied to REPO_STATE_NAME once merged
+REPO_STATE_SHARD_NAME = "github_repo_state.json"
+# days after which a repo is collected again even if its listing didn't change
+REPO_REFRESH_DAYS = 7
+
+# monthly records of compact(), like archive/2021-04/github_clone_stats.json.gz
+ARCHIVE_FOLDER = "archive"
+
+# deadline of a run, conf "deadline": {"timeout": 540, ...} overrides these,
+# the python 3.7 runtime tells the timeout of the function in its env
+FUNCTION_TIMEOUT = int(os.environ.get("FUNCTION_TIMEOUT_SEC", 540))
+# seconds kept for archive_data() and load_data() of what was collected
+DEADLINE_RESERVE = 60
+# once this share of the budget is left, work of negative priority is skipped
+DEADLINE_TIGHT = 0.25
+
+# stages of the pipeline of DataFetcher.collect() are at most this many
+# items ahead of the next one
+PIPELINE_QUEUE_SIZE = 64
+# bytes of an archive file buffered before being uploaded, uploads of a
+# resumable session are multiples of 256 KiB
+RECORD_CHUNK_SIZE = 1 << 20
+
+
+def new_http_session(pool_size=HTTP_POOL_SIZE, retries=3):
+    """
+    requests session keeping pool_size connections per host alive, retrying
+    500, 502 and 504 `retries` times, no retries for the clients retrying
+    on their own
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size,
+        max_retries=urllib3.Retry(
+            total=retries, status_forcelist=(500, 502, 504),
+            backoff_factor=0.3) if retries else 0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class AdaptiveLimit:
+    """
+    AIMD limit of the requests in flight to a host: one more once a whole
+    limit of requests succeeded in a row, halved when the host throttles.
+    """
+    def __init__(self, maximum, minimum=1):
+        self.condition = threading.Condition()
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = max(minimum, maximum // 2)
+        self.in_flight = 0
+        self.successes = 0
+
+    def set_maximum(self, maximum):
+        with self.condition:
+            self.maximum = maximum
+            self.limit = max(self.minimum, min(self.limit, maximum))
+
+    @contextlib.contextmanager
+    def slot(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maximum:
+                self.successes = 0
+                self.limit += 1
+                self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            self.successes = 0
+            self.limit = max(self.minimum, self.limit // 2)
+
+
+class RateBudget:
+    """
+    Calls left in the rate limit of a GitHub token, split fairly between the
+    orgs it's given to: each org may use an equal share of what the orgs
+    done didn't use, so a large org can't starve the others, and what an
+    org leaves goes to the others once it's done. A budget of unknown calls
+    left (a token of one org) is not split.
+    """
+    def __init__(self, remaining, holders):
+        self.lock = threading.Lock()
+        self.remaining = remaining
+        self.active = set(holders)
+        self.used = collections.Counter()
+
+    def room(self, holder):
+        """calls the holder may still make"""
+        if self.remaining is None:
+            return float("inf")
+        with self.lock:
+            done = sum(used for other, used in self.used.items()
+                if other not in self.active)
+            share = (self.remaining - done) / max(len(self.active), 1)
+            return share - self.used[holder]
+
+    def take(self, holder, calls=1):
+        with self.lock:
+            self.used[holder] += calls
+
+    def release(self, holder):
+        with self.lock:
+            self.active.discard(holder)
+
+
+def partition(table_id, date):
+    """
+    partition of a date of a table, partitioned by day of ingestion:
+    project.dataset.table$20210421
+    """
+    return f"{ table_id }${ date.replace('-', '') }"
+
+
+class PubSubQueue:
+    """tasks of a sharded run, published to the topic triggering workers"""
+    def __init__(self, topic):
+        self.publisher = get_client("pubsub", pubsub_v1.PublisherClient)
+        self.topic_path = self.publisher.topic_path(GCP_PROJECT, topic)
+        self.futures = []
+
+    def publish(self, message):
+        self.futures.append(self.publisher.publish(
+            self.topic_path, json.dumps(message).encode("utf-8")))
+
+    def flush(self):
+        for future in self.futures:
+            future.result()
+        self.futures = []
+
+
+class LocalQueue:
+    """
+    Stand-in of PubSubQueue for tests and local runs, tasks are run one by
+    one in this process when flushed.
+    """
+    def __init__(self):
+        self.messages = collections.deque()
+
+    def publish(self, message):
+        self.messages.append(message)
+
+    def flush(self):
+        while self.messages:
+            message = self.messages.popleft()
+            data_fetch({"data": base64.b64encode(
+                json.dumps(message).encode("utf-8"))}, None)
+
+
+class Deadline:
+    """
+    Time budget of a run before the function is killed, less the reserve
+    kept to flush what was collected. Work is ordered by the priorities of
+    conf, higher first (repos get the one of "github" unless they have their
+    own as "org/repo"), and skipped once it doesn't fit in what is left.
+    """
+    def __init__(self, timeout=FUNCTION_TIMEOUT, reserve=DEADLINE_RESERVE,
+            tight=DEADLINE_TIGHT, priorities=None, started_at=None):
+        self.started_at = started_at or time.perf_counter()
+        self.budget = timeout - reserve
+        self.tight = tight
+        self.priorities = priorities or {}
+
+    @classmethod
+    def from_conf(cls, conf, started_at=None):
+        deadline_conf = conf.get("deadline", {})
+        return cls(
+            timeout=deadline_conf.get("timeout", FUNCTION_TIMEOUT),
+            reserve=deadline_conf.get("reserve", DEADLINE_RESERVE),
+            tight=deadline_conf.get("tight", DEADLINE_TIGHT),
+            priorities=deadline_conf.get("priorities"),
+            started_at=started_at)
+
+    def remaining(self):
+        return self.budget - (time.perf_counter() - self.started_at)
+
+    def priority(self, *names, default=0):
+        """priority of the first of names found in conf"""
+        for name in names:
+            if name in self.priorities:
+                return self.priorities[name]
+        return default
+
+    def order(self, items, key, default=0):
+        """items by priority, stable for items of the same priority"""
+        return sorted(
+            items, key=lambda item: -self.priority(*key(item), default=default))
+
+    def allows(self, priority=0, estimate=0):
+        """
+        False when the work would eat into the reserve, or when the budget
+        is tight and the work is of negative priority
+        """
+        remaining = self.remaining()
+        if remaining <= estimate:
+            return False
+        return priority >= 0 or remaining > self.budget * self.tight
+
+
+def iter_ahead(iterable, maxsize=PIPELINE_QUEUE_SIZE):
+    """
+    Items of iterable produced on a thread of their own, at most maxsize
+    ahead of the consumer, errors of the producer are raised to it.
+    """
+    items = queue.Queue(maxsize)
+    end = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+        except Exception as e:
+            items.put((end, e))
+        else:
+            items.put((end, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is end:
+            return
+        yield item
+
+
+class RecordWriter:
+    """
+    Serialize and upload stages of the pipeline: records put by the
+    collectors are serialized on a thread of its own and written to the
+    archive files of a folder as resumable uploads, so only the queue and
+    a chunk per file are held in memory, and uploads overlap the fetches.
+    Files are as archive_data() writes them.
+    """
+    def __init__(self, bucket, folder, maxsize=PIPELINE_QUEUE_SIZE,
+            chunk_size=RECORD_CHUNK_SIZE):
+        self.bucket = bucket
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.records = queue.Queue(maxsize)
+        self.files = {}
+        self.counts = collections.Counter()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, record_key, record):
+        """record as a dict, or as a line of JSON already serialized"""
+        if self.error is not None:
+            raise self.error
+        self.records.put((record_key, record))
+
+    def write(self, record_key, record):
+        file = self.files.get(record_key)
+        if file is None:
+            file = self.files[record_key] = self.bucket.blob(
+                f"{ self.folder }/{ GCS_RECORD_NAME[record_key] }").open(
+                    "w", chunk_size=self.chunk_size, ignore_flush=True,
+                    content_type="application/json")
+        else:
+            file.write("\n")
+        file.write(record if isinstance(record, str) else json.dumps(record))
+        self.counts[record_key] += 1
+
+    def run(self):
+        while True:
+            item = self.records.get()
+            if item is None:
+                return
+            # once failed records are only drained, for put() not to block
+            if self.error is None:
+                try:
+                    self.write(*item)
+                except Exception as e:
+                    self.error = e
+
+    def close(self):
+        """
+        Wait for the records put so far and finish the uploads, returns the
+        record count per record key.
+        """
+        self.records.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        for file in self.files.values():
+            file.close()
+        return dict(self.counts)
+
+
+class ReleaseDelta:
+    """
+    Release records whose asset counts differ from the state kept by the
+    former runs, the state is {repo: {tag: {asset: count}}}. Tags not
+    fetched this run (skipped for the deadline, or deleted) keep their
+    former counts.
+    """
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.lock = threading.Lock()
+        self.state = None
+        self.changed = 0
+        self.total = 0
+
+    def changes(self, record):
+        """True if the record changed, the state is updated with it then"""
+        with self.lock:
+            return self.update(record)
+
+    def update(self, record):
+        if self.state is None:
+            try:
+                self.state = json.loads(
+                    self.bucket.blob(RELEASE_STATE_NAME).download_as_bytes())
+            except gcloud_exceptions.NotFound:
+                self.state = {}  # the first delta is a full snapshot
+        self.total += 1
+        counts = {asset["name"]: asset["count"] for asset in record["assets"]}
+        if self.state.get(record["repo"], {}).get(record["tag"]) == counts:
+            return False
+        self.state.setdefault(record["repo"], {})[record["tag"]] = counts
+        self.changed += 1
+        return True
+
+    def save(self):
+        """save the state, once the delta records are archived"""
+        print(f"[INFO] { datetime.datetime.now() } "
+              f"{ self.changed } of { self.total } release tags changed")
+        if self.changed:
+            self.bucket.blob(RELEASE_STATE_NAME).upload_from_string(
+                data=json.dumps(self.state, separators=(",", ":")),
+                content_type='application/json')
+
+class RepoState:
+    """
+    What the org repo listing told of each repo ({"pushed_at", "updated_at",
+    "open_issues_count"}) when its issues/PRs were collected, with what was
+    collected then. A repo whose listing is the same and that was collected
+    less than refresh_days ago has its stats carried forward instead of
+    being collected again. Downloads of the release assets don't change the
+    listing, releases are always collected.
+    """
+    def __init__(self, bucket, refresh_days=REPO_REFRESH_DAYS):
+        self.bucket = bucket
+        self.refresh_days = refresh_days
+        self.lock = threading.Lock()
+        self.repos = None
+        self.updates = {}
+        self.carried = 0
+
+    @staticmethod
+    def seen(repo):
+        """fields of a repo of the org listing, no call is made for them"""
+        return {
+            "pushed_at": str(repo.pushed_at),
+            "updated_at": str(repo.updated_at),
+            "open_issues_count": repo.open_issues_count}
+
+    def load(self):
+        if self.repos is None:
+            try:
+                self.repos = json.loads(
+                    self.bucket.blob(REPO_STATE_NAME).download_as_bytes())
+            except gcloud_exceptions.NotFound:
+                self.repos = {}  # all repos are collected the first run
+        return self.repos
+
+    def carried_forward(self, repo_key, seen, today):
+        """the former stats of the repo if it didn't change, else None"""
+        with self.lock:
+            state = self.load().get(repo_key)
+            if state is None or state["seen"] != seen:
+                return None
+            collected_on = datetime.date.fromisoformat(state["collected_on"])
+            if (today - collected_on).days >= self.refresh_days:
+                return None
+            self.carried += 1
+            return state
+
+    def update(self, repo_key, seen, today, issues_and_pr):
+        with self.lock:
+            self.updates[repo_key] = {
+                "seen": seen, "collected_on": str(today),
+                "issues_and_pr": issues_and_pr}
+
+    def save(self, name=REPO_STATE_NAME):
+        """
+        the state with the repos collected this run, or only these repos to
+        the name of a shard
+        """
+        if not self.updates:
+            return
+        if name == REPO_STATE_NAME:
+            repos = dict(self.load(), **self.updates)
+        else:
+            repos = self.updates
+        self.bucket.blob(name).upload_from_string(
+            data=json.dumps(repos, separators=(",", ":")),
+            content_type='application/json')
+
+
+def iter_lines(stream, chunk_size=OSS_READ_CHUNK):
+    """read lines from a file-like object in fixed size chunks"""
+    rest = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+
+def open_oss_log(source, oss_conf):
+    """
+    Open an access log from local log_dir or from the aliyunoss log bucket
+    as a stream, gzip files are decompressed on the fly.
+    """
+    if oss_conf.get("log_dir"):
+        raw = open(source, "rb")
+    else:
+        bucket = oss2.Bucket(
+            oss2.Auth(
+                oss_conf["access_key_id"], oss_conf["access_key_secret"]),
+            oss_conf["endpoint"], oss_conf["bucket"])
+        raw = bucket.get_object(source)
+    if source.endswith(".gz"):
+        return raw, gzip.GzipFile(fileobj=raw)
+    return raw, raw
+
+
+def count_oss_downloads(source, oss_conf):
+    """
+    Count successful GetObject requests per (object, day) in one access log,
+    it runs in worker processes so it's kept at module level. Range requests
+    (206) are left out: a download resumed or fetched in parts sends one per
+    part, only the 200 of a whole object is counted as a download.
+    """
+    counts = collections.Counter()
+    object_prefix = oss_conf.get("object_prefix", "").encode()
+    raw, stream = open_oss_log(source, oss_conf)
+    try:
+        for line in iter_lines(stream):
+            match = OSS_LOG_PATTERN.match(line)
+            if match is None:
+                continue
+            day, month, year, status, operation, object_name = match.groups()
+            if status != b"200" or operation != b"GetObject" \
+                    or not object_name.startswith(object_prefix):
+                continue
+            counts[(object_name, year, month, day)] += 1
+    finally:
+        raw.close()
+    downloads = collections.Counter()
+    for (object_name, year, month, day), count in counts.items():
+        date = f"{ int(year) }-{ OSS_MONTHS[month]:02d}-{ int(day):02d}"
+        downloads[(unquote(object_name.decode()), date)] += count
+    return downloads
+
+
+def count_pypi_downloads(stream, packages):
+    """
+    Count downloads per (package, version, python, date) from a linehaul
+    style NDJSON export, like rows of bigquery-public-data.pypi.file_downloads:
+        {"timestamp": "2021-04-20 08:00:00 UTC", "project": "nebula2-python",
+         "file": {"version": "2.0.0", ...}, "details": {"python": "3.8.5", ...}}
+    Returns the counts and the number of rows truncated or malformed, which
+    are skipped.
+    """
+    downloads = collections.Counter()
+    bad_rows = 0
+    for line in iter_lines(stream):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError(f"not an object: { line[:80] }")
+            if row.get("project") not in packages:
+                continue
+            python = (row.get("details") or {}).get("python") or ""
+            downloads[(
+                row["project"],
+                (row.get("file") or {}).get("version") or "",
+                ".".join(python.split(".")[:2]),
+                row.get("timestamp", "")[:10])] += 1
+        except (ValueError, AttributeError, TypeError):
+            bad_rows += 1
+    return downloads, bad_rows
+
 
 class DataFetcher:
     """
     Fetch Data from different sources and sink into datawarehouse.
     """
     def __init__(self):
-        self.conf = dict()
+        self._conf = None
         self.github_stats = dict()
         self.dockerhub_stats = dict()
+        self.dockerhub_images = dict()
+        self.dockerhub_tag_stats = dict()
         self.aliyunoss_stats = dict()
         self.maven_stats = dict()
         self.pypi_stats = dict()
         self.go_stats = dict()
-        self.s_client = storage.Client()
-        self.bucket = self.s_client.get_bucket(BUCKET)
-        self.parse_conf()
+        # set for the shard workers of a sharded run
+        self.run_date = None
+        self.org_names = None
+        self.repo_names = None
+        # set by data_fetch(), runs without one are not time bound
+        self.deadline = None
+        self.github_retry = RetryPolicy()
+        # set by collect(), GitHub records are then streamed to the archive
+        self.writer = None
+        self.release_delta = None
+        # set by get_data_from_github() with conf "change_detection"
+        self.repo_state = None
+        # state of the thread of each org collected, see github_call()
+        self.context = threading.local()
+        self.metrics = Metrics(METRICS_ENDPOINTS)
+        self.lock = threading.Lock()
+        # clients and conf are created on first use, not to block cold start,
+        # and reused by the next invocations of a warm instance
+        self._http = None
+        self._dh_http = None
+        self._bucket = None
+
+    @property
+    def http(self):
+        """pooled session of the instance, reporting to this run's metrics"""
+        with self.lock:
+            if self._http is None:
+                self._http = get_client("http", new_http_session)
+                self._http.hooks["response"] = [self.metrics.on_response]
+            return self._http
+
+    @property
+    def dh_http(self):
+        """
+        pooled session of DockerHubClient, without the retries of http() not
+        to retry under its own retries
+        """
+        with self.lock:
+            if self._dh_http is None:
+                self._dh_http = get_client(
+                    "http:dockerhub", lambda: new_http_session(retries=0))
+                self._dh_http.hooks["response"] = [self.metrics.on_response]
+            return self._dh_http
+
+    @property
+    def s_client(self):
+        return get_client("storage", storage.Client)
+
+    @property
+    def bucket(self):
+        """bucket() doesn't call the API to check the bucket as get_bucket()"""
+        if self._bucket is None:
+            self._bucket = self.s_client.bucket(BUCKET)
+        return self._bucket
+
+    @property
+    def conf(self):
+        if self._conf is None:
+            self._conf = dict()
+            self.parse_conf()
+        return self._conf
 
     def parse_conf(self):
         """conf for data fetching policies config or fetching API credentials
         ideally it's a file stored in Google Cloud Storage
         """
-        blob = self.bucket.blob('conf/config.json')
-        data = json.loads(blob.download_as_string(client=None))
-        self.conf.update(data)
+        self.conf.update(CONF_CACHE.get(self.bucket, self.metrics))
 
     def get_sink_credential(self):
         """credential if needed for sinking to big query"""
         pass
 
+    def record_github_call(self, g, endpoint, status=200, e=None):
+        """PyGithub calls are counted where they are made"""
+        if e is not None:
+            status = getattr(e, "status", type(e).__name__)
+            rate_remaining = (getattr(e, "headers", None) or {}).get(
+                "x-ratelimit-remaining")
+        else:
+            rate_remaining = g.rate_limiting[0]
+        self.metrics.record_request(
+            f"github:{ endpoint }", status=status,
+            rate_remaining=rate_remaining)
+
+    def github_sleep(self, endpoint, sleep_time):
+        self.metrics.record_sleep(f"github:{ endpoint }", sleep_time)
+        time.sleep(sleep_time)
+
     def get_github_sleep_time(self, g):
         core_rate_limit = g.get_rate_limit().core
         reset_timestamp = calendar.timegm(core_rate_limit.reset.timetuple())
@@ -147,40 +831,92 @@ class DataFetcher:
             time.gmtime()) + 5  # add 5 sec to ensure the rate limit has been reset
         return sleep_time
 
-    def get_github_clone_stats(self, g, org, repo):
-        repo_key = f"{ org.login }/{ repo.name }"
-        type_key = "clones"
-        while True:
-            try:
-                if DEBUG:
-                    print(f"[DEBUG] { datetime.datetime.now() } "
-                          f"get_clones_traffic { repo_key }")
-                # We collect yesterday only
-                clones_traffic = repo.get_clones_traffic().get("clones", [])
-                clones_stats = {str(item.timestamp.date()): {
-                        "count": item.count, "uniques": item.uniques}
-                    for item in clones_traffic
-                    if item.timestamp.date() == self.get_yesterday()}
-                if clones_stats:
-                    self.github_stats[repo_key][type_key].update(clones_stats)
+    def github_call(self, g, endpoint, subject, call, record=True):
+        """
+        Result of call() under the retry policy of the run, None when given
+        up, the subject (a repo, or a release of it) is then recorded as
+        skipped. Calls made with the pooled session are counted by its hook,
+        not here.
+        """
+        policy = self.github_retry
+        breaker = policy.breaker(endpoint)
+        reason = None
+        for attempt in range(policy.attempts):
+            if not breaker.allow():
+                reason = "circuit open"
                 break
-            except RateLimitExceededException:
-                sleep_time = self.get_github_sleep_time(g)
-                print(f"[ERROR] { datetime.datetime.now() } "
-                      f"RateLimitExceeded, sleep { sleep_time }")
-                time.sleep(sleep_time)
-                continue
-            except GithubException as e:
-                if e.status == 403 \
-                    and e.data["message"].startswith(
-                        "Must have push access"):
-                    print(f"[WARN] { datetime.datetime.now() } "
-                          f"No Push Access skipping { repo_key }")
-                    return
+            # calls are taken from the rate limit share of the org collected
+            budget = getattr(self.context, "budget", None)
+            if budget is not None:
+                budget[0].take(budget[1])
+            try:
+                result = call()
+            except (github.GithubException, requests.RequestException) as e:
+                if record:
+                    self.record_github_call(g, endpoint, e=e)
+                kind = policy.classify(e)
+                status = getattr(e, "status", type(e).__name__)
+                if kind == policy.FATAL:
+                    if status == 403 and policy.message(e).startswith(
+                            "Must have push access"):
+                        print(f"[WARN] { datetime.datetime.now() } "
+                              f"No Push Access skipping { subject }")
+                    else:
+                        print(f"[ERROR] { datetime.datetime.now() } "
+                              f"GithubException on { subject }: { e }")
+                    reason = str(status)
+                    break
+                if kind == policy.RATE_LIMIT:
+                    retry_after = (getattr(e, "headers", None) or {}).get(
+                        "retry-after")
+                    try:
+                        sleep_time = int(retry_after) if retry_after \
+                            else max(self.get_github_sleep_time(g), 1)
+                    except (github.GithubException,
+                            requests.RequestException):
+                        sleep_time = policy.delay(attempt)
+                    print(f"[ERROR] { datetime.datetime.now() } "
+                          f"RateLimitExceeded, sleep { sleep_time }")
                 else:
+                    breaker.on_failure()
+                    sleep_time = policy.delay(attempt)
                     print(f"[ERROR] { datetime.datetime.now() } "
-                          f"GithubException on { repo_key }: { e }")
-                continue
+                          f"{ e } on { subject }, retry in { sleep_time:.1f}s")
+                reason = f"{ status } after { attempt + 1 } attempts"
+                if attempt == policy.attempts - 1:
+                    break
+                if self.deadline and sleep_time >= self.deadline.remaining():
+                    reason = "deadline"
+                    break
+                self.github_sleep(endpoint, sleep_time)
+            else:
+                breaker.on_success()
+                if record:
+                    self.record_github_call(g, endpoint)
+                return result
+        print(f"[WARN] { datetime.datetime.now() } "
+              f"Skipping github:{ endpoint } of { subject }: { reason }")
+        self.metrics.record_skip(subject, f"github:{ endpoint } { reason }")
+        return None
+
+    def get_github_clone_stats(self, g, org, repo):
+        repo_key = f"{ org.login }/{ repo.name }"
+        type_key = "clones"
+        if DEBUG:
+            print(f"[DEBUG] { datetime.datetime.now() } "
+                  f"get_clones_traffic { repo_key }")
+        clones_traffic = self.github_call(
+            g, "traffic/clones", repo_key,
+            lambda: repo.get_clones_traffic().get("clones", []))
+        if clones_traffic is None:
+            return
+        # We collect yesterday only
+        clones_stats = {str(item.timestamp.date()): {
+                "count": item.count, "uniques": item.uniques}
+            for item in clones_traffic
+            if item.timestamp.date() == self.get_yesterday()}
+        if clones_stats:
+            self.github_stats[repo_key][type_key].update(clones_stats)
 
     def get_github_release_stats(self, g, org, repo):
         repo_key = f"{ org.login }/{ repo.name }"
@@ -188,32 +924,43 @@ class DataFetcher:
         if DEBUG:
             print(f"[DEBUG] { datetime.datetime.now() } "
                   f"get_releases { repo_key }")
-        for release in repo.get_releases():
+        releases = self.github_call(
+            g, "releases", repo_key, lambda: list(repo.get_releases()))
+        complete = releases is not None
+        for release in releases or []:
             tag_name = release.tag_name
-            while True:
-                try:
-                    assets_stats = {tag_name: {}}
-                    for asset in release.get_assets():
-                        if asset.name.endswith(".txt"):
-                            continue  # skip checksum files
-                        if DEBUG:
-                            print(f"[DEBUG] { datetime.datetime.now() } "
-                                  f"get_assets { asset.name }")
-                        assets_stats[tag_name][asset.name] = asset.download_count
-                        self.github_stats[repo_key][type_key].update(assets_stats)
-                    break
-                except RateLimitExceededException:
-                    sleep_time = self.get_github_sleep_time(g)
-                    print(f"[ERROR] { datetime.datetime.now() } "
-                          f"RateLimitExceeded, sleep { sleep_time }")
-                    time.sleep(sleep_time)
-                    continue
+            assets = self.github_call(
+                g, "releases/assets", f"{ repo_key }@{ tag_name }",
+                lambda: list(release.get_assets()))
+            complete = complete and assets is not None
+            assets_stats = {tag_name: {}}
+            for asset in assets or []:
+                if asset.name.endswith(".txt"):
+                    continue  # skip checksum files
+                if DEBUG:
+                    print(f"[DEBUG] { datetime.datetime.now() } "
+                          f"get_assets { asset.name }")
+                assets_stats[tag_name][asset.name] = asset.download_count
+            if assets_stats[tag_name]:
+                self.github_stats[repo_key][type_key].update(assets_stats)
+        return complete
+
+    def get_github_base_url(self):
+        return self.conf.get("github_base_url", GITHUB_API_ENDPOINT).rstrip("/")
+
+    def get_github_graphql_url(self):
+        """GitHub Enterprise serves REST on /api/v3 and GraphQL on /api/graphql"""
+        base_url = self.get_github_base_url()
+        if base_url.endswith("/api/v3"):
+            return f"{ base_url[:-len('/v3')] }/graphql"
+        return f"{ base_url }/graphql"
 
     def run_github_v4_query(self, token, query):
-        return requests.post(
-            "https://api.github.com/graphql",
+        return self.http.post(
+            self.get_github_graphql_url(),
             json={"query": query},
-            headers={"Authorization": f"token {token}"})
+            headers={"Authorization": f"token {token}"},
+            timeout=HTTP_TIMEOUT)
 
     def get_github_issue_pr_stats(self, g, org, repo, token):
         repo_key = f"{ org.login }/{ repo.name }"
@@ -253,103 +1000,319 @@ class DataFetcher:
             "merged_pr_count": 0
         }}
 
-        while True:
-            try:
-                if DEBUG:
-                    print(f"[DEBUG] { datetime.datetime.now() } "
-                          f"get_github_issue_stats { repo_key }")
-                # We collect yesterday only
-                open_issue_count = repo.open_issues_count
-                response = self.run_github_v4_query(token, query_issue_and_pr)
-                if response.status_code == 200:
-                    data = response.json().get('data', {}).get('repository', {})
-                    issue_stats[date_key].update(data)
-                    self.github_stats[repo_key][type_key].update(issue_stats)
-                    return
-                if response.status_code == 403:
-                    raise RateLimitExceededException
-                else:
-                    print(f"[ERROR] { datetime.datetime.now() } "
-                          f"issue_pr_stats Exception on { repo_key}:{ response }")
-                    break
-            except RateLimitExceededException:
-                sleep_time = self.get_github_sleep_time(g)
-                print(f"[ERROR] { datetime.datetime.now() } "
-                      f"RateLimitExceeded, sleep { sleep_time }")
-                time.sleep(sleep_time)
-                continue
+        def query():
+            response = self.run_github_v4_query(token, query_issue_and_pr)
+            if response.status_code in (403, 429):
+                raise github.RateLimitExceededException(
+                    response.status_code, response.text, response.headers)
+            if response.status_code != 200:
+                raise github.GithubException(
+                    response.status_code, response.text, response.headers)
+            data = (response.json().get('data') or {}).get('repository')
+            if not data:
+                raise github.GithubException(
+                    response.status_code, response.json(), response.headers)
+            return data
 
-    def get_data_from_github(self):
-        token = self.conf.get("github_token")
-        g = Github(login_or_token=token, timeout=60, retry=Retry(
+        if DEBUG:
+            print(f"[DEBUG] { datetime.datetime.now() } "
+                  f"get_github_issue_stats { repo_key }")
+        data = self.github_call(g, "graphql", repo_key, query, record=False)
+        if data is None:
+            return False
+        issue_stats[date_key].update(data)
+        self.github_stats[repo_key][type_key].update(issue_stats)
+        return True
+
+    def get_github_activity_stats(self, g, org, repo, token, seen=None):
+        """
+        Releases and issues/PRs of a repo, issues/PRs carried forward from
+        the former runs when change detection tells the repo didn't change.
+        Asset download counts move without the repo changing, releases are
+        always collected.
+        """
+        self.get_github_release_stats(g, org, repo)
+        if seen is None:
+            self.get_github_issue_pr_stats(g, org, repo, token)
+            return
+        repo_key = f"{ org.login }/{ repo.name }"
+        date_key = str(self.get_yesterday())
+        stats = self.github_stats[repo_key]
+        state = self.repo_state.carried_forward(
+            repo_key, seen, self.get_today())
+        if state is not None:
+            if state["issues_and_pr"]:
+                stats["issues_and_pr"][date_key] = state["issues_and_pr"]
+            return
+        # a repo is only known unchanged from what was fully collected
+        if self.get_github_issue_pr_stats(g, org, repo, token):
+            self.repo_state.update(
+                repo_key, seen, self.get_today(),
+                stats["issues_and_pr"].get(date_key))
+
+    def get_github_client(self, token=None):
+        token = token or self.conf.get("github_token")
+        base_url = self.get_github_base_url()
+        # 100 per page, shard workers all list the repos of the org
+        return get_client(("github", token, base_url), lambda: github.Github(
+            login_or_token=token, base_url=base_url,
+            timeout=60, per_page=100, retry=urllib3.Retry(
                 total=10, status_forcelist=(500, 502, 504),
-                backoff_factor=0.3))
-        org_str = self.conf.get("github_orgnization", GH_ORG)
-        org = g.get_organization(org_str)
-        repos = org.get_repos()
-        for repo in repos:
-            repo_key = f"{ org.login }/{ repo.name }"
-            if repo.name not in GH_REPO_EXCLUDE_LIST:
+                backoff_factor=0.3)))
+
+    def get_github_orgs(self):
+        """
+        Orgs to collect by priority, conf "github_orgs" lists them with their
+        own exclude list, token (or tokens) and priority:
+            [{"name": "vesoft-inc", "tokens": ["..."], "priority": 1,
+              "exclude": ["nebula-docs"]}, "nebula-contrib"]
+        else it's the one of "github_orgnization" with "github_token".
+        """
+        orgs = []
+        for org_conf in self.conf.get("github_orgs") or [{
+                "name": self.conf.get("github_orgnization", GH_ORG),
+                "exclude": GH_REPO_EXCLUDE_LIST}]:
+            if isinstance(org_conf, str):
+                org_conf = {"name": org_conf}
+            name = org_conf["name"]
+            if self.org_names is not None and name not in self.org_names:
+                continue  # not in the shard of this worker
+            default_priority = self.deadline.priority(name, "github") \
+                if self.deadline else 0
+            orgs.append({
+                "name": name,
+                "tokens": org_conf.get("tokens") or [
+                    org_conf.get("token", self.conf.get("github_token"))],
+                # GH_REPO_EXCLUDE_LIST are repos of vesoft-inc
+                "exclude": set(org_conf.get("exclude",
+                    GH_REPO_EXCLUDE_LIST if name == GH_ORG else [])),
+                "priority": org_conf.get("priority", default_priority)})
+        return sorted(orgs, key=lambda org: -org["priority"])
+
+    def get_github_budgets(self, orgs):
+        """RateBudget of each token, split between the orgs given it"""
+        holders = collections.defaultdict(list)
+        for org in orgs:
+            for token in org["tokens"]:
+                holders[token].append(org["name"])
+        budgets = {}
+        for token, names in holders.items():
+            remaining = None
+            if len(names) > 1:
+                g = self.get_github_client(token)
+                try:
+                    remaining = g.get_rate_limit().core.remaining
+                except (github.GithubException,
+                        requests.RequestException) as e:
+                    print(f"[WARN] { datetime.datetime.now() } "
+                          f"Rate limit of the token of { names } unknown, "
+                          f"not split: { e }")
+            budgets[token] = RateBudget(remaining, names)
+        return budgets
+
+    def get_data_from_github(self):
+        """
+        Repos of the orgs, ORG_WORKERS orgs are collected at the same time,
+        higher priority first, each within its share of the rate limits.
+        """
+        detection = self.conf.get("change_detection")
+        if detection and self.repo_state is None:
+            self.repo_state = RepoState(self.bucket, refresh_days=(
+                detection if isinstance(detection, dict) else {}).get(
+                    "refresh_days", REPO_REFRESH_DAYS))
+        orgs = self.get_github_orgs()
+        budgets = self.get_github_budgets(orgs)
+        with concurrent.futures.ThreadPoolExecutor(
+                min(ORG_WORKERS, len(orgs)) or 1) as executor:
+            futures = [
+                executor.submit(self.get_data_from_github_org, org, budgets)
+                for org in orgs]
+            for future in futures:
+                future.result()
+
+    def get_data_from_github_org(self, org_conf, budgets):
+        name = org_conf["name"]
+        tokens = org_conf["tokens"]
+        g = self.get_github_client(tokens[0])
+        try:
+            org = g.get_organization(name)
+        except (github.GithubException, requests.RequestException) as e:
+            self.record_github_call(g, "orgs", e=e)
+            print(f"[ERROR] { datetime.datetime.now() } "
+                  f"Failed getting org { name }: { e }")
+            self.metrics.record_skip(
+                name, f"github:orgs { getattr(e, 'status', type(e).__name__) }",
+                org_conf["priority"])
+            return
+        self.record_github_call(g, "orgs")
+        collected = 0
+        slowest = 0
+        # a repo is expected to take as many calls as the most so far
+        calls = 0
+        try:
+            for repo in iter_ahead(self.list_github_repos(g, org, org_conf)):
+                repo_key = f"{ org.login }/{ repo.name }"
+                priority = org_conf["priority"]
+                if self.deadline:
+                    # a repo is expected to take as long as the slowest so far
+                    priority = self.deadline.priority(
+                        repo_key, default=priority)
+                    if not self.deadline.allows(priority, estimate=slowest):
+                        print(f"[WARN] { datetime.datetime.now() } "
+                              f"Skipping { repo_key } of priority { priority }, "
+                              f"{ self.deadline.remaining():.1f}s left")
+                        self.metrics.record_skip(repo_key, "deadline", priority)
+                        continue
+                # the token of the org with the most calls left, or used least
+                token = max(tokens, key=lambda token: (
+                    budgets[token].room(name), -budgets[token].used[name]))
+                if budgets[token].room(name) < calls:
+                    print(f"[WARN] { datetime.datetime.now() } "
+                          f"Skipping { repo_key }, { name } has spent its "
+                          f"share of the rate limit")
+                    self.metrics.record_skip(repo_key, "rate budget", priority)
+                    continue
+                seen = RepoState.seen(repo) if self.repo_state else None
+                repo_g = self.get_github_client(token)
+                if repo_g is not g:
+                    # calls of a repo are made with the client it comes from
+                    repo = repo_g.create_from_raw_data(
+                        github.Repository.Repository, {
+                            "name": repo.name, "full_name": repo_key,
+                            "url": repo.url, "owner": {"login": org.login}})
+                self.context.budget = (budgets[token], name)
+                used = budgets[token].used[name]
+                started_at = time.perf_counter()
                 self.github_stats.setdefault(
                     repo_key, {
                         "clones": {},
                         "releases": {},
                         "issues_and_pr": {}})
-                self.get_github_clone_stats(g, org, repo)
-                self.get_github_release_stats(g, org, repo)
-                self.get_github_issue_pr_stats(g, org, repo, token)
-        if not self.github_stats:
+                with self.metrics.span("github_repo", repo=repo_key):
+                    self.get_github_clone_stats(repo_g, org, repo)
+                    self.get_github_activity_stats(
+                        repo_g, org, repo, token, seen)
+                slowest = max(slowest, time.perf_counter() - started_at)
+                calls = max(calls, budgets[token].used[name] - used)
+                collected += 1
+                if self.writer is not None:
+                    self.emit_github_records(repo_key)
+        finally:
+            self.context.budget = None
+            for token in tokens:
+                budgets[token].release(name)
+        if not collected:
             pass  # need to wire the notification here
 
+    def list_github_repos(self, g, org, org_conf):
+        """
+        Repos of the org to collect, listed a page at a time. Priorities of
+        repos in the deadline conf need them all listed first to be ordered.
+        The repos of the shard of a worker are got by name, not listed.
+        """
+        if self.repo_names is not None:
+            repos = [repo for repo in (
+                self.github_call(
+                    g, "repos", f"{ org.login }/{ repo_name }",
+                    lambda repo_name=repo_name: org.get_repo(repo_name))
+                for repo_name in self.repo_names
+                if repo_name not in org_conf["exclude"]) if repo is not None]
+            if self.deadline and self.deadline.priorities:
+                repos = self.deadline.order(repos, key=lambda repo: (
+                    f"{ org.login }/{ repo.name }",),
+                    default=org_conf["priority"])
+            yield from repos
+            return
+        repos = org.get_repos()
+        if self.deadline and self.deadline.priorities:
+            pages = [self.deadline.order(repos, key=lambda repo: (
+                f"{ org.login }/{ repo.name }",), default=org_conf["priority"])]
+        else:
+            # get_page() doesn't keep the repos of former pages as iterating
+            pages = (repos.get_page(page) for page in itertools.count())
+        for page in pages:
+            for repo in page:
+                if repo.name in org_conf["exclude"]:
+                    continue
+                yield repo
+            if len(page) < g.per_page:
+                return  # the last page
+
+    def emit_github_records(self, repo_key):
+        """
+        Transform stage of the pipeline: records of a collected repo go to
+        the writer and the repo is dropped from github_stats.
+        """
+        delta = self.release_delta_enabled() and self.repo_names is None
+        repo_dict = self.github_stats.pop(repo_key)
+        for record_key, record in self.github_records(repo_key, repo_dict):
+            if record_key == "github_release" and delta:
+                with self.lock:
+                    if self.release_delta is None:
+                        self.release_delta = ReleaseDelta(self.bucket)
+                if not self.release_delta.changes(record):
+                    continue
+                record_key = "github_release_delta"
+            self.writer.put(record_key, record)
+
+    def get_dockerhub_client(self, token=None):
+        """client of the instance, reporting to this run's metrics"""
+        base_url = self.conf.get("dockerhub_base_url", DOCKER_HUB_API_ENDPOINT)
+        http = self.dh_http
+        dh_client = get_client(
+            ("dockerhub", base_url, token), lambda: DockerHubClient(
+                auth_token=token, session=http, base_url=base_url))
+        dh_client.on_sleep = lambda url, seconds: self.metrics.record_sleep(
+            self.metrics.endpoint_name(url), seconds)
+        return dh_client
+
+    def get_dockerhub_namespaces(self):
+        """
+        Namespaces to collect by priority, conf "dockerhub_namespaces" lists
+        them with their own exclude list (of image names), token and
+        priority as "github_orgs" does, else it's DH_USER.
+        """
+        namespaces = []
+        for namespace_conf in self.conf.get("dockerhub_namespaces") or [
+                DH_USER]:
+            if isinstance(namespace_conf, str):
+                namespace_conf = {"name": namespace_conf}
+            name = namespace_conf["name"]
+            default_priority = self.deadline.priority(name, "dockerhub") \
+                if self.deadline else 0
+            namespaces.append({
+                "name": name,
+                "token": namespace_conf.get("token"),
+                "exclude": set(namespace_conf.get("exclude", [])),
+                "priority": namespace_conf.get("priority", default_priority)})
+        return sorted(namespaces, key=lambda namespace: -namespace["priority"])
+
     def get_data_from_dockerhub(self):
-        dh_client = DockerHubClient()
-        left_attempts = DH_RETRY
-        dockerhub_stats = dict()
-        while left_attempts > 0:
-            repos = dh_client.get_repos(DH_USER)
-            if DEBUG:
-                print(f"[DEBUG] { datetime.datetime.now() } "
-                      f"dockerhub count: { repos['content']['count'] }")
-            if repos.get('code', None) != 200:
-                left_attempts -= 1
-                if DEBUG:
-                    print(f"[DEBUG] { datetime.datetime.now() } "
-                          f"left attempt: { left_attempts }")
+        """
+        Images of the namespaces, ORG_WORKERS namespaces are listed at the
+        same time, higher priority first.
+        """
+        namespaces = []
+        for namespace in self.get_dockerhub_namespaces():
+            if self.deadline and not self.deadline.allows(
+                    namespace["priority"]):
+                print(f"[WARN] { datetime.datetime.now() } "
+                      f"Skipping { namespace['name'] }, "
+                      f"{ self.deadline.remaining():.1f}s left")
+                self.metrics.record_skip(
+                    namespace["name"], "deadline", namespace["priority"])
                 continue
-            if repos.get('content', {}).get('count', 0) > 0 \
-                    and repos.get('content', {}).get('results', None):
-                while left_attempts > 0:  # handling all pages of images
-                    images = repos['content']['results']
-
-                    def image_key(image):
-                        namespace = image.get('namespace', '')
-                        name = image['name']
-                        return f"{ namespace }/{ name }"
-
-                    new_stats = {
-                        image_key(image): image.get('pull_count', 0) \
-                            for image in images \
-                            if image.get('repository_type', '') == 'image'
-                        }
-                    dockerhub_stats.update(new_stats)
-                    if repos['content']['next'] is None:
-                        break
-                    else:
-                        qs = parse_qs(urlparse(repos['content']['next']).query)
-                        repos_new = dh_client.get_repos(
-                            DH_USER, page=int(qs['page'][0]))
-                        if repos_new.get('code', None) != 200:
-                            left_attempts -= 1
-                            if DEBUG:
-                                print(f"[DEBUG] { datetime.datetime.now() } "
-                                      f"left attempt: { left_attempts }")
-                            continue
-                        else:
-                            repos = repos_new
-                break
-            else:
-                # there is no content, end loop now
-                break
+            namespaces.append(namespace)
+        dockerhub_stats = dict()
+        if namespaces:
+            with concurrent.futures.ThreadPoolExecutor(
+                    min(ORG_WORKERS, len(namespaces))) as executor:
+                for images in executor.map(
+                        self.get_dockerhub_namespace_images, namespaces):
+                    for image_key, (pull_count, last_updated) \
+                            in images.items():
+                        dockerhub_stats[image_key] = pull_count
+                        self.dockerhub_images[image_key] = last_updated
 
         if dockerhub_stats:
             self.dockerhub_stats.update(dockerhub_stats)
@@ -359,23 +1322,367 @@ class DataFetcher:
                       f"dockerhub_stats is empty")
             pass  # need to wire the notification here
 
+    def get_dockerhub_namespace_images(self, namespace):
+        """{image: (pull count, last updated)} of a namespace"""
+        dh_client = self.get_dockerhub_client(namespace["token"])
+        images = dict()
+        page = 1
+        while page:  # handling all pages of images
+            repos = dh_client.get_repos(namespace["name"], page=page)
+            if repos['code'] != 200:
+                # retried by the client already, images listed so far are kept
+                print(f"[ERROR] { datetime.datetime.now() } "
+                      f"Failed listing dockerhub images of "
+                      f"{ namespace['name'] }, page { page }: "
+                      f"{ repos['code'] } { repos.get('error', '') }")
+                break
+            content = repos['content']
+            if DEBUG:
+                print(f"[DEBUG] { datetime.datetime.now() } "
+                      f"dockerhub count: { content.get('count') }")
+            for image in content.get('results') or []:
+                if image.get('repository_type', '') != 'image':
+                    continue
+                if image['name'] in namespace["exclude"]:
+                    continue
+                image_key = f"{ image.get('namespace', '') }/{ image['name'] }"
+                images[image_key] = (
+                    image.get('pull_count', 0), image.get('last_updated'))
+            page = int(parse_qs(urlparse(content['next']).query)['page'][0]) \
+                if content.get('next') else None
+        return images
+
+    def get_dockerhub_image_tags(self, dh_client, image):
+        """all pages of the tags of an image, one page after another"""
+        namespace, name = image.split("/", 1)
+        tags, page = [], 1
+        while page:
+            response = dh_client.get_tags(
+                namespace, name, page=page, per_page=DH_TAGS_PER_PAGE)
+            if response['code'] != 200:
+                raise ValueError(
+                    f"tags page { page } of { image }: "
+                    f"{ response['code'] } { response.get('error', '') }")
+            content = response['content']
+            tags += [{
+                    "tag": tag['name'],
+                    "last_pushed": tag.get('tag_last_pushed'),
+                    "last_updated": tag.get('last_updated'),
+                    "size": tag.get('full_size')}
+                for tag in content.get('results') or []]
+            page = page + 1 if content.get('next') else None
+        return tags
+
+    def get_data_from_dockerhub_tags(self):
+        """
+        Tags of the images updated since the former runs, the images are
+        fetched concurrently within the adaptive concurrency limit of the
+        client of their namespace, in turn from each namespace. The images
+        are the ones listed by get_data_from_dockerhub() before.
+        """
+        tags_conf = self.conf.get("dockerhub_tags")
+        if not tags_conf:
+            # opt-in, not collecting them is the default
+            if DEBUG:
+                print(f"[DEBUG] { datetime.datetime.now() } "
+                      f"dockerhub_tags is not configured, skipping")
+            return
+        clients = {
+            namespace["name"]: self.get_dockerhub_client(namespace["token"])
+            for namespace in self.get_dockerhub_namespaces()}
+        for dh_client in clients.values():
+            dh_client.concurrency.set_maximum(
+                tags_conf.get("host_concurrency", DH_HOST_CONCURRENCY))
+        try:
+            state = json.loads(
+                self.bucket.blob(DH_TAG_STATE_NAME).download_as_bytes())
+        except gcloud_exceptions.NotFound:
+            state = {}
+        namespace_images = collections.defaultdict(list)
+        for image, last_updated in self.dockerhub_images.items():
+            if last_updated is None or state.get(image) != last_updated:
+                namespace_images[image.split("/", 1)[0]].append(image)
+        # taken in turn from each namespace, a large one doesn't go first
+        images = [image
+            for turn in itertools.zip_longest(*namespace_images.values())
+            for image in turn if image is not None]
+        print(f"[INFO] { datetime.datetime.now() } "
+              f"Fetching tags of { len(images) } of "
+              f"{ len(self.dockerhub_images) } images, the others are unchanged")
+        self.dockerhub_tag_stats.update(self.fetch_concurrently(
+            lambda image: self.get_dockerhub_image_tags(
+                clients.get(image.split("/", 1)[0])
+                    or self.get_dockerhub_client(), image),
+            images))
+
+    def list_aliyunoss_logs(self, oss_conf, day):
+        """
+        Access log files of a day, log file names are like:
+            <TargetPrefix><SourceBucket>2021-04-21-00-00-00-0001.gz
+        the ones of the log bucket are listed by this prefix up to the day,
+        not through the whole history.
+        """
+        if oss_conf.get("log_dir"):
+            log_dir = oss_conf["log_dir"]
+            return [os.path.join(log_dir, name)
+                for name in sorted(os.listdir(log_dir)) if day in name]
+        bucket = oss2.Bucket(
+            oss2.Auth(
+                oss_conf["access_key_id"], oss_conf["access_key_secret"]),
+            oss_conf["endpoint"], oss_conf["bucket"])
+        # the bucket logged is the log bucket itself unless told
+        prefix = oss_conf.get("prefix", "") \
+            + oss_conf.get("source_bucket", oss_conf["bucket"]) + day
+        return [obj.key
+            for obj in oss2.ObjectIterator(bucket, prefix=prefix)]
+
     def get_data_from_aliyunoss(self):
-        pass
+        oss_conf = self.conf.get("aliyunoss")
+        if not oss_conf:
+            print(f"[WARN] { datetime.datetime.now() } "
+                  f"aliyunoss is not configured, skipping")
+            return
+        # We collect yesterday only, lines of other days are dropped
+        date_key = str(self.get_yesterday())
+        sources = self.list_aliyunoss_logs(oss_conf, date_key)
+        if DEBUG:
+            print(f"[DEBUG] { datetime.datetime.now() } "
+                  f"aliyunoss log files: { len(sources) }")
+        downloads = collections.Counter()
+        workers = min(len(sources), oss_conf.get("workers", os.cpu_count() or 1))
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                for counts in executor.map(
+                        count_oss_downloads, sources,
+                        [oss_conf] * len(sources)):
+                    downloads.update(counts)
+        else:
+            for source in sources:
+                downloads.update(count_oss_downloads(source, oss_conf))
 
-    def get_data(self):
-        """from github API, dockerhub API, etc."""
+        for (object_name, date), count in downloads.items():
+            if date != date_key:
+                continue
+            match = OSS_VERSION_PATTERN.search(object_name.rsplit("/", 1)[-1])
+            self.aliyunoss_stats.setdefault(object_name, {
+                "version": match.group(1) if match else "",
+                "downloads": {}})
+            self.aliyunoss_stats[object_name]["downloads"][date] = count
+        if not self.aliyunoss_stats:
+            if DEBUG:
+                print(f"[DEBUG] { datetime.datetime.now() } "
+                      f"aliyunoss_stats is empty")
+            pass  # need to wire the notification here
 
-        print(f"[INFO] { datetime.datetime.now() } "
-              f"Started fetching data from github")
-        self.get_data_from_github()
+    def open_pypi_exports(self, pypi_conf, day):
+        """
+        Export files of a day, from local export_dir or from export_prefix
+        in the GCS bucket, yield (name, stream) with gzip decoded on the fly.
+        """
+        if pypi_conf.get("export_dir"):
+            export_dir = pypi_conf["export_dir"]
+            sources = [os.path.join(export_dir, name)
+                for name in sorted(os.listdir(export_dir)) if day in name]
+            open_source = lambda source: open(source, "rb")
+        else:
+            # the names of the day only are listed, not the whole history
+            export_prefix = pypi_conf.get("export_prefix", "exports/pypi/")
+            sources = list(self.s_client.list_blobs(
+                BUCKET, prefix=export_prefix,
+                match_glob=f"{ export_prefix }**{ day }*"))
+            open_source = lambda blob: blob.open("rb")
+        for source in sources:
+            name = getattr(source, "name", source)
+            with open_source(source) as raw:
+                if name.endswith(".gz"):
+                    with gzip.GzipFile(fileobj=raw) as stream:
+                        yield name, stream
+                else:
+                    yield name, raw
+
+    def get_data_from_pypi(self):
+        pypi_conf = self.conf.get("pypi")
+        if not pypi_conf:
+            print(f"[WARN] { datetime.datetime.now() } "
+                  f"pypi is not configured, skipping")
+            return
+        # We collect yesterday only
+        date_key = str(self.get_yesterday())
+        packages = set(pypi_conf.get("packages", []))
+        downloads = collections.Counter()
+        for name, stream in self.open_pypi_exports(pypi_conf, date_key):
+            if DEBUG:
+                print(f"[DEBUG] { datetime.datetime.now() } "
+                      f"pypi export file: { name }")
+            counts, bad_rows = count_pypi_downloads(stream, packages)
+            downloads.update(counts)
+            if bad_rows:
+                print(f"[WARN] { datetime.datetime.now() } "
+                      f"Skipped { bad_rows } malformed rows of { name }")
+                self.metrics.record_bad_rows("pypi", bad_rows)
+
+        for (package, version, python, date), count in downloads.items():
+            if date != date_key:
+                continue
+            self.pypi_stats.setdefault(package, {}).setdefault(
+                version, {}).setdefault(python, {})[date] = count
+        if not self.pypi_stats:
+            if DEBUG:
+                print(f"[DEBUG] { datetime.datetime.now() } "
+                      f"pypi_stats is empty")
+            pass  # need to wire the notification here
 
-        print(f"[INFO] { datetime.datetime.now() } "
-              f"Started fetching data from dockerhub")
-        self.get_data_from_dockerhub()
+    def fetch_concurrently(self, fetch, items):
+        """
+        Run fetch for all items on HTTP_WORKERS threads sharing the pooled
+        session, returns {item: result}, failed items are left out.
+        """
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(HTTP_WORKERS) as executor:
+            futures = {executor.submit(fetch, item): item for item in items}
+            for future in concurrent.futures.as_completed(futures):
+                item = futures[future]
+                try:
+                    results[item] = future.result()
+                except (requests.RequestException, ValueError, KeyError) as e:
+                    print(f"[ERROR] { datetime.datetime.now() } "
+                          f"Failed fetching { item }: { e }")
+        return results
 
-        print(f"[INFO] { datetime.datetime.now() } "
-              f"Started fetching data from aliyunoss")
-        self.get_data_from_aliyunoss()
+    def get_maven_artifact_stats(self, maven_conf, artifact, month):
+        """
+        Monthly downloads of a group:artifact from the Central Statistics of
+        Sonatype OSSRH, only the owner of the project is allowed to query it.
+        """
+        group_id, artifact_id = artifact.split(":")
+        url = (f"{ maven_conf.get('endpoint', MAVEN_STATS_ENDPOINT) }"
+               f"/service/local/stats/timeline")
+        auth = (maven_conf["username"], maven_conf.get("password")) \
+            if maven_conf.get("username") else None
+        stats = {"month": month}
+        for stats_type, stats_key in (("raw", "downloads"), ("ip", "uniques")):
+            response = self.http.get(url, params={
+                    "p": maven_conf["project_id"], "g": group_id,
+                    "a": artifact_id, "t": stats_type,
+                    "from": month.replace("-", ""), "nom": 1},
+                headers={"Accept": "application/json"}, auth=auth,
+                timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            stats[stats_key] = response.json()["data"]["total"]
+        return stats
+
+    def get_data_from_maven(self):
+        maven_conf = self.conf.get("maven")
+        if not maven_conf:
+            print(f"[WARN] { datetime.datetime.now() } "
+                  f"maven is not configured, skipping")
+            return
+        missing = [key for key in ("project_id", "artifacts")
+            if not maven_conf.get(key)]
+        if maven_conf.get("username") and not maven_conf.get("password"):
+            missing.append("password")
+        if missing:
+            self.skip_source("maven", f"conf lacks { ', '.join(missing) }")
+            return
+        artifacts = []
+        for artifact in maven_conf["artifacts"]:
+            if not isinstance(artifact, str) or artifact.count(":") != 1:
+                print(f"[WARN] { datetime.datetime.now() } "
+                      f"Skipping maven artifact { artifact }, "
+                      f"not a group:artifact")
+                continue
+            artifacts.append(artifact)
+        # Central Statistics are monthly, we collect month to date of yesterday
+        month = str(self.get_yesterday())[:7]
+        self.maven_stats.update(self.fetch_concurrently(
+            lambda artifact: self.get_maven_artifact_stats(
+                maven_conf, artifact, month),
+            artifacts))
+        if not self.maven_stats:
+            pass  # need to wire the notification here
+
+    def get_go_module_stats(self, go_conf, module):
+        """
+        The module proxy doesn't expose download counts, we track published
+        versions and the latest one instead.
+        """
+        proxy = go_conf.get("proxy", GO_PROXY)
+        # module paths are case-encoded for the proxy: "V" is "!v"
+        escaped = re.sub(r"[A-Z]", lambda m: "!" + m.group(0).lower(), module)
+        versions = self.http.get(
+            f"{ proxy }/{ escaped }/@v/list", timeout=HTTP_TIMEOUT)
+        versions.raise_for_status()
+        latest = self.http.get(
+            f"{ proxy }/{ escaped }/@latest", timeout=HTTP_TIMEOUT)
+        latest.raise_for_status()
+        latest_info = latest.json()
+        return {
+            "version_count": len(versions.text.split()),
+            "latest_version": latest_info.get("Version", ""),
+            "latest_time": latest_info.get("Time")}
+
+    def get_data_from_go(self):
+        go_conf = self.conf.get("go")
+        if not go_conf:
+            print(f"[WARN] { datetime.datetime.now() } "
+                  f"go is not configured, skipping")
+            return
+        if not go_conf.get("modules"):
+            self.skip_source("go", "conf lacks modules")
+            return
+        self.go_stats.update(self.fetch_concurrently(
+            lambda module: self.get_go_module_stats(go_conf, module),
+            go_conf.get("modules", [])))
+        if not self.go_stats:
+            pass  # need to wire the notification here
+
+    def skip_source(self, source, reason):
+        print(f"[WARN] { datetime.datetime.now() } "
+              f"Skipping { source }, { reason }")
+        self.metrics.record_skip(source, reason)
+
+    def get_sources(self):
+        return (
+            ("github", self.get_data_from_github),
+            ("dockerhub", self.get_data_from_dockerhub),
+            ("dockerhub_tags", self.get_data_from_dockerhub_tags),
+            ("aliyunoss", self.get_data_from_aliyunoss),
+            ("pypi", self.get_data_from_pypi),
+            ("maven", self.get_data_from_maven),
+            ("go", self.get_data_from_go))
+
+    def get_ordered_sources(self):
+        """sources by priority when the run has a deadline"""
+        if self.deadline is None:
+            return self.get_sources()
+        return self.deadline.order(
+            self.get_sources(), key=lambda source: source[:1])
+
+    def get_data(self, sources=None):
+        """from github API, dockerhub API, etc., all sources unless given"""
+
+        with self.metrics.span("get_data"):
+            for source, get_data_from_source in self.get_ordered_sources():
+                if sources is not None and source not in sources:
+                    continue
+                if self.deadline and not self.deadline.allows(
+                        self.deadline.priority(source)):
+                    print(f"[WARN] { datetime.datetime.now() } "
+                          f"Skipping { source }, "
+                          f"{ self.deadline.remaining():.1f}s left")
+                    self.metrics.record_skip(
+                        source, "deadline", self.deadline.priority(source))
+                    continue
+                print(f"[INFO] { datetime.datetime.now() } "
+                      f"Started fetching data from { source }")
+                try:
+                    with self.metrics.span(f"get_data_from_{ source }"):
+                        get_data_from_source()
+                except Exception as e:
+                    # what the other sources fetched is archived all the same
+                    print(f"[ERROR] { datetime.datetime.now() } "
+                          f"Failed fetching data from { source }: { e }")
+                    self.metrics.record_skip(source, f"error { e }")
 
     def save_str_to_gcs_ascii(self, bucket, string_obj, filename):
         """
@@ -386,62 +1693,100 @@ class DataFetcher:
         blob = bucket.blob(filename)
         blob.upload_from_string(data=string_obj, content_type='application/json')
 
+    def get_today(self):
+        """date of the run, shard workers get the one of their coordinator"""
+        return self.run_date or datetime.datetime.now().date()
+
     def get_yesterday(self):
-        return (datetime.datetime.now() - datetime.timedelta(1)).date()
+        return self.get_today() - datetime.timedelta(1)
+
+    def get_record_folder(self):
+        # records/2021-04-21
+        return f"records/{ self.get_today() }"
+
+    def github_records(self, repo, repo_dict):
+        """(record key, record) of the stats of a repo, as archived"""
+        # convert github clone stats
+        for date, count in repo_dict.get('clones', {}).items():
+            yield "github_clone", dict(
+                repo=repo, date=date,
+                count=count['count'], uniques=count['uniques'])
+        for tag, tag_dict in repo_dict.get('releases', {}).items():
+            if not tag_dict:
+                continue
+            count = 0
+            assets = []
+            for asset, asset_count in tag_dict.items():
+                count += asset_count
+                assets.append(dict(
+                    name=asset,
+                    url=f"https://github.com/{ repo }/"
+                        f"releases/download/{ tag }/{ asset }",
+                    count=asset_count))
+            yield "github_release", dict(
+                repo=repo, date=str(self.get_yesterday()), tag=tag,
+                count=count, assets=assets)
+        for date, count in repo_dict.get('issues_and_pr', {}).items():
+            yield "github_issue_pr", dict(
+                all_issue_count=count['all_issue_count']['totalCount'],
+                open_issue_count=count['open_issue_count']['totalCount'],
+                closed_issue_count=count['closed_issue_count']['totalCount'],
+                all_pr_count=count['all_pr_count']['totalCount'],
+                open_pr_count=count['open_pr_count']['totalCount'],
+                merged_pr_count=count['merged_pr_count']['totalCount'],
+                repo=repo, date=date)
+
+    def save_records(self, folder, record_key, records):
+        self.save_str_to_gcs_ascii(
+            bucket=self.bucket,
+            string_obj="\n".join(json.dumps(record) for record in records),
+            filename=f"{ folder }/{ GCS_RECORD_NAME[record_key] }")
 
     def archive_github_data(self, folder):
-        github_clone_list = list()
-        github_release_list = list()
-        github_issue_pr_list = list()
+        """repos left in github_stats, collect() has streamed the others"""
+        github_records = collections.defaultdict(list)
         for repo, repo_dict in self.github_stats.items():
-            # convert github clone stats
-            for date, count in repo_dict.get('clones', {}).items():
-                github_clone_record = dict(
-                    repo=repo, date=date,
-                    count=count['count'], uniques=count['uniques'])
-                github_clone_list.append(f"{ json.dumps(github_clone_record) }")
-            for tag, tag_dict in repo_dict.get('releases', {}).items():
-                if not tag_dict:
-                    continue
-                count = 0
-                assets = []
-                for asset, asset_count in tag_dict.items():
-                    count += asset_count
-                    assets.append(dict(
-                        name=asset,
-                        url=f"https://github.com/{ repo }/"
-                            f"releases/download/{ tag }/{ asset }",
-                        count=asset_count))
-                github_release_record = dict(
-                    repo=repo, date=str(self.get_yesterday()), tag=tag,
-                    count=count, assets=assets)
-                github_release_list.append(f"{ json.dumps(github_release_record) }")
-            for date, count in repo_dict.get('issues_and_pr', {}).items():
-                github_issue_and_pr_record = dict(
-                    all_issue_count=count['all_issue_count']['totalCount'],
-                    open_issue_count=count['open_issue_count']['totalCount'],
-                    closed_issue_count=count['closed_issue_count']['totalCount'],
-                    all_pr_count=count['all_pr_count']['totalCount'],
-                    open_pr_count=count['open_pr_count']['totalCount'],
-                    merged_pr_count=count['merged_pr_count']['totalCount'],
-                    repo=repo, date=date)
-                github_issue_pr_list.append(
-                    f"{ json.dumps(github_issue_and_pr_record) }")
-        if github_clone_list:
-            self.save_str_to_gcs_ascii(
-                bucket=self.bucket,
-                string_obj="\n".join(github_clone_list),
-                filename=f"{ folder }/{ GCS_RECORD_NAME['github_clone'] }")
-        if github_release_list:
-            self.save_str_to_gcs_ascii(
-                bucket=self.bucket,
-                string_obj="\n".join(github_release_list),
-                filename=f"{ folder }/{ GCS_RECORD_NAME['github_release'] }")
-        if github_issue_pr_list:
-            self.save_str_to_gcs_ascii(
-                bucket=self.bucket,
-                string_obj="\n".join(github_issue_pr_list),
-                filename=f"{ folder }/{ GCS_RECORD_NAME['github_issue_pr'] }")
+            for record_key, record in self.github_records(repo, repo_dict):
+                github_records[record_key].append(record)
+        if github_records["github_clone"]:
+            self.save_records(
+                folder, "github_clone", github_records["github_clone"])
+        # shard workers archive all tags, the delta is taken once merged
+        if not github_records["github_release"]:
+            pass
+        elif self.release_delta_enabled() and self.repo_names is None:
+            self.archive_release_delta(
+                folder, github_records["github_release"])
+        else:
+            self.save_records(
+                folder, "github_release", github_records["github_release"])
+        if github_records["github_issue_pr"]:
+            self.save_records(
+                folder, "github_issue_pr", github_records["github_issue_pr"])
+        if self.repo_state is not None:
+            print(f"[INFO] { datetime.datetime.now() } "
+                  f"{ self.repo_state.carried } repos unchanged and carried "
+                  f"forward, { len(self.repo_state.updates) } collected")
+            # shard workers keep the state of their repos for the merge
+            self.repo_state.save(REPO_STATE_NAME if self.repo_names is None
+                else f"{ folder }/{ REPO_STATE_SHARD_NAME }")
+            self.repo_state = None
+
+    def release_delta_enabled(self):
+        return self.conf.get("release_snapshots", "full") == "delta"
+
+    def archive_release_delta(self, folder, release_records):
+        """
+        Archive the release records changed since the former runs, see
+        ReleaseDelta, and update the state with them.
+        """
+        release_delta = ReleaseDelta(self.bucket)
+        delta = [record for record in release_records
+            if release_delta.changes(record)]
+        if delta:
+            self.save_records(folder, "github_release_delta", delta)
+        release_delta.save()
+        return delta
 
     def archive_dockerhub_data(self, folder):
         dockerhub_image_list = list()
@@ -457,16 +1802,445 @@ class DataFetcher:
                 string_obj="\n".join(dockerhub_image_list),
                 filename=f"{ folder }/{ GCS_RECORD_NAME['dockerhub_image'] }")
 
-    def archive_data(self):
+    def archive_dockerhub_tag_data(self, folder):
+        dockerhub_tag_list = list()
+        for image, tags in self.dockerhub_tag_stats.items():
+            for tag in tags:
+                dockerhub_tag_list.append(json.dumps(dict(
+                    image=image, date=str(self.get_yesterday()), **tag)))
+        if dockerhub_tag_list:
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj="\n".join(dockerhub_tag_list),
+                filename=f"{ folder }/{ GCS_RECORD_NAME['dockerhub_tag'] }")
+        if self.dockerhub_tag_stats:
+            # only images whose tags were fetched, failed ones are retried
+            try:
+                state = json.loads(
+                    self.bucket.blob(DH_TAG_STATE_NAME).download_as_bytes())
+            except gcloud_exceptions.NotFound:
+                state = {}
+            state.update({
+                image: self.dockerhub_images.get(image)
+                for image in self.dockerhub_tag_stats})
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj=json.dumps(state, separators=(",", ":")),
+                filename=DH_TAG_STATE_NAME)
+
+    def archive_aliyunoss_data(self, folder):
+        aliyunoss_download_list = list()
+        for object_name, object_dict in self.aliyunoss_stats.items():
+            for date, count in object_dict["downloads"].items():
+                aliyunoss_download_record = dict(
+                    object=object_name,
+                    version=object_dict["version"],
+                    date=date,
+                    count=count)
+                aliyunoss_download_list.append(
+                    f"{ json.dumps(aliyunoss_download_record) }")
+        if aliyunoss_download_list:
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj="\n".join(aliyunoss_download_list),
+                filename=f"{ folder }/{ GCS_RECORD_NAME['aliyunoss_download'] }")
+
+    def archive_pypi_data(self, folder):
+        pypi_download_list = list()
+        for package, versions in self.pypi_stats.items():
+            for version, pythons in versions.items():
+                for python, dates in pythons.items():
+                    for date, count in dates.items():
+                        pypi_download_record = dict(
+                            package=package, version=version, python=python,
+                            date=date, count=count)
+                        pypi_download_list.append(
+                            f"{ json.dumps(pypi_download_record) }")
+        if pypi_download_list:
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj="\n".join(pypi_download_list),
+                filename=f"{ folder }/{ GCS_RECORD_NAME['pypi_download'] }")
+
+    def archive_maven_data(self, folder):
+        maven_download_list = list()
+        for artifact, stats in self.maven_stats.items():
+            maven_download_record = dict(
+                artifact=artifact,
+                date=str(self.get_yesterday()),
+                month=stats["month"],
+                downloads=stats["downloads"],
+                uniques=stats["uniques"])
+            maven_download_list.append(f"{ json.dumps(maven_download_record) }")
+        if maven_download_list:
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj="\n".join(maven_download_list),
+                filename=f"{ folder }/{ GCS_RECORD_NAME['maven_download'] }")
+
+    def archive_go_data(self, folder):
+        go_module_list = list()
+        for module, stats in self.go_stats.items():
+            go_module_record = dict(
+                module=module,
+                date=str(self.get_yesterday()),
+                version_count=stats["version_count"],
+                latest_version=stats["latest_version"],
+                latest_time=stats["latest_time"])
+            go_module_list.append(f"{ json.dumps(go_module_record) }")
+        if go_module_list:
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj="\n".join(go_module_list),
+                filename=f"{ folder }/{ GCS_RECORD_NAME['go_module'] }")
+
+    def archive_data(self, folder=None):
         """
         Archive Data to GCS Bucket
         """
-        # records/2021-04-21
-        folder = f"records/{ datetime.datetime.now().date() }"
-        self.archive_github_data(folder)
-        self.archive_dockerhub_data(folder)
+        folder = folder or self.get_record_folder()
+        with self.metrics.span("archive"):
+            self.archive_github_data(folder)
+            self.archive_dockerhub_data(folder)
+            self.archive_dockerhub_tag_data(folder)
+            self.archive_aliyunoss_data(folder)
+            self.archive_pypi_data(folder)
+            self.archive_maven_data(folder)
+            self.archive_go_data(folder)
+        return folder
+
+    def collect(self, folder=None, sources=None):
+        """
+        get_data() and archive_data() as a pipeline: repos of the org are
+        listed on a thread, fetched one by one, and the records of each repo
+        streamed to the archive by a RecordWriter once it's done, so memory
+        is bound to the repos in flight instead of the size of the org.
+        Other sources are archived once fetched, as before.
+        """
+        folder = folder or self.get_record_folder()
+        writer = self.writer = RecordWriter(self.bucket, folder)
+        try:
+            self.get_data(sources)
+        finally:
+            try:
+                # records of the repos done are archived even if the run failed
+                self.writer = None
+                with self.metrics.span("archive_stream"):
+                    counts = writer.close()
+                # the delta records streamed are archived, so is their state
+                if self.release_delta is not None:
+                    self.release_delta.save()
+                    self.release_delta = None
+                print(f"[INFO] { datetime.datetime.now() } "
+                      f"Streamed records to { folder }: { counts }")
+            finally:
+                # so is what the other sources collected
+                self.archive_data(folder)
+        return folder
+
+    def plan_shards(self):
+        """
+        Shards of a sharded run: repos of each org split by repos_per_shard,
+        and one shard for each other source configured.
+        """
+        repos_per_shard = self.conf.get("sharding", {}).get(
+            "repos_per_shard", SHARD_REPOS)
+        shards = []
+        for org_conf in self.get_github_orgs():
+            g = self.get_github_client(org_conf["tokens"][0])
+            org = g.get_organization(org_conf["name"])
+            self.record_github_call(g, "orgs")
+            repo_names = [repo.name for repo in org.get_repos()
+                if repo.name not in org_conf["exclude"]]
+            self.record_github_call(g, "orgs/repos")
+            shards += [{
+                    "id": f"github-{ org_conf['name'] }-"
+                          f"{ index // repos_per_shard:04d}",
+                    "source": "github",
+                    "org": org_conf["name"],
+                    "repos": repo_names[index:index + repos_per_shard]}
+                for index in range(0, len(repo_names), repos_per_shard)]
+        # tags of docker hub images go with the images they are listed from
+        shards.append({
+            "id": "dockerhub", "source": "dockerhub",
+            "sources": ["dockerhub", "dockerhub_tags"]
+                if self.conf.get("dockerhub_tags") else ["dockerhub"]})
+        # other sources are only collected when configured
+        shards += [{"id": source, "source": source}
+            for source, _ in self.get_sources()
+            if source not in ("github", "dockerhub", "dockerhub_tags")
+                and self.conf.get(source)]
+        return shards
+
+    def get_shard_folder(self, shard_id=None):
+        folder = f"{ self.get_record_folder() }/{ SHARD_FOLDER }"
+        return f"{ folder }/{ shard_id }" if shard_id else folder
+
+    def coordinate(self, shard_queue, message=None):
+        """
+        Coordinator of a sharded run: plans the shards, records them in the
+        manifest of the run and publishes one worker task per shard.
+        """
+        with self.metrics.span("coordinate"):
+            shards = self.plan_shards()
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj=json.dumps({
+                    "run_date": str(self.get_today()),
+                    "shards": [shard["id"] for shard in shards]}),
+                filename=f"{ self.get_shard_folder() }/_manifest.json")
+            print(f"[INFO] { datetime.datetime.now() } "
+                  f"Publishing { len(shards) } shards")
+            for shard in shards:
+                shard_queue.publish(dict(
+                    message or {}, mode="worker",
+                    run_date=str(self.get_today()), shard=shard))
+            shard_queue.flush()
+        return shards
+
+    def run_shard(self, shard):
+        """
+        Worker of a sharded run: collects the source (and repos) of a shard
+        into the partial records of the shard, then marks it done.
+        """
+        folder = self.get_shard_folder(shard["id"])
+        self.org_names = [shard["org"]] if "org" in shard else None
+        self.repo_names = shard.get("repos")
+        with self.metrics.span("shard", shard=shard["id"]):
+            self.collect(
+                folder, sources=shard.get("sources", [shard["source"]]))
+        self.save_str_to_gcs_ascii(
+            bucket=self.bucket,
+            string_obj=json.dumps({"done_at": str(datetime.datetime.now())}),
+            filename=f"{ folder }/_done")
         return folder
 
+    def list_shard_files(self):
+        """names of the objects under the shard folder of the run"""
+        return [blob.name for blob in self.s_client.list_blobs(
+            self.bucket, prefix=f"{ self.get_shard_folder() }/")]
+
+    def claim_merge(self):
+        """
+        True for the one worker to merge the run, once all shards are done.
+        The claim is an object created only if it doesn't exist yet, as
+        shard workers may finish (or be redelivered) at the same time.
+        """
+        manifest = json.loads(self.bucket.blob(
+            f"{ self.get_shard_folder() }/_manifest.json").download_as_bytes())
+        done = {name.split("/")[-2] for name in self.list_shard_files()
+            if name.endswith("/_done")}
+        pending = [
+            shard_id for shard_id in manifest["shards"] if shard_id not in done]
+        if pending:
+            print(f"[INFO] { datetime.datetime.now() } "
+                  f"{ len(pending) } shards pending, not merging yet")
+            return False
+        try:
+            self.bucket.blob(f"{ self.get_shard_folder() }/_merged") \
+                .upload_from_string(
+                    str(datetime.datetime.now()), if_generation_match=0)
+        except gcloud_exceptions.PreconditionFailed:
+            return False
+        return True
+
+    def merge_shards(self):
+        """
+        Concatenate the partial records of the shards into the records of
+        the run, as archive_data() would have written them.
+        """
+        folder = self.get_record_folder()
+        writer = RecordWriter(self.bucket, folder)
+        release_delta = ReleaseDelta(self.bucket) \
+            if self.release_delta_enabled() else None
+        with self.metrics.span("merge"):
+            files = sorted(self.list_shard_files())
+            try:
+                for record_key, record_name in GCS_RECORD_NAME.items():
+                    # one part in memory at a time
+                    for name in files:
+                        if not name.endswith(f"/{ record_name }"):
+                            continue
+                        part = self.bucket.blob(name).download_as_bytes()
+                        for line in part.decode("utf-8").splitlines():
+                            if not line.strip():
+                                continue
+                            if record_key != "github_release" \
+                                    or release_delta is None:
+                                writer.put(record_key, line)
+                            elif release_delta.changes(json.loads(line)):
+                                writer.put("github_release_delta", line)
+            finally:
+                writer.close()
+            if release_delta is not None and release_delta.total:
+                release_delta.save()
+            repo_state = RepoState(self.bucket)
+            for name in files:
+                if name.endswith(f"/{ REPO_STATE_SHARD_NAME }"):
+                    repo_state.updates.update(json.loads(
+                        self.bucket.blob(name).download_as_bytes()))
+            repo_state.save()
+        return folder
+
+    def get_last_month(self):
+        return (self.get_today().replace(day=1)
+            - datetime.timedelta(1)).strftime("%Y-%m")
+
+    def list_month_records(self, month):
+        """{record name: {date: object name}} of the daily records of a month"""
+        record_names = set(GCS_RECORD_NAME.values())
+        records = collections.defaultdict(dict)
+        for blob in self.s_client.list_blobs(
+                self.bucket, prefix=f"records/{ month }-"):
+            # records/2021-04-21/github_clone_stats.json, not shards' ones
+            parts = blob.name.split("/")
+            if len(parts) == 3 and parts[2] in record_names:
+                records[parts[2]][parts[1]] = blob.name
+        return records
+
+    def compact_records(self, month, record_name, objects):
+        """
+        Daily objects of a record into one gzipped NDJSON object of the
+        month, a day at a time, returns its entry of the manifest. Rows are
+        verified by counting them back from the object uploaded.
+        """
+        name = f"{ ARCHIVE_FOLDER }/{ month }/{ record_name }.gz"
+        rows_by_date = {}
+        with self.bucket.blob(name).open(
+                "wb", chunk_size=RECORD_CHUNK_SIZE, ignore_flush=True,
+                content_type="application/gzip") as writer:
+            with gzip.GzipFile(fileobj=writer, mode="wb") as compressed:
+                for date, object_name in sorted(objects.items()):
+                    rows = 0
+                    part = self.bucket.blob(object_name).download_as_bytes()
+                    for line in part.splitlines():
+                        if line.strip():
+                            compressed.write(line + b"\n")
+                            rows += 1
+                    rows_by_date[date] = rows
+        with self.bucket.blob(name).open("rb") as reader:
+            with gzip.GzipFile(fileobj=reader, mode="rb") as compressed:
+                rows = sum(1 for line in compressed if line.strip())
+        return {
+            "object": name,
+            "first_date": min(rows_by_date),
+            "last_date": max(rows_by_date),
+            "rows_by_date": rows_by_date,
+            "rows": rows,
+            "verified": rows == sum(rows_by_date.values())}
+
+    def compact_month(self, month, prune=False):
+        """
+        Compact the daily records of a month to a gzipped NDJSON object per
+        record in ARCHIVE_FOLDER/<month>/, with a manifest of the dates and
+        rows of each, and delete the daily records once all rows are
+        verified if asked to. Only a month over is pruned, and once pruned
+        it is not compacted again, as its daily records are gone.
+        """
+        manifest_name = f"{ ARCHIVE_FOLDER }/{ month }/_manifest.json"
+        try:
+            former = json.loads(
+                self.bucket.blob(manifest_name).download_as_bytes())
+        except gcloud_exceptions.NotFound:
+            former = {}
+        if former.get("pruned"):
+            print(f"[WARN] { datetime.datetime.now() } "
+                  f"{ month } is compacted and pruned already, skipping")
+            return former
+        if prune and month >= self.get_today().strftime("%Y-%m"):
+            raise ValueError(f"{ month } isn't over, not pruning it")
+        records = self.list_month_records(month)
+        manifest = {
+            "month": month,
+            "compacted_at": str(datetime.datetime.now()),
+            "records": {},
+            "pruned": False}
+        with self.metrics.span("compact", month=month):
+            for record_name, objects in sorted(records.items()):
+                entry = self.compact_records(month, record_name, objects)
+                manifest["records"][record_name] = entry
+                print(f"[INFO] { datetime.datetime.now() } "
+                      f"Compacted { entry['rows'] } rows of { len(objects) } "
+                      f"days to { entry['object'] }")
+            unverified = [record_name
+                for record_name, entry in manifest["records"].items()
+                if not entry["verified"]]
+            if prune and not unverified:
+                for objects in records.values():
+                    for object_name in objects.values():
+                        self.bucket.blob(object_name).delete()
+                manifest["pruned"] = True
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj=json.dumps(manifest),
+                filename=manifest_name)
+        if unverified:
+            raise ValueError(
+                f"Rows of { unverified } of { month } don't match once "
+                f"compacted, daily records are kept")
+        return manifest
+
+    def get_reload_objects(self, left, right):
+        """
+        Record objects of the dates from left to right, to be loaded again,
+        as {object name: {date: rows}}: the daily records, rows None as
+        they are all of the date, or the compacted record of a pruned month
+        when all its dates are in the range, with the rows of each date.
+        """
+        objects = {}
+        month = left[:7]
+        while month <= right[:7]:
+            for record_name, dates in self.list_month_records(month).items():
+                objects.update((object_name, {date: None})
+                    for date, object_name in dates.items()
+                    if left <= date <= right)
+            try:
+                manifest = json.loads(self.bucket.blob(
+                    f"{ ARCHIVE_FOLDER }/{ month }/_manifest.json"
+                    ).download_as_bytes())
+            except gcloud_exceptions.NotFound:
+                manifest = {}
+            for record_name, entry in manifest.get("records", {}).items():
+                if not manifest["pruned"] or entry["last_date"] < left \
+                        or entry["first_date"] > right:
+                    continue
+                if left <= entry["first_date"] and entry["last_date"] <= right:
+                    objects[entry["object"]] = entry["rows_by_date"]
+                else:
+                    print(f"[WARN] { datetime.datetime.now() } "
+                          f"Not reloading { record_name } of { month }, "
+                          f"{ entry['object'] } has dates out of the range")
+            year, mon = map(int, month.split("-"))
+            month = f"{ year + mon // 12 }-{ mon % 12 + 1:02d}"
+        return objects
+
+    def reload_data(self, left, right):
+        """
+        Load the archived records of the dates from left to right again,
+        without fetching anything. The rows of each date replace its
+        partition, so the dates loaded before are not duplicated.
+        """
+        with self.metrics.span("reload", left=left, right=right):
+            objects = self.get_reload_objects(left, right)
+            print(f"[INFO] { datetime.datetime.now() } "
+                  f"Reloading { len(objects) } records of { left }..{ right }")
+            if objects:
+                self.load_data(None, objects=objects)
+        return objects
+
+    def report_metrics(self, folder=None):
+        """
+        Print the metrics summary as one JSON line, and archive it as
+        records/<date>/_metrics.json when folder is given.
+        """
+        summary = json.dumps({"metrics": self.metrics.summary()})
+        print(summary)
+        if folder:
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj=summary,
+                filename=f"{ folder }/{ METRICS_RECORD_NAME }")
+
     def load_bigquery_from_gcs(self, bq_client, gcs_uri, table_id, job_config):
         load_job = bq_client.load_table_from_uri(
             gcs_uri,
@@ -476,25 +2250,67 @@ class DataFetcher:
         )  # Make an API request.
         return load_job
 
-    def load_data(self, record_folder):
+    def load_partitions(self, bq_client, object_name, rows_by_date, table_id,
+            job_config):
         """
+        Load jobs of the rows of an object to the partitions of their dates,
+        a compacted object is split back to its days by the rows of each.
+        """
+        if list(rows_by_date.values()) == [None]:
+            date, = rows_by_date
+            return [self.load_bigquery_from_gcs(
+                bq_client, f"gs://{ BUCKET }/{ object_name }",
+                partition(table_id, date), job_config)]
+        jobs = []
+        with self.bucket.blob(object_name).open("rb") as reader:
+            with gzip.GzipFile(fileobj=reader, mode="rb") as compressed:
+                lines = (line for line in compressed if line.strip())
+                # days are compacted in order, a day in memory at a time
+                for date, rows in sorted(rows_by_date.items()):
+                    day = b"".join(itertools.islice(lines, rows))
+                    if not day:
+                        continue
+                    jobs.append(bq_client.load_table_from_file(
+                        io.BytesIO(day), partition(table_id, date),
+                        location=GCP_LOCATION, job_config=job_config))
+        return jobs
+
+    def load_data(self, record_folder, objects=None):
+        """
+        The records archived in a folder are appended to their tables.
+        objects, {object name: {date: rows}} of record objects from any
+        folder, like the compacted ones of ARCHIVE_FOLDER, are loaded instead
+        when given, replacing the partitions of their dates, which needs the
+        tables partitioned by day.
         load files like:
             gs://nebula-insights/records/2021-04-21/github_release_stats.json
+            gs://nebula-insights/records/2021-04-21/github_release_delta_stats.json
             gs://nebula-insights/records/2021-04-21/github_clone_stats.json
             gs://nebula-insights/records/2021-04-21/dockerhub_image_stats.json
+            gs://nebula-insights/records/2021-04-21/dockerhub_tag_stats.json
+            gs://nebula-insights/records/2021-04-21/aliyunoss_download_stats.json
+            gs://nebula-insights/records/2021-04-21/pypi_download_stats.json
+            gs://nebula-insights/records/2021-04-21/maven_download_stats.json
+            gs://nebula-insights/records/2021-04-21/go_module_stats.json
         """
         self.get_sink_credential()
 
         # Construct a BigQuery client object.
-        bq_client = bigquery.Client()
+        bq_client = get_client("bigquery", bigquery.Client)
         TABLE_ID_PREFIX = f"{ GCP_PROJECT }.{ BQ_DATASET }"
         URI_PREFIX = f"gs://{ BUCKET }/{ record_folder }"
 
         # table_id
         github_clone_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['github_clone'] }"
         github_release_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['github_release'] }"
+        github_release_delta_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['github_release_delta'] }"
         github_pr_issue_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['github_pr_issue'] }"
         dockerhub_image_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['dockerhub_image'] }"
+        dockerhub_tag_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['dockerhub_tag'] }"
+        aliyunoss_download_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['aliyunoss_download'] }"
+        pypi_download_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['pypi_download'] }"
+        maven_download_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['maven_download'] }"
+        go_module_table_id = f"{ TABLE_ID_PREFIX }.{ BQ_TABLE_NAME['go_module'] }"
 
         # job_config
         github_clone_job_config = bigquery.LoadJobConfig(
@@ -535,6 +2351,18 @@ class DataFetcher:
             source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
         )
 
+        dockerhub_tag_job_config = bigquery.LoadJobConfig(
+            schema=[
+                bigquery.SchemaField("image", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("date", "DATE", mode="REQUIRED"),
+                bigquery.SchemaField("tag", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("last_pushed", "TIMESTAMP", mode="NULLABLE"),
+                bigquery.SchemaField("last_updated", "TIMESTAMP", mode="NULLABLE"),
+                bigquery.SchemaField("size", "INTEGER", mode="NULLABLE")
+            ],
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        )
+
         github_issue_pr_job_config = bigquery.LoadJobConfig(
             schema=[
                 bigquery.SchemaField("repo", "STRING", mode="REQUIRED"),
@@ -549,37 +2377,128 @@ class DataFetcher:
             source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
         )
 
-        # uri
-        github_clone_uri = f"{ URI_PREFIX }/{ GCS_RECORD_NAME['github_clone'] }"
-        github_release_uri = f"{ URI_PREFIX }/{ GCS_RECORD_NAME['github_release'] }"
-        github_issue_pr_uri = f"{ URI_PREFIX }/{ GCS_RECORD_NAME['github_issue_pr'] }"
-        dockerhub_image_uri = f"{ URI_PREFIX }/{ GCS_RECORD_NAME['dockerhub_image'] }"
-
-        print(f"[INFO] { datetime.datetime.now() } "
-              f"Started data loading to BigQuery")
-
-        j_clone = self.load_bigquery_from_gcs(
-            bq_client, github_clone_uri, github_clone_table_id,
-            github_clone_job_config)
+        aliyunoss_download_job_config = bigquery.LoadJobConfig(
+            schema=[
+                bigquery.SchemaField("object", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("version", "STRING", mode="NULLABLE"),
+                bigquery.SchemaField("date", "DATE", mode="REQUIRED"),
+                bigquery.SchemaField("count", "INTEGER", mode="REQUIRED")
+            ],
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        )
 
-        j_rel = self.load_bigquery_from_gcs(
-            bq_client, github_release_uri, github_release_table_id,
-            github_release_job_config)
+        pypi_download_job_config = bigquery.LoadJobConfig(
+            schema=[
+                bigquery.SchemaField("package", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("version", "STRING", mode="NULLABLE"),
+                bigquery.SchemaField("python", "STRING", mode="NULLABLE"),
+                bigquery.SchemaField("date", "DATE", mode="REQUIRED"),
+                bigquery.SchemaField("count", "INTEGER", mode="REQUIRED")
+            ],
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        )
 
-        j_issue = self.load_bigquery_from_gcs(
-            bq_client, github_issue_pr_uri, github_pr_issue_table_id,
-            github_issue_pr_job_config)
+        maven_download_job_config = bigquery.LoadJobConfig(
+            schema=[
+                bigquery.SchemaField("artifact", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("date", "DATE", mode="REQUIRED"),
+                bigquery.SchemaField("month", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("downloads", "INTEGER", mode="REQUIRED"),
+                bigquery.SchemaField("uniques", "INTEGER", mode="REQUIRED")
+            ],
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        )
 
-        j_docker = self.load_bigquery_from_gcs(
-            bq_client, dockerhub_image_uri, dockerhub_image_table_id,
-            dockerhub_image_job_config)
+        go_module_job_config = bigquery.LoadJobConfig(
+            schema=[
+                bigquery.SchemaField("module", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("date", "DATE", mode="REQUIRED"),
+                bigquery.SchemaField("version_count", "INTEGER", mode="REQUIRED"),
+                bigquery.SchemaField("latest_version", "STRING", mode="NULLABLE"),
+                bigquery.SchemaField("latest_time", "TIMESTAMP", mode="NULLABLE")
+            ],
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        )
 
-        for job in (j_clone, j_rel, j_docker, j_issue):
-            try:
-                job.result()
-            except:
-                print(f"[ERROR] { datetime.datetime.now() } "
-                      f"Failed during data loading to BigQuery: { job.errors }")
+        # record key: (table_id, job_config)
+        tables = {
+            'github_clone': (github_clone_table_id, github_clone_job_config),
+            'github_release': (
+                github_release_table_id, github_release_job_config),
+            'github_release_delta': (
+                github_release_delta_table_id, github_release_job_config),
+            'github_issue_pr': (
+                github_pr_issue_table_id, github_issue_pr_job_config),
+            'dockerhub_image': (
+                dockerhub_image_table_id, dockerhub_image_job_config),
+            'dockerhub_tag': (dockerhub_tag_table_id, dockerhub_tag_job_config),
+            'aliyunoss_download': (
+                aliyunoss_download_table_id, aliyunoss_download_job_config),
+            'pypi_download': (
+                pypi_download_table_id, pypi_download_job_config),
+            'maven_download': (
+                maven_download_table_id, maven_download_job_config),
+            'go_module': (go_module_table_id, go_module_job_config),
+        }
+
+        with self.metrics.span("load"):
+            print(f"[INFO] { datetime.datetime.now() } "
+                  f"Started data loading to BigQuery")
+
+            # (table_id, job) of the record files
+            jobs = []
+            if objects is None:
+                # only the records archived are loaded, sources not
+                # configured and the release snapshot not kept have none
+                archived = {blob.name.split("/")[-1]
+                    for blob in self.s_client.list_blobs(
+                        self.bucket, prefix=f"{ record_folder }/")
+                    if blob.name.count("/") == record_folder.count("/") + 1}
+                for record_key, (table_id, job_config) in tables.items():
+                    if GCS_RECORD_NAME[record_key] not in archived:
+                        continue
+                    jobs.append((table_id, self.load_bigquery_from_gcs(
+                        bq_client,
+                        f"{ URI_PREFIX }/{ GCS_RECORD_NAME[record_key] }",
+                        table_id, job_config)))
+            else:
+                # the table of an object is the one of its name, whatever
+                # the conf was when it was archived
+                record_keys = {record_name: record_key
+                    for record_key, record_name in GCS_RECORD_NAME.items()}
+                routed = []
+                for object_name, rows_by_date in sorted(objects.items()):
+                    record_name = object_name.split("/")[-1]
+                    record_key = record_keys.get(record_name[:-3]
+                        if record_name.endswith(".gz") else record_name)
+                    if record_key in tables:
+                        routed.append((object_name, rows_by_date, record_key))
+                # a partition decorator is refused by a table not partitioned
+                unpartitioned = sorted({tables[record_key][0]
+                    for _, _, record_key in routed
+                    if not bq_client.get_table(
+                        tables[record_key][0]).time_partitioning})
+                if unpartitioned:
+                    raise ValueError(
+                        f"{ unpartitioned } are not partitioned by day, "
+                        f"see the migration of bigquery/README.md")
+                for object_name, rows_by_date, record_key in routed:
+                    table_id, job_config = tables[record_key]
+                    job_config.write_disposition = \
+                        bigquery.WriteDisposition.WRITE_TRUNCATE
+                    jobs.extend((table_id, job)
+                        for job in self.load_partitions(
+                            bq_client, object_name, rows_by_date, table_id,
+                            job_config))
+
+            for table_id, job in jobs:
+                try:
+                    job.result()
+                except Exception as e:
+                    print(f"[ERROR] { datetime.datetime.now() } "
+                          f"Failed during data loading to { table_id }: "
+                          f"{ job.errors or e }")
+                    self.metrics.record_skip(table_id, f"load { e }")
 
 
 def data_fetch(event, context):
@@ -590,48 +2509,218 @@ def data_fetch(event, context):
     """
     # pubsub_message = base64.b64decode(event['data']).decode('utf-8')
 
-    dafa_fetcher = DataFetcher()
+    # debug in CLI:
+    # DATA=$(printf '{"metrics_true": "true", "debug_true": "true"}' | base64)
+    # gcloud functions call Data-Fetching-0 --data '{"data":"$DATA"}'
+
+    # measure cold start only, after a redeploy or a long idle:
+    # DATA=$(printf '{"coldstart_true": "true"}' | base64)
 
-    dafa_fetcher.get_data()
+    # sharded run, coordinator publishes worker tasks, the last worker done
+    # merges the shards and loads them, merge could also be forced:
+    # DATA=$(printf '{"mode": "merge", "run_date": "2021-04-21"}' | base64)
 
-    record_folder = dafa_fetcher.archive_data()
+    # records archived already are loaded again, nothing is fetched:
+    # DATA=$(printf '{"mode": "reload", "reload_left": "2021-04-01", "reload_right": "2021-04-21"}' | base64)
+
+    dafa_fetcher = DataFetcher()
+    # a cold instance has spent part of the timeout on its imports already
+    dafa_fetcher.deadline = Deadline.from_conf(
+        dafa_fetcher.conf, started_at=IMPORT_STARTED_AT
+            if dafa_fetcher.metrics.cold else None)
+    archive_metrics = bool(dafa_fetcher.conf.get("metrics_archive", False))
+    cold_start_only = False
+    sharding = dafa_fetcher.conf.get("sharding", {})
+    mode = "coordinator" if sharding.get("enabled") else None
+    payload = {}
+    if 'data' in event:
+        decoded_data = base64.b64decode(event['data']).decode('utf-8')
+        if decoded_data and isinstance(json.loads(decoded_data), dict):
+            payload = json.loads(decoded_data)
+            archive_metrics = bool(
+                payload.get("metrics_true", False)) or archive_metrics
+            cold_start_only = bool(payload.get("coldstart_true", False))
+            mode = payload.get("mode", mode)
+            global DEBUG
+            DEBUG = bool(payload.get("debug_true", DEBUG))
+
+    if cold_start_only:
+        # conf download above is the first request of the run
+        print(json.dumps({"cold_start": dafa_fetcher.metrics.cold_start()}))
+        return
+
+    if payload.get("run_date"):
+        dafa_fetcher.run_date = datetime.datetime.strptime(
+            payload["run_date"], '%Y-%m-%d').date()
+
+    if mode == "reload":
+        dafa_fetcher.reload_data(
+            payload["reload_left"],
+            payload.get("reload_right", payload["reload_left"]))
+        dafa_fetcher.report_metrics()
+        return
+
+    if mode == "coordinator":
+        shard_queue = LocalQueue() if sharding.get("queue") == "local" \
+            else PubSubQueue(sharding.get("topic", SHARD_TOPIC))
+        dafa_fetcher.coordinate(shard_queue, message={
+            key: payload[key] for key in ("metrics_true", "debug_true")
+            if key in payload})
+        dafa_fetcher.report_metrics(
+            dafa_fetcher.get_shard_folder() if archive_metrics else None)
+        return
+
+    if mode == "worker":
+        shard_folder = dafa_fetcher.run_shard(payload["shard"])
+        if not dafa_fetcher.claim_merge():
+            dafa_fetcher.report_metrics(
+                shard_folder if archive_metrics else None)
+            return
+
+    if mode in ("worker", "merge"):
+        record_folder = dafa_fetcher.merge_shards()
+    else:
+        record_folder = dafa_fetcher.collect()
 
     dafa_fetcher.load_data(record_folder)
 
+    dafa_fetcher.report_metrics(record_folder if archive_metrics else None)
+
+
+def compact(event, context):
+    """Triggered from a message on a Cloud Pub/Sub topic, monthly.
+    Compacts the daily records of a month, the last one unless given:
+    DATA=$(printf '{"month": "2021-04", "prune_true": "true"}' | base64)
+    gcloud functions call Data-Fetching-0-Compact --data '{"data":"$DATA"}'
+    """
+    dafa_fetcher = DataFetcher()
+    payload = {}
+    if 'data' in event:
+        decoded_data = base64.b64decode(event['data']).decode('utf-8')
+        if decoded_data and isinstance(json.loads(decoded_data), dict):
+            payload = json.loads(decoded_data)
+    month = payload.get("month") or dafa_fetcher.get_last_month()
+    dafa_fetcher.compact_month(
+        month, prune=bool(payload.get("prune_true", False)))
+    dafa_fetcher.report_metrics()
+
 
 class DockerHubClient:
     """ Wrapper to communicate with docker hub API """
-    def __init__(self, auth_token=None):
-        self.config = {'auth_token': auth_token}
-        self.auth_token = self.config.get('auth_token')
-
-    def do_request(self, url, method='GET', data={}):
+    def __init__(self, auth_token=None, session=None,
+            base_url=DOCKER_HUB_API_ENDPOINT):
+        self.auth_token = auth_token
+        self.session = session or requests.Session()
+        self.base_url = base_url.rstrip('/') + '/'
+        self.concurrency = AdaptiveLimit(DH_HOST_CONCURRENCY)
+        # once a rate limit is spent, no request is sent before its reset
+        self.lock = threading.Lock()
+        self.paused_until = 0
+        # on_sleep(url, seconds) of the waits, for the metrics of the run
+        self.on_sleep = None
+
+    def sleep(self, url, seconds):
+        if self.on_sleep:
+            self.on_sleep(url, seconds)
+        time.sleep(seconds)
+
+    @staticmethod
+    def rate_limit_reset(resp):
+        """epoch of the reset of a spent X-RateLimit, None if not spent"""
+        reset = resp.headers.get('X-RateLimit-Reset', '')
+        if resp.headers.get('X-RateLimit-Remaining') == '0' and reset.isdigit():
+            return int(reset)
+        return None
+
+    def retry_delay(self, resp, attempt):
+        """
+        seconds to wait before retrying, as told by Retry-After or by the
+        reset of a spent rate limit, else exponential backoff with jitter
+        """
+        if resp is not None:
+            retry_after = resp.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return int(retry_after)
+            if retry_after:
+                try:
+                    return max(0, email.utils.parsedate_to_datetime(
+                        retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+            reset = self.rate_limit_reset(resp)
+            if reset:
+                return max(0, reset - time.time())
+        return random.uniform(0, min(DH_BACKOFF_MAX, DH_BACKOFF * 2 ** attempt))
+
+    def do_request(self, url, method='GET', data=None):
+        """
+        Response as {'content': ..., 'code': ...}, with 'error' when the
+        code is not 200. Throttled (429, 503), failed (5xx) and unanswered
+        requests are retried up to DH_RETRY times, within the adaptive
+        concurrency limit, the session must not retry them too.
+        """
+        if data is None:
+            data = {}
         valid_methods = ['GET', 'POST']
         if method not in valid_methods:
             raise ValueError('Invalid HTTP request method')
         headers = {'Content-type': 'application/json'}
         if self.auth_token:
             headers['Authorization'] = 'JWT ' + self.auth_token
-        request_method = getattr(requests, method.lower())
+        request_method = getattr(self.session, method.lower())
         if len(data) > 0:
             data = json.dumps(data, indent=2, sort_keys=True)
-            resp = request_method(url, data, headers=headers)
-        else:
-            resp = request_method(url, headers=headers)
-        content = {}
-        if resp.status_code == 200:
-            content = json.loads(resp.content.decode())
-        return {'content': content, 'code': resp.status_code}
-
-    def login(self, username=None, password=None, save_config=True):
+        resp, error = None, None
+        for attempt in range(DH_RETRY):
+            pause = self.paused_until - time.time()
+            if pause > 0:
+                self.sleep(url, pause)
+            try:
+                with self.concurrency.slot():
+                    if data:
+                        resp = request_method(
+                            url, data, headers=headers, timeout=HTTP_TIMEOUT)
+                    else:
+                        resp = request_method(
+                            url, headers=headers, timeout=HTTP_TIMEOUT)
+            except requests.RequestException as e:
+                resp, error = None, repr(e)
+            else:
+                reset = self.rate_limit_reset(resp)
+                if reset:
+                    with self.lock:
+                        self.paused_until = max(self.paused_until,
+                            min(reset, time.time() + DH_WAIT_MAX))
+                if resp.status_code not in DH_RETRY_STATUS:
+                    self.concurrency.on_success()
+                    break
+                if resp.status_code == 429:
+                    self.concurrency.on_throttle()
+            if attempt == DH_RETRY - 1:
+                break
+            delay = self.retry_delay(resp, attempt)
+            if delay > DH_WAIT_MAX:
+                break  # would not be back in time for this run
+            print(f"[WARN] { datetime.datetime.now() } "
+                  f"{ resp.status_code if resp is not None else error } "
+                  f"from { url }, retrying in { delay:.1f}s")
+            self.sleep(url, delay)
+        if resp is None:
+            return {'content': {}, 'code': None, 'error': error}
+        if resp.status_code != 200:
+            return {'content': {}, 'code': resp.status_code,
+                    'error': resp.text[:200]}
+        return {'content': json.loads(resp.content.decode()),
+                'code': resp.status_code}
+
+    def login(self, username=None, password=None):
+        """the token of the login is kept by the instance, see get_token()"""
         data = {'username': username, 'password': password}
         self.auth_token = None
-        resp = self.do_request(DOCKER_HUB_API_ENDPOINT + 'users/login/',
+        resp = self.do_request(self.base_url + 'users/login/',
                                'POST', data)
         if resp['code'] == 200:
             self.auth_token = resp['content']['token']
-            if save_config:
-                self.config.set('auth_token', self.auth_token)
         return resp['code'] == 200
 
     def get_token(self):
@@ -639,19 +2728,43 @@ class DockerHubClient:
 
     def get_repos(self, org, page=1, per_page=PER_PAGE):
         url = '{0}repositories/{1}/?page={2}&page_size={3}'. \
-               format(DOCKER_HUB_API_ENDPOINT, org, page, per_page)
+               format(self.base_url, org, page, per_page)
         return self.do_request(url)
 
     def get_tags(self, org, repo, page=1, per_page=PER_PAGE):
         url = '{0}repositories/{1}/{2}/tags?page={3}&page_size={4}'. \
-               format(DOCKER_HUB_API_ENDPOINT, org, repo, page, per_page)
+               format(self.base_url, org, repo, page, per_page)
         return self.do_request(url)
 
     def get_users(self, username):
-        url = '{0}users/{1}'.format(DOCKER_HUB_API_ENDPOINT, username)
+        url = '{0}users/{1}'.format(self.base_url, username)
         return self.do_request(url)
 
     def get_buildhistory(self, org, repo, page=1, per_page=PER_PAGE):
         url = '{0}repositories/{1}/{2}/buildhistory?page={3}&page_size={4}'. \
-                format(DOCKER_HUB_API_ENDPOINT, org, repo, page, per_page)
+                format(self.base_url, org, repo, page, per_page)
         return self.do_request(url)
+
+
+# end of the import of main.py, see Metrics.cold_start()
+IMPORTED_AT = time.perf_counter()
+Metrics.imported = (IMPORT_STARTED_AT, IMPORTED_AT)
+
+
+if __name__ == "__main__":
+    # local runs, with the credentials of `gcloud auth application-default
+    # login`, through the entry points and their payloads:
+    # python main.py reload 2021-04-01 2021-04-21
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    reload_parser = subparsers.add_parser(
+        "reload", help="load records/<date>/ folders again, fetching nothing")
+    reload_parser.add_argument("left")
+    reload_parser.add_argument("right", nargs="?")
+    args = parser.parse_args()
+    payload = {"mode": "reload", "reload_left": args.left,
+               "reload_right": args.right or args.left}
+    data_fetch({"data": base64.b64encode(
+        json.dumps(payload).encode("utf-8"))}, None)
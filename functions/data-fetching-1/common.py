@@ -0,0 +1,345 @@
+"""
+Runtime shared by the data fetching functions: lazy imports, the metrics of
+a run, the clients and conf kept by an instance, and the retry policy of the
+GitHub calls.
+
+A Cloud Function is deployed from its own folder only, so this file is
+copied into the folder of each function, functions/common/common.py is the
+one to edit, see "Shared code" in README.md.
+"""
+
+import contextlib
+import datetime
+import importlib
+import json
+import random
+import threading
+import time
+
+from urllib.parse import urlparse
+
+
+class _LazyImport:
+    """
+    Module imported on first attribute access, so that an instance doesn't
+    pay for the client libraries before (or unless) the run uses them.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            started_at = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            LAZY_IMPORT_SECONDS[self._name] = round(
+                time.perf_counter() - started_at, 3)
+        return getattr(self._module, attr)
+
+
+LAZY_IMPORT_SECONDS = {}
+gcloud_exceptions = _LazyImport("google.cloud.exceptions")
+github = _LazyImport("github")
+requests = _LazyImport("requests")
+
+# retries of the GitHub calls, see RetryPolicy, on top of the retries of 500,
+# 502 and 504 done by the client itself
+GH_RETRY = 3
+GH_BACKOFF = 2
+GH_BACKOFF_MAX = 60
+# an endpoint failing this many calls in a row is cut off for the cooldown
+GH_BREAKER_FAILURES = 5
+GH_BREAKER_COOLDOWN = 300
+GH_RETRY_STATUS = (500, 502, 503, 504)
+
+
+class Metrics:
+    """
+    Timing spans of the run stages and counters of the requests sent per
+    endpoint, summarized as one JSON document at the end of the run.
+    """
+    # only the first run of an instance pays the cold start
+    cold = True
+    # perf_counter() when main.py started and ended being imported, set by
+    # main.py, see cold_start()
+    imported = None
+    # profiler of the invocation running, if any, it samples the peak memory
+    # of the spans
+    profiler = None
+
+    def __init__(self, endpoint_patterns=()):
+        # (path pattern, name) of the endpoints, see endpoint_name()
+        self.endpoint_patterns = endpoint_patterns
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.perf_started_at = time.perf_counter()
+        self.spans = []
+        self.endpoints = {}
+        self.first_request_at = None
+        self.skipped = []
+        # rows of the sources skipped as malformed, by source
+        self.bad_rows = {}
+        self.cold = Metrics.cold
+        Metrics.cold = False
+
+    @contextlib.contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        error = None
+        profiler = Metrics.profiler
+        token = profiler.enter() if profiler else None
+        try:
+            yield
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            span = dict(
+                name=name,
+                start=round(start - self.perf_started_at, 3),
+                seconds=round(time.perf_counter() - start, 3),
+                **labels)
+            if error:
+                span["error"] = error
+            if profiler:
+                span["peak_rss_mb"] = profiler.leave(token, span)
+            with self.lock:
+                self.spans.append(span)
+
+    def endpoint(self, name):
+        return self.endpoints.setdefault(name, {
+            "requests": 0, "status": {}, "bytes": 0, "retries": 0,
+            "sleep_seconds": 0, "rate_remaining": None})
+
+    def record_request(self, name, status=None, nbytes=0, retries=0,
+            rate_remaining=None):
+        with self.lock:
+            if self.first_request_at is None:
+                self.first_request_at = time.perf_counter()
+            endpoint = self.endpoint(name)
+            endpoint["requests"] += 1
+            status = str(status)
+            endpoint["status"][status] = endpoint["status"].get(status, 0) + 1
+            endpoint["bytes"] += nbytes
+            endpoint["retries"] += retries
+            if rate_remaining is not None:
+                endpoint["rate_remaining"] = int(rate_remaining)
+
+    def record_skip(self, work, reason, priority=0):
+        with self.lock:
+            self.skipped.append(
+                {"work": work, "reason": reason, "priority": priority})
+
+    def record_bad_rows(self, source, count):
+        with self.lock:
+            self.bad_rows[source] = self.bad_rows.get(source, 0) + count
+
+    def record_sleep(self, name, seconds):
+        with self.lock:
+            self.endpoint(name)["sleep_seconds"] += seconds
+
+    def endpoint_name(self, url):
+        url = urlparse(url)
+        for pattern, endpoint_name in self.endpoint_patterns:
+            if pattern.search(url.path):
+                return endpoint_name
+        return url.netloc
+
+    def on_response(self, response, *args, **kwargs):
+        """response hook of requests sessions"""
+        name = self.endpoint_name(response.url)
+        retries = getattr(response.raw, "retries", None)
+        nbytes = response.headers.get("Content-Length")
+        self.record_request(
+            name, status=response.status_code,
+            nbytes=int(nbytes) if nbytes else len(response.content),
+            retries=len(retries.history) if retries else 0,
+            rate_remaining=response.headers.get("X-RateLimit-Remaining"))
+
+    def summary(self):
+        with self.lock:
+            stages = {}
+            for span in self.spans:
+                stage = stages.setdefault(
+                    span["name"], {"count": 0, "seconds": 0})
+                stage["count"] += 1
+                stage["seconds"] = round(stage["seconds"] + span["seconds"], 3)
+            return {
+                "started_at": str(datetime.datetime.fromtimestamp(
+                    self.started_at)),
+                "seconds": round(time.time() - self.started_at, 3),
+                "cold_start": self.cold_start(),
+                "stages": stages,
+                "endpoints": self.endpoints,
+                "skipped": list(self.skipped),
+                "bad_rows": dict(self.bad_rows),
+                "spans": list(self.spans)}
+
+    def cold_start(self):
+        """
+        Import time of main.py and of the libraries imported lazily so far,
+        and the time from the start of the run (from the import of main.py
+        on a cold instance) until the first request was done.
+        """
+        import_started_at, imported_at = Metrics.imported
+        origin = import_started_at if self.cold else self.perf_started_at
+        first_request_at = self.first_request_at
+        return {
+            "cold": self.cold,
+            "import_seconds": round(imported_at - import_started_at, 3),
+            "lazy_import_seconds": dict(LAZY_IMPORT_SECONDS),
+            "first_request_seconds": round(first_request_at - origin, 3)
+                if first_request_at else None}
+
+
+# clients kept by a warm instance across invocations, see get_client()
+CLIENTS = {}
+# reentrant, new_client() may get the clients it is built on
+CLIENTS_LOCK = threading.RLock()
+
+
+def get_client(key, new_client):
+    """client of the instance for key, created by new_client() on first use"""
+    with CLIENTS_LOCK:
+        if key not in CLIENTS:
+            CLIENTS[key] = new_client()
+        return CLIENTS[key]
+
+
+class ConfCache:
+    """
+    Conf file kept by the instance, re-downloaded only when its generation
+    changed: the check is a conditional download, answered by a bodiless
+    304 while the file is unchanged.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.generation = None
+        self.data = None
+
+    def get(self, bucket, metrics):
+        with self.lock:
+            blob = bucket.blob(self.name)
+            try:
+                if self.generation:
+                    data = blob.download_as_bytes(
+                        if_generation_not_match=self.generation)
+                else:
+                    data = blob.download_as_bytes()
+            except gcloud_exceptions.NotModified:
+                metrics.record_request("gcs:conf", status=304)
+            else:
+                metrics.record_request(
+                    "gcs:conf", status=200, nbytes=len(data))
+                self.data = json.loads(data)
+                self.generation = blob.generation
+            # copied, a run never changes the conf of the next ones
+            return json.loads(json.dumps(self.data))
+
+
+CONF_CACHE = ConfCache('conf/config.json')
+
+
+class CircuitBreaker:
+    """
+    Open after `failures` failed calls in a row, an open breaker rejects
+    calls until `cooldown` seconds passed, then lets one call through: its
+    success closes the breaker, its failure opens it again.
+    """
+    def __init__(self, failures=GH_BREAKER_FAILURES,
+            cooldown=GH_BREAKER_COOLDOWN):
+        self.lock = threading.Lock()
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial \
+                    or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.trial = True
+            return True
+
+    def on_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+
+class RetryPolicy:
+    """
+    Retries of API calls shared by the collectors of a run. Errors are
+    classified as fatal (not retried, like 404 or 451), rate limits (retried
+    once the limit resets) or retryable (server errors and timeouts, retried
+    with exponential backoff and jitter). A call is tried `attempts` times
+    at most, and one circuit breaker per endpoint cuts off an API that
+    keeps failing.
+    """
+    FATAL = "fatal"
+    RATE_LIMIT = "rate_limit"
+    RETRY = "retry"
+
+    def __init__(self, attempts=GH_RETRY, backoff=GH_BACKOFF,
+            backoff_max=GH_BACKOFF_MAX, retry_status=GH_RETRY_STATUS):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retry_status = retry_status
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def breaker(self, endpoint):
+        with self.lock:
+            return self.breakers.setdefault(endpoint, CircuitBreaker())
+
+    def classify(self, e):
+        if isinstance(e, github.RateLimitExceededException) \
+                or self.rate_limited(e):
+            return self.RATE_LIMIT
+        if isinstance(e, github.GithubException):
+            return self.RETRY if e.status in self.retry_status else self.FATAL
+        if isinstance(e, requests.RequestException):
+            return self.RETRY
+        return self.FATAL
+
+    @staticmethod
+    def message(e):
+        """message of a GitHub error, its body is a str or None for HTML 5xx"""
+        data = getattr(e, "data", None)
+        if isinstance(data, dict):
+            return str(data.get("message", ""))
+        return str(data or "")
+
+    def rate_limited(self, e):
+        """
+        403 or 429 of a primary or secondary rate limit, PyGithub doesn't
+        raise RateLimitExceeded for all of them. Other 403s ("Resource not
+        accessible by integration") are fatal.
+        """
+        status = getattr(e, "status", None)
+        if status == 429:
+            return True
+        if status != 403:
+            return False
+        headers = getattr(e, "headers", None) or {}
+        return "retry-after" in headers \
+            or headers.get("x-ratelimit-remaining") == "0" \
+            or "rate limit" in self.message(e).lower()
+
+    def delay(self, attempt):
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff * 2 ** attempt))
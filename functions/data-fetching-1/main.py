@@ -63,31 +63,59 @@ In a closer look, it should be like this, where Google Cloud Storage is involved
 """
 
 
+import time
+
+# cold start of an instance is measured from here, see Metrics.cold_start()
+IMPORT_STARTED_AT = time.perf_counter()
+
+import atexit
 import base64
+import calendar
+import collections
+import concurrent.futures
 import datetime
+import hashlib
+import hmac
 import json
-import pprint
-import requests
+import os
+import sys
+import threading
+
+from urllib.parse import parse_qs
 
-from google.cloud import storage, bigquery
+# vendored copy of functions/common/common.py, see "Shared code" in README.md
+from common import (
+    _LazyImport, gcloud_exceptions, github, requests, Metrics, get_client,
+    CONF_CACHE, RetryPolicy)
 
-from github import Github, RateLimitExceededException, GithubException
-from urllib3 import Retry
+storage = _LazyImport("google.cloud.storage")
+bigquery = _LazyImport("google.cloud.bigquery")
+pprint = _LazyImport("pprint")
+cProfile = _LazyImport("cProfile")
+marshal = _LazyImport("marshal")
+pstats = _LazyImport("pstats")
+resource = _LazyImport("resource")
+urllib3 = _LazyImport("urllib3")
 
-from urllib.parse import urlparse, parse_qs
 
+# conf "github_base_url" overrides it, to point the function at GitHub
+# Enterprise or a local stand-in server
+GITHUB_API_ENDPOINT = "https://api.github.com"
 
 BUCKET = "nebula-insights"
 GCS_RECORD_NAME = {
     "all_external_contributors": "all_external_contributors.json",
     "new_contributors": "new_contributors.json",
-    "internal_contributors": "internal_contributors.json"
+    "internal_contributors": "internal_contributors.json",
+    "github_activity": "github_activity_snapshot.json",
+    "github_event": "github_event_stats.json"
 }
 
 GCP_PROJECT = "nebula-insights"
 BQ_DATASET = "nebula_insights"
 BQ_TABLE_NAME = {
-    "github_contributors": "github_contributor_records"
+    "github_contributors": "github_contributor_records",
+    "github_event": "github_event_records"
 }
 GCP_LOCATION = "asia-east2"
 
@@ -113,13 +141,426 @@ CREATED_CLOSED_TEMPLATE = "repo:{org}/{repo} is:issue is:closed closed:{left}..{
 
 REPORT_REPO = "nebula-community"
 
+# search API has its own quota: 30 requests/min, max 1000 results per query
+SEARCH_PER_PAGE = 100
+SEARCH_MAX_RESULTS = 1000
+# secondary rate limit without Retry-After, wait at least one minute
+SEARCH_DEFAULT_BACKOFF = 60
+
+# data-fetching-0 archives its metrics as records/<date>/_metrics.json
+METRICS_RECORD_NAME = "_report_metrics.json"
+
+# profiles of invocations with "profile_true" go to records/<date>/_profiles/
+PROFILE_FOLDER = "_profiles"
+# stacks of every thread and resident memory are sampled this often
+PROFILE_INTERVAL = 0.01
+
+# webhook events kept by an instance are flushed to records/<date>/_events/
+# by micro-batches of this many events, or once the oldest is this old, conf
+# "webhook" overrides both
+WEBHOOK_EVENTS = ("pull_request", "issues", "release")
+WEBHOOK_FOLDER = "_events"
+WEBHOOK_BATCH_SIZE = 50
+WEBHOOK_BATCH_SECONDS = 300
+# GitHub keeps the deliveries of a hook for 3 days, older windows are searched
+WEBHOOK_DELIVERY_DAYS = 3
+
+# events feeds polled with If-None-Match, their cursors are kept in the state
+EVENTS_FEED_STATE_NAME = "state/github_events.json"
+EVENTS_FEED_TYPES = {
+    "PullRequestEvent": "pull_request",
+    "IssuesEvent": "issues",
+    "ReleaseEvent": "release",
+    "PushEvent": "push"
+}
+EVENTS_FEED_PER_PAGE = 100
+# GitHub tells events can show up in the feeds up to 6 hours late
+EVENTS_FEED_LAG_HOURS = 6
+
+
+class Profiler:
+    """
+    Profiler of a whole invocation: stacks of every thread are sampled into
+    collapsed stacks, one "frame;frame count" line per stack as read by
+    flamegraph.pl or speedscope, with the resident memory, for the peak of
+    each metrics span. The deterministic mode runs cProfile in every thread
+    as well.
+    """
+    def __init__(self, mode="sampling", interval=PROFILE_INTERVAL):
+        self.mode = mode
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.peak_rss = 0
+        self.active = {}
+        self.phases = []
+        self.profiles = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        if self.mode == "deterministic":
+            self.profile_thread()
+            # cProfile only sees its own thread before python 3.12, threads
+            # started from now on enable their own
+            if sys.version_info < (3, 12):
+                threading.setprofile(self.profile_thread)
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        if self.mode == "deterministic":
+            threading.setprofile(None)
+            self.profiles[0].disable()
+
+    def profile_thread(self, *args):
+        """replaced by the profiler it enables, on the first call"""
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        rss = get_rss()
+        frames = sys._current_frames()
+        with self.lock:
+            self.samples += 1
+            self.peak_rss = max(self.peak_rss, rss)
+            for token, peak in self.active.items():
+                self.active[token] = max(peak, rss)
+            for thread_id, frame in frames.items():
+                if thread_id == self.thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{ code.co_name } ({ os.path.basename(code.co_filename) }"
+                        f":{ code.co_firstlineno })")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def enter(self):
+        token = object()
+        rss = get_rss()
+        with self.lock:
+            self.active[token] = rss
+        return token
+
+    def leave(self, token, span):
+        """peak resident memory of the span in MB"""
+        rss = get_rss()
+        with self.lock:
+            peak = round(max(self.active.pop(token), rss) / (1 << 20), 1)
+            self.phases.append(dict(span, peak_rss_mb=peak))
+        return peak
+
+    def folded(self):
+        return "\n".join(
+            f"{ stack } { count }" for stack, count in sorted(
+                self.stacks.items(), key=lambda item: -item[1]))
+
+    def summary(self, limit=30):
+        """phases with their peak memory, and functions by samples"""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return {
+            "mode": self.mode,
+            "interval": self.interval,
+            "samples": self.samples,
+            "peak_rss_mb": round(self.peak_rss / (1 << 20), 1),
+            "phases": self.phases,
+            "own_samples": own.most_common(limit),
+            "total_samples": total.most_common(limit)}
+
+    def pstats(self):
+        """cProfile stats of all the threads, as written by dump_stats()"""
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+        return marshal.dumps(stats.stats)
+
+
+# profiler of the invocation running, see run_profiled()
+PROFILER = None
+
+
+def get_rss():
+    """resident memory of the process, its peak so far without /proc"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class CircuitOpenError(Exception):
+    """calls of an endpoint given up while its circuit breaker is open"""
+
+
+class SearchThrottle:
+    """
+    Token bucket pacing GitHub search API calls ahead of the limit, sized
+    from the search resource of /rate_limit. Rate limited responses (403
+    or 429, including secondary rate limits) block the bucket for their
+    Retry-After or until the search quota resets.
+    """
+    def __init__(self, gh, metrics):
+        self.gh = gh
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.capacity = 1
+        self.tokens = 0
+        self.refill_rate = 1 / 60.0
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0
+        self.sync()
+
+    def sync(self):
+        """size the bucket from the search quota left for this token"""
+        search = self.gh.get_rate_limit().search
+        reset_in = calendar.timegm(search.reset.timetuple()) - calendar.timegm(
+            time.gmtime())
+        with self.lock:
+            now = time.monotonic()
+            self.capacity = max(search.limit, 1)
+            self.refill_rate = self.capacity / 60.0
+            self.tokens = min(search.remaining, self.capacity)
+            self.updated_at = now
+            if search.remaining == 0 and reset_in > 0:
+                self.blocked_until = max(self.blocked_until, now + reset_in)
+
+    def acquire(self):
+        """block until a search request is allowed"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.refill_rate)
+                self.updated_at = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.refill_rate
+            self.metrics.record_sleep("github:search", wait)
+            time.sleep(wait)
+
+    def backoff(self, exception):
+        """
+        Block the bucket after a rate limited search response, returns the
+        sleep time in seconds
+        """
+        headers = getattr(exception, "headers", None) or {}
+        if headers.get("retry-after"):
+            sleep_time = int(headers["retry-after"])
+        elif headers.get("x-ratelimit-remaining") == "0" \
+                and headers.get("x-ratelimit-reset"):
+            sleep_time = int(headers["x-ratelimit-reset"]) - calendar.timegm(
+                time.gmtime()) + 1
+        else:
+            sleep_time = SEARCH_DEFAULT_BACKOFF
+        sleep_time = max(sleep_time, 1)
+        with self.lock:
+            self.tokens = 0
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + sleep_time)
+        return sleep_time
+
+
+class EventBuffer:
+    """
+    Webhook events held by the instance until a micro-batch is due: the
+    request adding the event which fills the batch, or any request finding
+    the oldest one old enough, takes the batch to flush it. A timer flushes
+    a batch old enough while no request comes, and the instance flushes
+    what is left when it shuts down.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.started_at = None
+        self.timer = None
+
+    def add(self, event, size=WEBHOOK_BATCH_SIZE,
+            seconds=WEBHOOK_BATCH_SECONDS):
+        """Returns the events to flush, none while the batch is not due"""
+        with self.lock:
+            if not self.events:
+                self.start(seconds)
+            self.events.append(event)
+            if len(self.events) < size \
+                    and time.monotonic() - self.started_at < seconds:
+                return []
+            return self.take()
+
+    def due(self, seconds=WEBHOOK_BATCH_SECONDS):
+        """Returns the events to flush if the batch is old enough"""
+        with self.lock:
+            if not self.events \
+                    or time.monotonic() - self.started_at < seconds:
+                return []
+            return self.take()
+
+    def drain(self):
+        """Returns all the events held, on shutdown"""
+        with self.lock:
+            return self.take()
+
+    def restore(self, events, seconds=WEBHOOK_BATCH_SECONDS):
+        """events of a failed flush go with the next batch"""
+        with self.lock:
+            if not self.events:
+                self.start(seconds)
+            self.events = events + self.events
+
+    def start(self, seconds):
+        # the lock is held
+        self.started_at = time.monotonic()
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(seconds, self.on_timer, (seconds,))
+        self.timer.daemon = True
+        self.timer.start()
+
+    def take(self):
+        # the lock is held
+        events = self.events
+        self.events = []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return events
+
+    def on_timer(self, seconds):
+        events = self.due(seconds)
+        if events:
+            flush_events(events, seconds=seconds)
+
+
+EVENT_BUFFER = EventBuffer()
+
+
+class RunContext:
+    """
+    Clients, conf and org listing shared by every DataFetcher of one run,
+    so that the weekly report and the daily fetch only build them once.
+    """
+    def __init__(self):
+        self.metrics = Metrics()
+        # clients and conf are created on first use, not to block cold start,
+        # and reused by the next invocations of a warm instance
+        self._conf = None
+        self._bucket = None
+        self._gh = None
+        self.org = None
+        self.repos = []
+        self.org_members = set()
+        self.report_repo = None
+        self.search_throttle = None
+        # since when the events feeds are complete, once polled
+        self.events_feed = None
+        self.github_retry = RetryPolicy()
+        # reentrant, the search throttle is built from the lazy gh client
+        self.lock = threading.RLock()
+
+    @property
+    def s_client(self):
+        return get_client("storage", storage.Client)
+
+    @property
+    def bucket(self):
+        """bucket() doesn't call the API to check the bucket as get_bucket()"""
+        if self._bucket is None:
+            self._bucket = self.s_client.bucket(BUCKET)
+        return self._bucket
+
+    @property
+    def conf(self):
+        if self._conf is None:
+            self._conf = dict()
+            self.parse_conf()
+        return self._conf
+
+    @property
+    def token(self):
+        return self.conf.get("github_token")
+
+    @property
+    def org_str(self):
+        return self.conf.get("github_orgnization", GH_ORG)
+
+    @property
+    def gh(self):
+        with self.lock:
+            if self._gh is None:
+                token = self.token
+                base_url = self.conf.get(
+                    "github_base_url", GITHUB_API_ENDPOINT).rstrip("/")
+                # 403 is left to SearchThrottle and RateLimitExceeded handlers
+                self._gh = get_client(
+                    ("github", token, base_url), lambda: github.Github(
+                        login_or_token=token, timeout=60, base_url=base_url,
+                        per_page=SEARCH_PER_PAGE, retry=urllib3.Retry(
+                            total=10, status_forcelist=(500, 502, 504),
+                            backoff_factor=0.3)))
+            return self._gh
+
+    def parse_conf(self):
+        """conf for data fetching policies config or fetching API credentials
+        ideally it's a file stored in Google Cloud Storage
+        """
+        self.conf.update(CONF_CACHE.get(self.bucket, self.metrics))
+
+    def list_org(self):
+        """
+        List public repos and members of the org once per run, the listing
+        is only fetched on first call. The weekly report and the daily fetch
+        call it from their threads, the other waits for the listing done.
+        """
+        with self.lock:
+            if self.org is not None:
+                return
+            with self.metrics.span("list_org"):
+                org = self.gh.get_organization(self.org_str)
+                repos = [repo for repo in org.get_repos() if not repo.private]
+                members = {member.id for member in org.get_members()}
+                for repo in repos:
+                    if repo.name == REPORT_REPO:
+                        self.report_repo = repo
+                self.repos = repos
+                # the set is shared with the DataFetchers of the run
+                self.org_members.update(members)
+                # set last, the listing is complete once it is
+                self.org = org
+
+    def get_search_throttle(self):
+        """search quota is per token, all phases of the run share one"""
+        with self.lock:
+            if self.search_throttle is None:
+                self.search_throttle = SearchThrottle(self.gh, self.metrics)
+            return self.search_throttle
+
 
 class DataFetcher:
     """
     Fetch Data from different sources and sink into datawarehouse.
     """
-    def __init__(self):
-        self.conf = dict()
+    def __init__(self, run_context=None):
+        self.run_context = run_context or RunContext()
         self.github_stats = dict()
         self.dockerhub_stats = dict()
         self.aliyunoss_stats = dict()
@@ -133,73 +574,365 @@ class DataFetcher:
         self.internal_pull_requests = {}
         self.open_issues = {}
         self.closed_issues = {}
+        self.merged_pull_requests = {}
+        # repos given up by the retry policy, left out of the snapshot
+        self.skipped_repos = set()
         self.report_body = []
-        self.org_members = set()
-        self.s_client = storage.Client()
-        self.bucket = self.s_client.get_bucket(BUCKET)
-        self.parse_conf()
+        self.metrics = self.run_context.metrics
+        self.org_members = self.run_context.org_members
         self.report_repo = None
 
-    def parse_conf(self):
-        """conf for data fetching policies config or fetching API credentials
-        ideally it's a file stored in Google Cloud Storage
-        """
-        blob = self.bucket.blob('conf/config.json')
-        data = json.loads(blob.download_as_string(client=None))
-        self.conf.update(data)
+    @property
+    def conf(self):
+        return self.run_context.conf
+
+    @property
+    def s_client(self):
+        return self.run_context.s_client
+
+    @property
+    def bucket(self):
+        return self.run_context.bucket
 
     def get_sink_credential(self):
         """credential if needed for sinking to big query"""
         pass
 
-    def get_github_sleep_time(self, g):
-        core_rate_limit = g.get_rate_limit().core
-        reset_timestamp = calendar.timegm(core_rate_limit.reset.timetuple())
-        sleep_time = reset_timestamp - calendar.timegm(
-            time.gmtime()) + 5  # add 5 sec to ensure the rate limit has been reset
-        return sleep_time
-
-    def get_data(self, left=None, right=None):
-        """from github API, dockerhub API, etc."""
+    def get_data(self, left=None, right=None, repo_names=None):
+        """from github API, dockerhub API, etc., all repos unless given"""
 
         print(f"[INFO] { datetime.datetime.now() } "
               f"Started fetching data from github")
         if left is None:
             left = str(self.get_yesterday())
             right = str(datetime.datetime.now().date())
-        self.get_data_from_github(left, right)
-
-    def get_data_from_github(self, left=None, right=None):
-
-        token = self.conf.get("github_token")
-        g = Github(login_or_token=token, timeout=60, retry=Retry(
-                total=10, status_forcelist=(403, 500, 502, 504),
-                backoff_factor=0.3))
-        org_str = self.conf.get("github_orgnization", GH_ORG)
-        org = g.get_organization(org_str)
-        repos = org.get_repos()
-        self.get_members(org)
-        for repo in repos:
-            if repo.private:
+        with self.metrics.span("get_data", left=left, right=right):
+            self.get_data_from_github(left, right, repo_names)
+
+    def get_data_from_github(self, left=None, right=None, repo_names=None):
+        ctx = self.run_context
+        ctx.list_org()
+        g = ctx.gh
+        org_str = ctx.org_str
+        self.report_repo = ctx.report_repo
+        webhook_events = self.get_webhook_events(left, right)
+        for repo in ctx.repos:
+            if repo.name in GH_REPO_EXCLUDE_LIST:
                 continue
-            repo_key = f"{ org.login }/{ repo.name }"
-            if repo.name == REPORT_REPO:
-                self.report_repo = repo
-            if repo.name not in GH_REPO_EXCLUDE_LIST:
-                self.get_github_contributors(g, org_str, repo, left, right,
-                    excluded_members=self.org_members)
-                self.get_issues(g, org_str, repo, left, right)
+            if repo_names is not None and repo.name not in repo_names:
+                continue
+            # searched without the webhook, or when it missed an event
+            events = None if webhook_events is None \
+                else webhook_events.get(repo.name, [])
+            merged_count = len(self.merged_pull_requests.get(repo.name, []))
+            try:
+                with self.metrics.span("github_repo", repo=repo.name):
+                    self.get_github_contributors(
+                        g, org_str, repo, left, right,
+                        excluded_members=self.org_members, events=events)
+                    self.get_issues(g, org_str, repo, left, right,
+                        events=events)
+            except (github.GithubException, requests.RequestException,
+                    CircuitOpenError) as e:
+                # given up by the retry policy, the other repos go on
+                print(f"[ERROR] { datetime.datetime.now() } "
+                      f"Skipping { repo.name }: { e }")
+                self.metrics.record_skip(repo.name, f"github { e }")
+                self.skipped_repos.add(repo.name)
+                # pull requests of the repo left half collected
+                self.external_pull_requests = {}
+                self.internal_pull_requests = {}
+                if isinstance(self.new_contributors.get(repo.name), list):
+                    del self.new_contributors[repo.name]
+                if repo.name in self.merged_pull_requests:
+                    del self.merged_pull_requests[repo.name][merged_count:]
         if not self.all_external_contributors:
             pass  # need to wire the notification here
 
-    def get_members(self, org):
-        members = org.get_members()
-        for member in members:
-            self.org_members.add(member.id)
+    def github_rest_request(self, endpoint, url, params=None, headers=None):
+        """GET of the endpoints not covered by PyGithub, 304 included"""
+        ctx = self.run_context
+        response = get_client("requests", requests.Session).get(
+            url, params=params, timeout=60, headers={
+                "Authorization": f"token { ctx.token }",
+                "Accept": "application/vnd.github+json",
+                **(headers or {})})
+        self.metrics.record_request(
+            f"github:{ endpoint }", status=response.status_code,
+            nbytes=len(response.content),
+            rate_remaining=response.headers.get("x-ratelimit-remaining"))
+        response.raise_for_status()
+        return response
+
+    def list_hook_deliveries(self, hook_id, since):
+        """deliveries of the org hook since the timestamp, newest first"""
+        ctx = self.run_context
+        base_url = self.conf.get(
+            "github_base_url", GITHUB_API_ENDPOINT).rstrip("/")
+        url = f"{ base_url }/orgs/{ ctx.org_str }/hooks/{ hook_id }"
+        if self.github_rest_request("hook", url).json()["created_at"] > since:
+            raise ValueError(f"hook { hook_id } is newer than { since }")
+        url = f"{ url }/deliveries"
+        params = {"per_page": 100}
+        while url:
+            response = self.github_rest_request("hook", url, params=params)
+            for delivery in response.json():
+                if delivery["delivered_at"] < since:
+                    return
+                yield delivery
+            # the cursor of the next page is in its link
+            url = response.links.get("next", {}).get("url")
+            params = None
+
+    def get_hook_deliveries(self, left):
+        """
+        Deliveries of the hook since left, None without conf "webhook" or
+        for a window older than the deliveries GitHub keeps or the hook.
+        """
+        hook_id = self.conf.get("webhook", {}).get("hook_id")
+        today = datetime.datetime.now().date()
+        if not hook_id or left < str(
+                today - datetime.timedelta(WEBHOOK_DELIVERY_DAYS - 1)):
+            return None
+        try:
+            with self.metrics.span("webhook_deliveries"):
+                return list(self.list_hook_deliveries(
+                    hook_id, f"{ left }T00:00:00Z"))
+        except (requests.RequestException, ValueError) as e:
+            print(f"[WARN] { datetime.datetime.now() } "
+                  f"Not using the webhook deliveries: { e }")
+            return None
+
+    def poll_events_feed(self):
+        """
+        Events of the feeds, polled once per run, see get_events_feed().
+        Returns since when each feed is complete, by feed name.
+        """
+        ctx = self.run_context
+        if "events_feed" not in self.conf:
+            return {}
+        with ctx.lock:
+            if ctx.events_feed is None:
+                with self.metrics.span("events_feed"):
+                    ctx.events_feed = self.get_events_feed()
+            return ctx.events_feed
+
+    def get_events_feed(self):
+        """
+        Poll the events of the org, and of conf "events_feed" repos, since
+        the cursor of the former poll, an unchanged feed is a 304 of
+        If-None-Match. New events are archived along the webhook events,
+        the cursors and ETags of the feeds are kept in the state file.
+        """
+        ctx = self.run_context
+        base_url = self.conf.get(
+            "github_base_url", GITHUB_API_ENDPOINT).rstrip("/")
+        feeds = {ctx.org_str: f"{ base_url }/orgs/{ ctx.org_str }/events"}
+        for repo_name in self.conf["events_feed"].get("repos", []):
+            feeds[f"{ ctx.org_str }/{ repo_name }"] = \
+                f"{ base_url }/repos/{ ctx.org_str }/{ repo_name }/events"
+        blob = self.bucket.blob(EVENTS_FEED_STATE_NAME)
+        try:
+            state = json.loads(blob.download_as_string(client=None))
+        except gcloud_exceptions.NotFound:
+            state = {}
+
+        events = {}
+        feeds_since = {}
+        for name, url in feeds.items():
+            try:
+                feed_events, state[name] = self.poll_feed(
+                    url, state.get(name, {}))
+            except requests.RequestException as e:
+                # the cursor is kept, and the repos are searched this time
+                print(f"[WARN] { datetime.datetime.now() } "
+                      f"Failed to poll the events of { name }: { e }")
+                feeds_since[name] = None
+                continue
+            feeds_since[name] = state[name].get("since")
+            # repo feeds overlap the org one
+            events.update((event["id"], event) for event in feed_events)
+        # oldest first, as received by the webhook
+        records = [feed_event(event) for event in sorted(
+                events.values(), key=lambda event: int(event["id"]))
+            if event["type"] in EVENTS_FEED_TYPES]
+        print(f"[INFO] { datetime.datetime.now() } "
+              f"{ len(records) } new events from { len(feeds) } feeds")
+        # the cursors move on once the events are archived
+        if records:
+            self.archive_events(records)
+        self.save_str_to_gcs_ascii(
+            bucket=self.bucket,
+            string_obj=json.dumps(state),
+            filename=EVENTS_FEED_STATE_NAME)
+        return feeds_since
+
+    def poll_feed(self, url, feed_state):
+        """
+        New events of a feed, newest first, and its next state: the ETag,
+        the cursor (id and time of the last event), the ids of the events
+        of the last EVENTS_FEED_LAG_HOURS, and since when the feed has no
+        gap, until the former cursor or for good.
+        """
+        headers = {}
+        if feed_state.get("etag"):
+            headers["If-None-Match"] = feed_state["etag"]
+        response = self.github_rest_request(
+            "events", url, params={"per_page": EVENTS_FEED_PER_PAGE},
+            headers=headers)
+        if response.status_code == 304:
+            return [], feed_state
+        etag = response.headers.get("ETag")
+        # events can show up late, the feed is read again since the cursor
+        # less the lag, skipping the events seen then
+        bound = feed_state.get("cursor_at") and event_lag(
+            feed_state["cursor_at"])
+        seen = set(feed_state.get("seen", []))
+        events = []
+        complete = False
+        while not complete:
+            for event in response.json():
+                if bound and event["created_at"] < bound:
+                    complete = True
+                    break
+                events.append(event)
+            url = response.links.get("next", {}).get("url")
+            if not url:
+                break
+            try:
+                response = self.github_rest_request("events", url)
+            except requests.HTTPError as e:
+                # only the last 300 events are paged, 422 beyond
+                if e.response is None or e.response.status_code != 422:
+                    raise
+                break
+        if not events:
+            return [], dict(feed_state, etag=etag)
+        latest = max(events, key=lambda event: event["created_at"])
+        since = feed_state.get("since") if complete else None
+        return [event for event in events if event["id"] not in seen], {
+            "etag": etag,
+            "cursor": latest["id"],
+            "cursor_at": latest["created_at"],
+            "seen": [event["id"] for event in events
+                if event["created_at"] >= event_lag(latest["created_at"])],
+            # a gap before the oldest event read otherwise
+            "since": since or min(event["created_at"] for event in events)}
+
+    def get_webhook_events(self, left, right):
+        """
+        Webhook and events feed events archived since left, by repo name, to
+        be used instead of searching: a repo of which the events can't be
+        told complete gets None, to be searched. They are complete for a
+        repo with a feed (its own or the org one) without gap since left, or
+        when no delivery of the hook is missing from the events (not
+        answered, or still buffered by the webhook instance).
+        Returns None when neither can tell.
+        """
+        ctx = self.run_context
+        since = f"{ left }T00:00:00Z"
+        feeds = self.poll_events_feed()
+        deliveries = self.get_hook_deliveries(left)
+        feed_repos = set()
+        for repo in ctx.repos:
+            feed_since = feeds.get(
+                f"{ ctx.org_str }/{ repo.name }", feeds.get(ctx.org_str))
+            if feed_since and feed_since <= since:
+                feed_repos.add(repo.name)
+        if deliveries is None and not feed_repos:
+            return None
+
+        # events of the window are archived by the day they were received
+        recorded = {}
+        today = datetime.datetime.now().date()
+        with self.metrics.span("load_webhook_events"):
+            for day in self.get_days(left, str(today)):
+                for blob in self.s_client.list_blobs(
+                        BUCKET, prefix=f"records/{ day }/{ WEBHOOK_FOLDER }/"):
+                    for line in blob.download_as_string(
+                            client=None).decode("utf-8").splitlines():
+                        event = json.loads(line)
+                        # redelivered events come with the same guid
+                        recorded[event["delivery"]] = event
+        webhook_events = {}
+        for event in sorted(
+                recorded.values(), key=lambda event: event["received_at"]):
+            webhook_events.setdefault(event["repo"], []).append(event)
+        if deliveries is None:
+            for repo in ctx.repos:
+                if repo.name not in feed_repos:
+                    webhook_events[repo.name] = None
+        else:
+            repo_names = {repo.id: repo.name for repo in ctx.repos}
+            for delivery in deliveries:
+                repo_name = repo_names.get(delivery.get("repository_id"))
+                if delivery["event"] in ("pull_request", "issues") \
+                        and delivery["guid"] not in recorded \
+                        and repo_name and repo_name not in feed_repos:
+                    webhook_events[repo_name] = None
+        missed = sorted(
+            name for name, events in webhook_events.items() if events is None)
+        print(f"[INFO] { datetime.datetime.now() } "
+              f"{ len(recorded) } events since { left }, "
+              f"searching { len(missed) } repos with missed events: { missed }")
+        return webhook_events
+
+    def search_issues(self, gh, query, sort, order):
+        """
+        Iterate search results page by page, every page request is paced by
+        the search throttle and retried by the retry policy of the run, the
+        last error is raised once a page is given up.
+        """
+        throttle = self.run_context.get_search_throttle()
+        policy = self.run_context.github_retry
+        breaker = policy.breaker("search")
+        results = gh.search_issues(query, sort, order)
+        page = 0
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError("github:search")
+            throttle.acquire()
+            try:
+                issues = results.get_page(page)
+                self.metrics.record_request(
+                    "github:search", status=200,
+                    rate_remaining=gh.rate_limiting[0])
+            except (github.GithubException, requests.RequestException) as e:
+                status = getattr(e, "status", type(e).__name__)
+                self.metrics.record_request(
+                    "github:search", status=status,
+                    rate_remaining=(getattr(e, "headers", None) or {}).get(
+                        "x-ratelimit-remaining"))
+                attempt += 1
+                kind = policy.classify(e)
+                if kind == policy.RETRY:
+                    breaker.on_failure()
+                if kind == policy.FATAL or attempt >= policy.attempts:
+                    raise
+                if kind == policy.RATE_LIMIT:
+                    sleep_time = throttle.backoff(e)
+                    print(f"[WARN] { datetime.datetime.now() } "
+                          f"Search rate limited, retry in { sleep_time } sec")
+                else:
+                    sleep_time = policy.delay(attempt)
+                    print(f"[WARN] { datetime.datetime.now() } "
+                          f"Search failed with { status }, "
+                          f"retry in { sleep_time:.1f} sec")
+                    self.metrics.record_sleep("github:search", sleep_time)
+                    time.sleep(sleep_time)
+                continue
+            breaker.on_success()
+            attempt = 0
+            yield from issues
+            page += 1
+            if len(issues) < SEARCH_PER_PAGE \
+                    or page * SEARCH_PER_PAGE >= SEARCH_MAX_RESULTS:
+                return
 
     def get_contributors(self, gh, orgName, repo, left, right,
             excluded_members=None):
-        merged_issue = iter(gh.search_issues(MERGED_TEMPLATE.format(
+        merged_issue = iter(self.search_issues(gh, MERGED_TEMPLATE.format(
                 org=orgName,
                 repo=repo.name,
                 left=left,
@@ -214,24 +947,16 @@ class DataFetcher:
                 issue = next(merged_issue)
                 if DEBUG:
                     print(f"[DEBUG] issue fetched: {issue}")
-                if excluded_members is None or issue.user.id not in excluded_members:
-                    self.external_pull_requests.setdefault(issue.user.login, set())
-                    self.external_pull_requests[issue.user.login].add(issue.html_url)
+                if self.add_merged_pull_request(
+                        repo, issue.user.login, issue.user.id, issue.html_url,
+                        str(issue.closed_at), excluded_members, contributors,
+                        contributor_count):
                     timeIndex = issue.created_at
-                    contributor_count[issue.user.login] = contributor_count.get(
-                        issue.user.login, 0) + 1
-                    if self.is_new_contributor(
-                            repo, issue.user.login, contributors,
-                            excluded_members, contributor_count):
-                        self.new_contributors[repo.name].append(issue.user.login)
                     if DEBUG:
                         print(f"[DEBUG] last issue created at: {timeIndex}")
-                else:
-                    self.internal_pull_requests.setdefault(issue.user.login, set())
-                    self.internal_pull_requests[issue.user.login].add(issue.html_url)
             except StopIteration:
                 if DEBUG:
-                    print(f"[DEBUG] exception StopIteration hit\n")
+                    print("[DEBUG] exception StopIteration hit\n")
                 if timeIndex and timeIndex >= datetime.datetime.strptime(
                         left, '%Y-%m-%d') \
                         and timeIndex < datetime.datetime.strptime(
@@ -246,12 +971,45 @@ class DataFetcher:
                     break
                 timeIndex = None
                 break  # loop end
-            except RateLimitExceededException:
-                sleep_time = self.get_github_sleep_time(gh)
-                if DEBUG:
-                    print(f"[DEBUG] RateLimitExceeded, sleep {sleep_time} sec")
-                time.sleep(sleep_time)
-                continue
+
+    def get_event_contributors(self, repo, events, left, right,
+            excluded_members=None):
+        """get_contributors() from the webhook events of the repo"""
+        merged_events = {}
+        for event in events:
+            if event["event"] == "pull_request" and event["merged"] \
+                    and left <= event_time(event["merged_at"])[:10] <= right:
+                merged_events[event["url"]] = event
+        contributors = {}
+        contributor_count = {}
+        for event in merged_events.values():
+            self.add_merged_pull_request(
+                repo, event["user"], event["user_id"], event["url"],
+                event_time(event["merged_at"]), excluded_members,
+                contributors, contributor_count)
+
+    def add_merged_pull_request(self, repo, user, user_id, url, merged_at,
+            excluded_members, contributors, contributor_count):
+        """
+        Add a merged pull request of the repo, returns whether its author is
+        external.
+        """
+        internal = not (excluded_members is None
+            or user_id not in excluded_members)
+        self.merged_pull_requests.setdefault(repo.name, []).append({
+            "user": user,
+            "url": url,
+            "internal": internal,
+            "merged_at": merged_at})
+        if internal:
+            self.internal_pull_requests.setdefault(user, set()).add(url)
+            return False
+        self.external_pull_requests.setdefault(user, set()).add(url)
+        contributor_count[user] = contributor_count.get(user, 0) + 1
+        if self.is_new_contributor(
+                repo, user, contributors, excluded_members, contributor_count):
+            self.new_contributors[repo.name].append(user)
+        return True
 
     def is_new_contributor(self, repo, contributor_login,
             contributors, excluded_members, contributor_count):
@@ -279,21 +1037,26 @@ class DataFetcher:
                 return True
         return False
 
-    def get_issues(self, gh, orgName, repo, left, right):
-        open_issue = iter(gh.search_issues(CREATED_OPEN_TEMPLATE.format(
+    def get_issues(self, gh, orgName, repo, left, right, events=None):
+        if events is not None:
+            open_issues, closed_issues = self.get_event_issues(
+                events, left, right)
+            self.merge_issues(self.open_issues, repo.name, open_issues)
+            self.merge_issues(self.closed_issues, repo.name, closed_issues)
+            return
+        open_issue = iter(self.search_issues(gh, CREATED_OPEN_TEMPLATE.format(
                 org=orgName,
                 repo=repo.name,
                 left=left,
                 right=right),
             "created", "desc"))
-        closed_issue = iter(gh.search_issues(CREATED_CLOSED_TEMPLATE.format(
+        closed_issue = iter(self.search_issues(gh, CREATED_CLOSED_TEMPLATE.format(
                 org=orgName,
                 repo=repo.name,
                 left=left,
                 right=right),
             "created", "desc"))
 
-        timeIndex = None
         open_issues = []
         closed_issues = []
         while True:
@@ -312,12 +1075,6 @@ class DataFetcher:
                 open_issues.append(issue_record)
             except StopIteration:
                 break  # loop end
-            except RateLimitExceededException:
-                sleep_time = get_sleep_time(gh)
-                if DEBUG:
-                    print(f"[DEBUG] RateLimitExceeded, sleep {sleep_time} sec")
-                time.sleep(sleep_time)
-                continue
 
         while True:
             try:
@@ -335,35 +1092,93 @@ class DataFetcher:
                 closed_issues.append(issue_record)
             except StopIteration:
                 break  # loop end
-            except RateLimitExceededException:
-                sleep_time = get_sleep_time(gh)
-                if DEBUG:
-                    print(f"[DEBUG] RateLimitExceeded, sleep {sleep_time} sec")
-                time.sleep(sleep_time)
+        self.merge_issues(self.open_issues, repo.name, open_issues)
+        self.merge_issues(self.closed_issues, repo.name, closed_issues)
+
+    def get_event_issues(self, events, left, right):
+        """
+        Issues created in the window and still open, and issues closed in
+        the window, as searched by get_issues(), from the last event of each
+        issue.
+        """
+        issues = {}
+        closed_by = {}
+        for event in events:
+            if event["event"] != "issues":
                 continue
-        self.open_issues[repo.name] = open_issues
-        self.closed_issues[repo.name] = closed_issues
+            if event["action"] == "closed":
+                closed_by[event["number"]] = event["sender"]
+            issues[event["number"]] = event
+        open_issues = []
+        closed_issues = []
+        for number, event in issues.items():
+            issue_record = {
+                "title": event["title"],
+                "user": event["user"],
+                "number": number,
+                "created_at": event_time(event["created_at"]),
+                "closed_at": "",
+                "closed_by": ""
+            }
+            if event["state"] == "open" \
+                    and left <= issue_record["created_at"][:10] <= right:
+                open_issues.append(issue_record)
+            elif event["state"] == "closed" \
+                    and left <= event_time(event["closed_at"])[:10] <= right:
+                issue_record["closed_at"] = event_time(event["closed_at"])
+                issue_record["closed_by"] = closed_by.get(number, "")
+                closed_issues.append(issue_record)
+        return open_issues, closed_issues
+
+    def merge_issues(self, issues_dict, repo_name, issues):
+        """
+        Add issue records of a repo, the same issue could come from more
+        than one snapshot or crawl.
+        """
+        repo_issues = issues_dict.setdefault(repo_name, [])
+        numbers = {issue["number"] for issue in repo_issues}
+        for issue in issues:
+            if issue["number"] not in numbers:
+                numbers.add(issue["number"])
+                repo_issues.append(issue)
+
+    def merge_pull_requests(self, contributors_dict, repo_name, pull_requests):
+        repo_dict = contributors_dict.setdefault(repo_name, {})
+        for contributor, prs in pull_requests.items():
+            repo_dict.setdefault(contributor, set()).update(prs)
 
     def get_github_contributors(self, gh, orgName, repo, left, right,
-            excluded_members=None):
+            excluded_members=None, events=None):
 
         if DEBUG:
             print(f"[DEBUG] fetching contributors under repo: {repo.name}")
+        # repo could be crawled for more than one window, keep earlier ones
+        previous_new_contributors = self.new_contributors.pop(repo.name, {})
         self.new_contributors[repo.name] = []
-        self.get_contributors(gh, orgName, repo, left, right, excluded_members)
+        if events is None:
+            self.get_contributors(
+                gh, orgName, repo, left, right, excluded_members)
+        else:
+            self.get_event_contributors(
+                repo, events, left, right, excluded_members)
 
         if DEBUG:
             pp = pprint.PrettyPrinter(indent=4)
             pp.pprint(self.external_pull_requests)
 
-        self.all_external_contributors[repo.name] = dict(
+        self.merge_pull_requests(
+            self.all_external_contributors, repo.name,
             self.external_pull_requests)
-        new_contributors = self.new_contributors[repo.name]
-        self.new_contributors[repo.name] = {
-            contr: pr for contr, pr in self.external_pull_requests.items()
-                if contr in new_contributors
-            }
-        self.internal_contributors[repo.name] = dict(
+        new_contributors = self.new_contributors.pop(repo.name)
+        self.merge_pull_requests(
+            self.new_contributors, repo.name, previous_new_contributors)
+        self.merge_pull_requests(
+            self.new_contributors, repo.name, {
+                contr: pr for contr, pr in self.external_pull_requests.items()
+                    if contr in new_contributors
+            })
+        self.merge_pull_requests(
+            self.internal_contributors, repo.name,
             self.internal_pull_requests)
         if DEBUG:
             print(f"----------{repo.name}--------------")
@@ -395,6 +1210,151 @@ class DataFetcher:
     def get_lastweekday(self):
         return (datetime.datetime.now() - datetime.timedelta(7)).date()
 
+    def get_days(self, left, right):
+        left = datetime.datetime.strptime(left, '%Y-%m-%d').date()
+        right = datetime.datetime.strptime(right, '%Y-%m-%d').date()
+        return [str(left + datetime.timedelta(delta))
+            for delta in range((right - left).days + 1)]
+
+    def get_day_ranges(self, days):
+        """
+        Group sorted days into (left, right) ranges of consecutive days
+        """
+        ranges = []
+        for day in days:
+            date = datetime.datetime.strptime(day, '%Y-%m-%d').date()
+            if ranges and str(date - datetime.timedelta(1)) == ranges[-1][1]:
+                ranges[-1][1] = day
+            else:
+                ranges.append([day, day])
+        return [tuple(day_range) for day_range in ranges]
+
+    def build_activity_snapshot(self, day):
+        """
+        Compact merged PR and opened/closed issue deltas of one day, the
+        weekly report merges them instead of searching GitHub again. The
+        repos skipped by the run are told, the report searches them.
+        """
+        repos = {}
+        repo_names = set(self.merged_pull_requests) | set(self.open_issues) \
+            | set(self.closed_issues)
+        for repo_name in sorted(repo_names):
+            new_prs = {pr
+                for prs in self.new_contributors.get(repo_name, {}).values()
+                for pr in prs}
+            merged_prs = {}
+            for pr in self.merged_pull_requests.get(repo_name, []):
+                if pr["merged_at"][:10] == day:
+                    merged_prs[pr["url"]] = dict(pr, new=pr["url"] in new_prs)
+            activity = {
+                "merged_prs": list(merged_prs.values()),
+                "open_issues": [issue
+                    for issue in self.open_issues.get(repo_name, [])
+                    if issue["created_at"][:10] == day],
+                "closed_issues": [issue
+                    for issue in self.closed_issues.get(repo_name, [])
+                    if issue["closed_at"][:10] == day]
+            }
+            if any(activity.values()):
+                repos[repo_name] = activity
+        return {
+            "date": day, "repos": repos,
+            "skipped_repos": sorted(self.skipped_repos)}
+
+    def load_activity_snapshot(self, day):
+        """
+        Merge the snapshot of a day into report data, the snapshot of a day
+        is archived by the daily run of the day after.
+        Returns the repos the snapshot lacks as skipped by its run, None
+        when there is no snapshot for the day.
+        """
+        folder_date = datetime.datetime.strptime(
+            day, '%Y-%m-%d').date() + datetime.timedelta(1)
+        blob = self.bucket.blob(
+            f"records/{ folder_date }/{ GCS_RECORD_NAME['github_activity'] }")
+        try:
+            snapshot = json.loads(blob.download_as_string(client=None))
+        except gcloud_exceptions.NotFound:
+            return None
+        if snapshot.get("date") != day:
+            return None
+        for repo_name, activity in snapshot.get("repos", {}).items():
+            for pr in activity["merged_prs"]:
+                if pr["internal"]:
+                    contributors_dicts = [self.internal_contributors]
+                elif pr["new"]:
+                    contributors_dicts = [
+                        self.all_external_contributors, self.new_contributors]
+                else:
+                    contributors_dicts = [self.all_external_contributors]
+                for contributors_dict in contributors_dicts:
+                    self.merge_pull_requests(
+                        contributors_dict, repo_name, {pr["user"]: {pr["url"]}})
+            self.merge_issues(
+                self.open_issues, repo_name, activity["open_issues"])
+            self.merge_issues(
+                self.closed_issues, repo_name, activity["closed_issues"])
+        return snapshot.get("skipped_repos", [])
+
+    def get_report_data(self, left, right, fetch=True):
+        """
+        Weekly report data from the daily activity snapshots, GitHub is
+        only crawled for days without a snapshot, unless fetch is False to
+        replay the report from the snapshots alone.
+        """
+        missing_days = []
+        skipped_repos = {}
+        with self.metrics.span("load_activity_snapshots"):
+            for day in self.get_days(left, right):
+                repo_names = self.load_activity_snapshot(day)
+                if repo_names is None:
+                    missing_days.append(day)
+                elif repo_names:
+                    skipped_repos[day] = repo_names
+        for range_left, range_right in self.get_day_ranges(missing_days):
+            if not fetch:
+                print(f"[WARN] { datetime.datetime.now() } "
+                      f"No activity snapshot for { range_left }..{ range_right }, "
+                      f"left out of the report")
+                continue
+            print(f"[INFO] { datetime.datetime.now() } "
+                  f"No activity snapshot for { range_left }..{ range_right }, "
+                  f"fetching from github")
+            self.get_data(left=range_left, right=range_right)
+        for day, repo_names in sorted(skipped_repos.items()):
+            if not fetch:
+                print(f"[WARN] { datetime.datetime.now() } "
+                      f"{ repo_names } skipped in the snapshot of { day }, "
+                      f"left out of the report")
+                continue
+            print(f"[INFO] { datetime.datetime.now() } "
+                  f"{ repo_names } skipped in the snapshot of { day }, "
+                  f"fetching from github")
+            self.get_data(left=day, right=day, repo_names=set(repo_names))
+        self.drop_closed_open_issues()
+        if fetch:
+            self.run_context.list_org()
+            self.report_repo = self.run_context.report_repo
+
+    def drop_closed_open_issues(self):
+        """
+        Snapshots keep the issues open on their day, an issue closed later
+        in the window is only a closed one, as the live search tells.
+        """
+        for repo_name, issues in self.open_issues.items():
+            closed = {issue["number"]
+                for issue in self.closed_issues.get(repo_name, [])}
+            issues[:] = [issue
+                for issue in issues if issue["number"] not in closed]
+
+    def archive_activity_snapshot(self, folder):
+        # We snapshot yesterday only, today is not over yet
+        snapshot = self.build_activity_snapshot(str(self.get_yesterday()))
+        self.save_str_to_gcs_ascii(
+            bucket=self.bucket,
+            string_obj=json.dumps(snapshot),
+            filename=f"{ folder }/{ GCS_RECORD_NAME['github_activity'] }")
+
     def archive_github_data(self, folder):
         self.save_str_to_gcs_ascii(
             bucket=self.bucket,
@@ -417,9 +1377,69 @@ class DataFetcher:
         """
         # records/2021-04-21
         folder = f"records/{ datetime.datetime.now().date() }"
-        self.archive_github_data(folder)
+        with self.metrics.span("archive"):
+            self.archive_github_data(folder)
+            self.archive_activity_snapshot(folder)
         return folder
 
+    def report_metrics(self, folder=None):
+        """
+        Print the metrics summary of the run as one JSON line, and archive it
+        under records/<date>/ when folder is given.
+        """
+        summary = json.dumps({"metrics": self.metrics.summary()})
+        print(summary)
+        if folder:
+            self.save_str_to_gcs_ascii(
+                bucket=self.bucket,
+                string_obj=summary,
+                filename=f"{ folder }/{ METRICS_RECORD_NAME }")
+
+    def archive_events(self, events):
+        """
+        Archive a micro-batch of webhook events to records/<date>/_events/
+        and load it to BigQuery, the load job is not waited for.
+        """
+        now = datetime.datetime.now()
+        filename = (f"records/{ now.date() }/{ WEBHOOK_FOLDER }/"
+                    f"{ now.strftime('%H%M%S%f') }-"
+                    f"{ GCS_RECORD_NAME['github_event'] }")
+        self.save_str_to_gcs_ascii(
+            bucket=self.bucket,
+            string_obj="\n".join(json.dumps(event) for event in events),
+            filename=filename)
+        job_config = bigquery.LoadJobConfig(
+            schema=[
+                bigquery.SchemaField("delivery", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("event", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("action", "STRING"),
+                bigquery.SchemaField("repo", "STRING"),
+                bigquery.SchemaField("repo_id", "INTEGER"),
+                bigquery.SchemaField("number", "INTEGER"),
+                bigquery.SchemaField("title", "STRING"),
+                bigquery.SchemaField("state", "STRING"),
+                bigquery.SchemaField("user", "STRING"),
+                bigquery.SchemaField("user_id", "INTEGER"),
+                bigquery.SchemaField("url", "STRING"),
+                bigquery.SchemaField("created_at", "TIMESTAMP"),
+                bigquery.SchemaField("closed_at", "TIMESTAMP"),
+                bigquery.SchemaField("merged_at", "TIMESTAMP"),
+                bigquery.SchemaField("merged", "BOOLEAN"),
+                bigquery.SchemaField("tag", "STRING"),
+                bigquery.SchemaField("sender", "STRING"),
+                bigquery.SchemaField("received_at", "TIMESTAMP")
+            ],
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        )
+        self.load_bigquery_from_gcs(
+            get_client("bigquery", bigquery.Client),
+            f"gs://{ BUCKET }/{ filename }",
+            f"{ GCP_PROJECT }.{ BQ_DATASET }.{ BQ_TABLE_NAME['github_event'] }",
+            job_config)
+        print(f"[INFO] { datetime.datetime.now() } "
+              f"Flushed { len(events) } events to { filename }")
+        return filename
+
     def load_bigquery_from_gcs(self, bq_client, gcs_uri, table_id, job_config):
         load_job = bq_client.load_table_from_uri(
             gcs_uri,
@@ -729,13 +1749,36 @@ def data_fetch(event, context):
     # pubsub_message = base64.b64decode(event['data']).decode('utf-8')
 
     # debug in CLI:
-    # DATA=$(printf '{"report_true": "true", "report_left": "2021-09-19", "report_right": "2021-09-25", "debug_true": "true"}' | base64)
+    # DATA=$(printf '{"report_true": "true", "report_left": "2021-09-19", "report_right": "2021-09-25", "debug_true": "true", "metrics_true": "true"}' | base64)
     # gcloud functions call Data-Fetching-1 --data '{"data":"$DATA"}'
 
-    weekly_report = DataFetcher()
+    # measure cold start only, after a redeploy or a long idle:
+    # DATA=$(printf '{"coldstart_true": "true"}' | base64)
+
+    # profile of the invocation to records/<date>/_profiles/, "profile_mode"
+    # "deterministic" runs cProfile on top of the sampling:
+    # DATA=$(printf '{"profile_true": "true", "profile_mode": "deterministic"}' | base64)
+
+    # report of the archived activity snapshots, nothing else is fetched, and
+    # it is only printed unless "report_true":
+    # DATA=$(printf '{"replay_true": "true", "report_left": "2021-09-19", "report_right": "2021-09-25"}' | base64)
+
+    if 'data' in event and PROFILER is None:
+        decoded_data = base64.b64decode(event['data']).decode('utf-8')
+        payload = json.loads(decoded_data) if decoded_data else None
+        if isinstance(payload, dict) and payload.get("profile_true"):
+            return run_profiled(
+                data_fetch, event, context,
+                mode=payload.get("profile_mode", "sampling"))
+
+    run_context = RunContext()
+    weekly_report = DataFetcher(run_context)
     send_report = datetime.date.today().weekday() == 5
     left = str(weekly_report.get_lastweekday())
     right = str(weekly_report.get_yesterday())
+    archive_metrics = bool(run_context.conf.get("metrics_archive", False))
+    cold_start_only = False
+    replay = False
     if 'data' in event:
         decoded_data = base64.b64decode(event['data']).decode('utf-8')
         if decoded_data and isinstance(json.loads(decoded_data), dict):
@@ -743,16 +1786,274 @@ def data_fetch(event, context):
             left = payload.get("report_left", left)
             right = payload.get("report_right", right)
             send_report = bool(payload.get("report_true", False)) or send_report
+            archive_metrics = bool(
+                payload.get("metrics_true", False)) or archive_metrics
+            cold_start_only = bool(payload.get("coldstart_true", False))
+            replay = bool(payload.get("replay_true", False))
+            if replay:
+                send_report = bool(payload.get("report_true", False))
             global DEBUG
             DEBUG = bool(payload.get("debug_true", DEBUG))
 
-    # report
-    if send_report:
-        weekly_report.get_data(left=left, right=right)
+    if cold_start_only:
+        # conf download above is the first request of the run
+        print(json.dumps({"cold_start": run_context.metrics.cold_start()}))
+        return
+
+    if replay:
+        run_report_replay(weekly_report, left, right, send_report)
+        weekly_report.report_metrics()
+        return
+
+    # org listing is shared by both phases, fetch it before they fork
+    run_context.list_org()
+    data_fetcher = DataFetcher(run_context)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = []
+        # report
+        if send_report:
+            futures.append(executor.submit(
+                run_weekly_report, weekly_report, left, right))
+        # daily data
+        daily_future = executor.submit(run_daily_fetch, data_fetcher)
+        futures.append(daily_future)
+        for future in futures:
+            future.result()
+
+    data_fetcher.report_metrics(
+        daily_future.result() if archive_metrics else None)
+
+
+def run_profiled(entry_point, event, context, mode="sampling"):
+    """
+    Run the invocation under the profiler, and archive the profile to
+    records/<date>/_profiles/: the summary with the peak memory of each
+    phase, the collapsed stacks for flame graphs and, in the deterministic
+    mode, the cProfile stats read by pstats or snakeviz.
+    """
+    global PROFILER
+    PROFILER = Metrics.profiler = Profiler(mode)
+    PROFILER.start()
+    try:
+        return entry_point(event, context)
+    finally:
+        profiler = PROFILER
+        profiler.stop()
+        PROFILER = Metrics.profiler = None
+        now = datetime.datetime.now()
+        prefix = (f"records/{ now.date() }/{ PROFILE_FOLDER }/"
+                  f"{ now.strftime('%H%M%S') }-{ entry_point.__name__ }")
+        bucket = RunContext().bucket
+        bucket.blob(f"{ prefix }.json").upload_from_string(
+            data=json.dumps(profiler.summary()),
+            content_type="application/json")
+        bucket.blob(f"{ prefix }.folded").upload_from_string(
+            data=profiler.folded(), content_type="text/plain")
+        if mode == "deterministic":
+            bucket.blob(f"{ prefix }.prof").upload_from_string(
+                data=profiler.pstats(),
+                content_type="application/octet-stream")
+        print(f"[INFO] { datetime.datetime.now() } "
+              f"Profile of { profiler.samples } samples archived to "
+              f"{ prefix }.*")
+
+
+def run_weekly_report(weekly_report, left, right):
+    with weekly_report.metrics.span("weekly_report"):
+        weekly_report.get_report_data(left=left, right=right)
         weekly_report.generate_report()
         weekly_report.send_issue(right=right)
 
-    # daily data
-    data_fetcher = DataFetcher()
-    data_fetcher.get_data()
-    record_folder = data_fetcher.archive_data()
+
+def run_report_replay(weekly_report, left, right, send_report=False):
+    with weekly_report.metrics.span("report_replay"):
+        weekly_report.get_report_data(left=left, right=right, fetch=False)
+        weekly_report.generate_report()
+        if not send_report:
+            print(weekly_report.report_body)
+            return
+        weekly_report.run_context.list_org()
+        weekly_report.report_repo = weekly_report.run_context.report_repo
+        weekly_report.send_issue(right=right)
+
+
+def run_daily_fetch(data_fetcher):
+    with data_fetcher.metrics.span("daily_fetch"):
+        data_fetcher.get_data()
+        return data_fetcher.archive_data()
+
+
+def webhook(request):
+    """Triggered by a delivery of the GitHub webhook of the org.
+    Args:
+         request (flask.Request): The delivery, signed with conf
+         "webhook" secret.
+    Returns:
+         The response text and status code.
+    """
+    # the org hook sends "Pull requests", "Issues" and "Releases" events to
+    # the URL of the function, with the secret set in conf:
+    # {"webhook": {"secret": "...", "hook_id": 123456}}
+
+    run_context = RunContext()
+    webhook_conf = run_context.conf.get("webhook", {})
+    secret = webhook_conf.get("secret")
+    if not secret:
+        print(f"[ERROR] { datetime.datetime.now() } "
+              f"No webhook secret in conf")
+        return "webhook is not configured", 503
+    seconds = webhook_conf.get("batch_seconds", WEBHOOK_BATCH_SECONDS)
+    try:
+        return receive_webhook(request, run_context, webhook_conf, seconds)
+    finally:
+        # whatever the request, a batch old enough doesn't wait for an event
+        events = EVENT_BUFFER.due(seconds)
+        if events:
+            flush_events(events, run_context, seconds)
+
+
+def receive_webhook(request, run_context, webhook_conf, seconds):
+    """the response to a delivery, its event added to EVENT_BUFFER"""
+    secret = webhook_conf["secret"]
+    body = request.get_data()
+    signature = "sha256=" + hmac.new(
+        secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(
+            signature, request.headers.get("X-Hub-Signature-256", "")):
+        print(f"[WARN] { datetime.datetime.now() } "
+              f"Rejected a webhook delivery with a bad signature")
+        return "bad signature", 401
+
+    event = request.headers.get("X-GitHub-Event", "")
+    if event not in WEBHOOK_EVENTS:
+        # ping of the hook, or events it shouldn't be sending
+        return "", 204
+    if request.headers.get("Content-Type", "").startswith(
+            "application/x-www-form-urlencoded"):
+        payload = json.loads(parse_qs(body.decode("utf-8"))["payload"][0])
+    else:
+        payload = json.loads(body)
+    delivery = request.headers.get("X-GitHub-Delivery", "")
+    if DEBUG:
+        print(f"[DEBUG] { event } { payload.get('action') } { delivery }")
+
+    events = EVENT_BUFFER.add(
+        webhook_event(event, delivery, payload),
+        size=webhook_conf.get("batch_size", WEBHOOK_BATCH_SIZE),
+        seconds=seconds)
+    if events:
+        flush_events(events, run_context, seconds)
+    return "accepted", 202
+
+
+def flush_events(events, run_context=None, seconds=WEBHOOK_BATCH_SECONDS):
+    """archive a batch of EVENT_BUFFER, kept for the next one if it fails"""
+    try:
+        DataFetcher(run_context or RunContext()).archive_events(events)
+    except Exception as e:
+        # the daily fetch searches what is lost
+        print(f"[ERROR] { datetime.datetime.now() } "
+              f"Failed to flush { len(events) } webhook events: { e }")
+        EVENT_BUFFER.restore(events, seconds)
+
+
+@atexit.register
+def flush_events_on_shutdown():
+    """the events held by an instance shutting down, not to lose them"""
+    events = EVENT_BUFFER.drain()
+    if events:
+        flush_events(events)
+
+
+def webhook_event(event, delivery, payload):
+    """flat record of a pull_request, issues or release webhook event"""
+    item = payload.get(
+        {"issues": "issue"}.get(event, event)) or {}
+    repo = payload.get("repository") or {}
+    # releases have an author instead of a user
+    user = item.get("user") or item.get("author") or {}
+    return {
+        "delivery": delivery,
+        "event": event,
+        "action": payload.get("action", ""),
+        "repo": repo.get("name", ""),
+        "repo_id": repo.get("id"),
+        "number": item.get("number"),
+        "title": item.get("title") or item.get("name") or "",
+        "state": item.get("state", ""),
+        "user": user.get("login", ""),
+        "user_id": user.get("id"),
+        "url": item.get("html_url", ""),
+        "created_at": item.get("created_at"),
+        "closed_at": item.get("closed_at"),
+        "merged_at": item.get("merged_at"),
+        "merged": bool(item.get("merged")),
+        "tag": item.get("tag_name", ""),
+        "sender": (payload.get("sender") or {}).get("login", ""),
+        "received_at": str(datetime.datetime.now())
+    }
+
+
+def feed_event(event):
+    """webhook_event() record of an event of the events feeds"""
+    payload = dict(
+        event["payload"],
+        repository={
+            "id": event["repo"]["id"],
+            "name": event["repo"]["name"].split("/")[-1]},
+        sender=event["actor"])
+    record = webhook_event(
+        EVENTS_FEED_TYPES[event["type"]], f"feed-{ event['id'] }", payload)
+    if event["type"] == "PushEvent":
+        record["title"] = payload.get("ref", "")
+    record["received_at"] = event_time(event["created_at"])
+    return record
+
+
+def event_lag(timestamp):
+    """timestamp of the events feeds less EVENTS_FEED_LAG_HOURS"""
+    return (datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+        - datetime.timedelta(hours=EVENTS_FEED_LAG_HOURS)).strftime(
+            "%Y-%m-%dT%H:%M:%SZ")
+
+
+def event_time(timestamp):
+    """2021-04-21T10:00:00Z of the events as str() of PyGithub datetimes"""
+    return timestamp.replace("T", " ").rstrip("Z") if timestamp else ""
+
+
+# end of the import of main.py, see Metrics.cold_start()
+IMPORTED_AT = time.perf_counter()
+Metrics.imported = (IMPORT_STARTED_AT, IMPORTED_AT)
+
+
+if __name__ == "__main__":
+    # local runs, with the credentials of `gcloud auth application-default
+    # login`, through the entry point and its payload:
+    # python main.py report 2021-09-19 2021-09-25 --send
+    # python main.py --profile deterministic daily
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile", choices=("sampling", "deterministic"),
+        help="profile the run to records/<date>/_profiles/")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("daily", help="run as triggered by the scheduler")
+    report_parser = subparsers.add_parser(
+        "report", help="weekly report of the archived activity snapshots")
+    report_parser.add_argument("left")
+    report_parser.add_argument("right")
+    report_parser.add_argument(
+        "--send", action="store_true", help="create the report issue")
+    args = parser.parse_args()
+    payload = {}
+    if args.command == "report":
+        payload = {"replay_true": "true", "report_left": args.left,
+                   "report_right": args.right}
+        if args.send:
+            payload["report_true"] = "true"
+    if args.profile:
+        payload.update(profile_true="true", profile_mode=args.profile)
+    data_fetch({"data": base64.b64encode(
+        json.dumps(payload).encode("utf-8"))}, None)
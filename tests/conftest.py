@@ -0,0 +1,53 @@
+"""
+The functions run against the fakes of the benchmark: synthetic APIs
+(benchmark/fixtures.py) and in-memory GCS and BigQuery (benchmark/bench.py),
+nothing leaves the machine.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmark"))
+
+import bench  # noqa: E402
+from fixtures import SyntheticApi  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def fn0():
+    return bench.load_function("data-fetching-0")
+
+
+@pytest.fixture(scope="session")
+def fn1():
+    return bench.load_function("data-fetching-1")
+
+
+@pytest.fixture(scope="session")
+def common():
+    """functions/common/common.py, the source of the copies of the functions"""
+    spec = importlib.util.spec_from_file_location("common", os.path.join(
+        os.path.dirname(__file__), "..", "functions", "common", "common.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def api():
+    return SyntheticApi(
+        org="vesoft-inc", repos=3, releases=1, assets=1, images=2)
+
+
+@pytest.fixture
+def transport(api):
+    """requests of the test served by api"""
+    with bench.Transport(api, None).installed() as transport:
+        yield transport
+
+
+def objects(module):
+    """objects of the bucket of a function, by name"""
+    return bench.StorageClient.buckets[module.BUCKET].objects
@@ -0,0 +1,65 @@
+import filecmp
+import os
+
+import pytest
+
+FUNCTIONS = os.path.join(os.path.dirname(__file__), "..", "functions")
+
+
+@pytest.mark.parametrize("function", ["data-fetching-0", "data-fetching-1"])
+def test_common_is_copied_as_is(function):
+    assert filecmp.cmp(
+        os.path.join(FUNCTIONS, "common", "common.py"),
+        os.path.join(FUNCTIONS, function, "common.py"), shallow=False)
+
+
+@pytest.mark.parametrize("status, data, headers, kind", [
+    (502, "<html>Bad Gateway</html>", None, "retry"),
+    (503, None, None, "retry"),
+    (404, {"message": "Not Found"}, None, "fatal"),
+    (403, {"message": "Resource not accessible by integration"}, {}, "fatal"),
+    (403, {"message": "Must have push access to view traffic"}, {}, "fatal"),
+    (403, {"message": "You have exceeded a secondary rate limit"}, {},
+        "rate_limit"),
+    (403, "", {"retry-after": "60"}, "rate_limit"),
+    (403, None, {"x-ratelimit-remaining": "0"}, "rate_limit"),
+    (429, None, None, "rate_limit"),
+])
+def test_retry_classification(common, status, data, headers, kind):
+    policy = common.RetryPolicy()
+    e = common.github.GithubException(status, data, headers)
+    assert policy.classify(e) == kind
+    assert isinstance(policy.message(e), str)
+
+
+def test_breaker_opens_then_lets_a_trial_through(common):
+    breaker = common.CircuitBreaker(failures=2, cooldown=300)
+    breaker.on_failure()
+    assert breaker.allow()
+    breaker.on_failure()
+    assert not breaker.allow()
+
+    breaker.cooldown = 0
+    assert breaker.allow()
+    # one trial at a time, its failure opens the breaker again
+    assert not breaker.allow()
+    breaker.on_failure()
+    breaker.cooldown = 300
+    assert not breaker.allow()
+
+    breaker.cooldown = 0
+    assert breaker.allow()
+    breaker.on_success()
+    breaker.cooldown = 300
+    assert breaker.allow()
+    breaker.on_failure()
+    assert breaker.allow()
+
+
+def test_rate_limits_and_transport_errors(common):
+    policy = common.RetryPolicy()
+    assert policy.classify(common.github.RateLimitExceededException(
+        403, {"message": "API rate limit exceeded"}, {})) == policy.RATE_LIMIT
+    assert policy.classify(
+        common.requests.ConnectionError("reset")) == policy.RETRY
+    assert policy.classify(ValueError("bad")) == policy.FATAL
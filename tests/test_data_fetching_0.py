@@ -0,0 +1,309 @@
+import concurrent.futures
+import datetime
+import gzip
+import io
+import json
+import time
+
+import pytest
+
+import bench
+from conftest import objects
+from fixtures import Response
+
+
+def record(fn0, folder, record_key):
+    return f"{ folder }/{ fn0.GCS_RECORD_NAME[record_key] }"
+
+
+def test_source_raising_is_skipped(fn0, transport, monkeypatch):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+
+    def get_data_from_maven(self):
+        raise ConnectionError("maven is down")
+    monkeypatch.setattr(
+        fn0.DataFetcher, "get_data_from_maven", get_data_from_maven)
+    data_fetcher = fn0.DataFetcher()
+    folder = data_fetcher.collect()
+    data_fetcher.load_data(folder)
+
+    archived = objects(fn0)
+    for record_key in ("github_clone", "dockerhub_image", "go_module"):
+        assert record(fn0, folder, record_key) in archived
+    assert record(fn0, folder, "maven_download") not in archived
+    assert data_fetcher.metrics.skipped == [{
+        "work": "maven", "reason": "error maven is down", "priority": 0}]
+    assert "go_module_records" in {
+        destination.split(".")[-1]
+        for _, destination in bench.BigQueryClient.jobs}
+
+
+def test_collected_is_archived_when_a_run_fails(fn0, transport, monkeypatch):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    get_data = fn0.DataFetcher.get_data
+
+    def get_data_then_fail(self, sources=None):
+        get_data(self, ["github", "dockerhub"])
+        raise RuntimeError("mid-run")
+    monkeypatch.setattr(fn0.DataFetcher, "get_data", get_data_then_fail)
+    data_fetcher = fn0.DataFetcher()
+    folder = data_fetcher.get_record_folder()
+    with pytest.raises(RuntimeError):
+        data_fetcher.collect()
+
+    archived = objects(fn0)
+    assert record(fn0, folder, "github_clone") in archived
+    assert record(fn0, folder, "dockerhub_image") in archived
+
+
+def test_pypi_malformed_rows_are_skipped(fn0):
+    export = io.BytesIO(b"\n".join([
+        b'{"timestamp": "2021-04-20 08:00:00 UTC", "project": "nebula3-python"'
+        b', "file": {"version": "3.0.0"}, "details": {"python": "3.8.5"}}',
+        b'{"timestamp": "2021-04-20 09:00:00 UTC", "project": "nebula3-pyt',
+        b'[1, 2]',
+        b'',
+        b'{"timestamp": "2021-04-20 10:00:00 UTC", "project": "nebula3-python"'
+        b', "file": {"version": "3.0.0"}, "details": null}',
+        b'{"timestamp": "2021-04-20 10:00:00 UTC", "project": "other"}',
+    ]))
+    downloads, bad_rows = fn0.count_pypi_downloads(export, {"nebula3-python"})
+    assert downloads == {
+        ("nebula3-python", "3.0.0", "3.8", "2021-04-20"): 1,
+        ("nebula3-python", "3.0.0", "", "2021-04-20"): 1}
+    assert bad_rows == 2
+
+
+@pytest.mark.parametrize("conf, reason", [
+    ({"maven": {"username": "u", "artifacts": ["com.vesoft:client"]}},
+     "conf lacks project_id, password"),
+    ({"maven": {"project_id": "p"}}, "conf lacks artifacts"),
+    ({"go": {"proxy": "https://proxy.golang.org"}}, "conf lacks modules"),
+])
+def test_partial_conf_skips_the_source(fn0, transport, conf, reason):
+    bench.new_scenario(fn0, dict(
+        {key: value for key, value in bench.DEFAULT_CONF.items()
+         if key not in ("maven", "go")}, **conf))
+    data_fetcher = fn0.DataFetcher()
+    data_fetcher.get_data(["maven", "go"])
+    assert [skip["reason"] for skip in data_fetcher.metrics.skipped] \
+        == [reason]
+    assert not data_fetcher.maven_stats and not data_fetcher.go_stats
+
+
+def test_dockerhub_5xx_are_retried_by_the_client_only(
+        fn0, api, transport, monkeypatch):
+    monkeypatch.setattr(fn0, "DH_BACKOFF", 0)
+    handle = api.handle
+    failures = [fn0.requests.codes.bad_gateway] * 2
+
+    def handle_failing(method, url, body=None, page_size=None):
+        if failures:
+            return "dockerhub", Response(failures.pop(), "")
+        return handle(method, url, body, page_size)
+    monkeypatch.setattr(api, "handle", handle_failing)
+    session = fn0.new_http_session(retries=0)
+    assert session.get_adapter("https://hub.docker.com").max_retries.total == 0
+    dh_client = fn0.DockerHubClient(session=session)
+
+    assert dh_client.get_repos(fn0.DH_USER)["code"] == 200
+    assert sum(transport.requests.values()) == 3
+    assert dh_client.login("user", "password") is False
+    assert not hasattr(dh_client, "config")
+
+
+def test_shard_repos_are_got_by_name(fn0, transport):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    data_fetcher = fn0.DataFetcher()
+    folder = data_fetcher.run_shard({
+        "id": "github-vesoft-inc-0000", "source": "github",
+        "org": "vesoft-inc", "repos": ["repo-1", "repo-404"]})
+
+    assert transport.requests["github:orgs/repos"] == 0
+    assert transport.requests["github:repos"] == 2
+    clones = objects(fn0)[record(fn0, folder, "github_clone")]
+    assert b"vesoft-inc/repo-1" in clones
+    assert b"vesoft-inc/repo-0" not in clones
+    assert [skip["work"] for skip in data_fetcher.metrics.skipped] == [
+        "vesoft-inc/repo-404"]
+
+
+def test_dockerhub_tags_unconfigured_is_silent(fn0, capsys):
+    bench.new_scenario(fn0, {"github_token": "benchmark"})
+    fn0.DataFetcher().get_data_from_dockerhub_tags()
+    assert capsys.readouterr().out == ""
+
+
+def test_adaptive_limit_is_aimd(fn0):
+    limit = fn0.AdaptiveLimit(8)
+    assert limit.limit == 4
+    for _ in range(4):
+        limit.on_success()
+    assert limit.limit == 5
+    limit.on_success()
+    limit.on_throttle()
+    assert limit.limit == 2
+    for _ in range(3):
+        limit.on_throttle()
+    assert limit.limit == 1
+    for _ in range(100):
+        limit.on_success()
+    assert limit.limit == 8
+    limit.set_maximum(3)
+    assert limit.limit == 3
+
+
+def test_adaptive_limit_bounds_the_requests_in_flight(fn0):
+    limit = fn0.AdaptiveLimit(4, minimum=2)
+    in_flight = []
+
+    def request():
+        with limit.slot():
+            in_flight.append(limit.in_flight)
+            time.sleep(0.001)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        for _ in range(32):
+            executor.submit(request)
+    assert len(in_flight) == 32
+    assert max(in_flight) <= 2
+
+
+def release(repo, tag, **counts):
+    return {"repo": repo, "tag": tag, "assets": [
+        {"name": name, "count": count} for name, count in counts.items()]}
+
+
+def test_release_delta_carries_tags_not_fetched(fn0):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    bucket = bench.StorageClient().bucket(fn0.BUCKET)
+    bucket.blob(fn0.RELEASE_STATE_NAME).upload_from_string(json.dumps({
+        "vesoft-inc/nebula": {"v1": {"a.deb": 5}, "v2": {"a.deb": 1}}}))
+    delta = fn0.ReleaseDelta(bucket)
+
+    assert not delta.changes(
+        release("vesoft-inc/nebula", "v2", **{"a.deb": 1}))
+    assert delta.changes(release("vesoft-inc/nebula", "v3", **{"a.deb": 2}))
+    delta.save()
+
+    assert json.loads(objects(fn0)[fn0.RELEASE_STATE_NAME]) == {
+        "vesoft-inc/nebula": {
+            "v1": {"a.deb": 5}, "v2": {"a.deb": 1}, "v3": {"a.deb": 2}}}
+    assert (delta.changed, delta.total) == (1, 2)
+
+
+def test_repo_state_carries_unchanged_repos_forward(fn0):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    bucket = bench.StorageClient().bucket(fn0.BUCKET)
+    today = datetime.date(2021, 4, 21)
+    seen = {"pushed_at": "2021-04-01 00:00:00",
+            "updated_at": "2021-04-01 00:00:00", "open_issues_count": 3}
+    state = fn0.RepoState(bucket, refresh_days=7)
+    state.update("vesoft-inc/nebula", seen, today - datetime.timedelta(days=2),
+        {"2021-04-19": {"all_issue_count": 3}})
+    state.save()
+
+    state = fn0.RepoState(bucket, refresh_days=7)
+    carried = state.carried_forward("vesoft-inc/nebula", seen, today)
+    assert carried["issues_and_pr"] == {"2021-04-19": {"all_issue_count": 3}}
+    assert state.carried_forward(
+        "vesoft-inc/nebula", dict(seen, open_issues_count=4), today) is None
+    assert state.carried_forward("vesoft-inc/nebula", seen,
+        today + datetime.timedelta(days=5)) is None
+    assert state.carried_forward("vesoft-inc/nebula-go", seen, today) is None
+    assert state.carried == 1
+
+
+def test_change_detection_collects_issues_of_changed_repos_only(
+        fn0, transport, capsys):
+    bench.new_scenario(fn0, dict(
+        bench.DEFAULT_CONF, change_detection={"refresh_days": 7}))
+    first = fn0.DataFetcher().collect()
+    graphql = transport.requests["github:graphql"]
+    assert graphql == 3
+
+    capsys.readouterr()
+    folder = fn0.DataFetcher().collect()
+    assert transport.requests["github:graphql"] == graphql
+    assert "3 repos unchanged and carried forward" in capsys.readouterr().out
+    archived = objects(fn0)
+    assert archived[record(fn0, folder, "github_issue_pr")] \
+        == archived[record(fn0, first, "github_issue_pr")]
+
+
+def archive_days(fn0, rows_by_date):
+    """daily github_clone records of the dates, rows lines each"""
+    bucket = bench.StorageClient().bucket(fn0.BUCKET)
+    for date, rows in rows_by_date.items():
+        bucket.blob(record(fn0, f"records/{ date }", "github_clone")
+            ).upload_from_string("\n".join(json.dumps({
+                "repo": "vesoft-inc/nebula", "date": date, "count": row,
+                "uniques": 1}) for row in range(rows)))
+
+
+def clone_table(fn0):
+    return (f"{ fn0.GCP_PROJECT }.{ fn0.BQ_DATASET }."
+            f"{ fn0.BQ_TABLE_NAME['github_clone'] }")
+
+
+def test_compaction_prunes_verified_records(fn0):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    archive_days(fn0, {"2021-04-01": 2, "2021-04-02": 3})
+    manifest = fn0.DataFetcher().compact_month("2021-04", prune=True)
+
+    entry = manifest["records"][fn0.GCS_RECORD_NAME["github_clone"]]
+    assert entry["rows_by_date"] == {"2021-04-01": 2, "2021-04-02": 3}
+    assert entry["rows"] == 5 and entry["verified"]
+    assert manifest["pruned"]
+    assert not [name for name in objects(fn0) if name.startswith("records/")]
+
+
+def test_compaction_keeps_records_of_rows_lost(fn0, monkeypatch):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    archive_days(fn0, {"2021-04-01": 2, "2021-04-02": 3})
+    close = bench.BlobWriter.close
+
+    def close_losing_a_row(writer):
+        if not writer.closed:
+            lines = gzip.decompress(writer.getvalue()).splitlines()
+            writer.seek(0)
+            writer.truncate()
+            writer.write(gzip.compress(b"\n".join(lines[:-1])))
+        close(writer)
+    monkeypatch.setattr(bench.BlobWriter, "close", close_losing_a_row)
+
+    with pytest.raises(ValueError, match="don't match"):
+        fn0.DataFetcher().compact_month("2021-04", prune=True)
+    assert record(fn0, "records/2021-04-02", "github_clone") in objects(fn0)
+    manifest = json.loads(objects(fn0)["archive/2021-04/_manifest.json"])
+    assert not manifest["pruned"]
+
+
+def test_reload_replaces_the_partition_of_each_date(fn0):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    archive_days(fn0, {"2021-04-01": 2, "2021-04-02": 3})
+    data_fetcher = fn0.DataFetcher()
+    data_fetcher.compact_month("2021-04", prune=True)
+    archive_days(fn0, {"2021-05-01": 1})
+    data_fetcher.reload_data("2021-04-01", "2021-05-01")
+
+    jobs = {destination: source
+        for source, destination in bench.BigQueryClient.jobs}
+    table_id = clone_table(fn0)
+    assert set(jobs) == {
+        f"{ table_id }$20210401", f"{ table_id }$20210402",
+        f"{ table_id }$20210501"}
+    assert len(jobs[f"{ table_id }$20210401"].splitlines()) == 2
+    assert len(jobs[f"{ table_id }$20210402"].splitlines()) == 3
+    assert jobs[f"{ table_id }$20210501"] == (
+        f"gs://{ fn0.BUCKET }/records/2021-05-01/"
+        f"{ fn0.GCS_RECORD_NAME['github_clone'] }")
+
+
+def test_reload_needs_partitioned_tables(fn0, monkeypatch):
+    bench.new_scenario(fn0, bench.DEFAULT_CONF)
+    archive_days(fn0, {"2021-04-01": 2})
+    monkeypatch.setattr(bench.BigQueryClient, "partitioned", False)
+    with pytest.raises(ValueError, match="not partitioned by day"):
+        fn0.DataFetcher().reload_data("2021-04-01", "2021-04-01")
+    assert bench.BigQueryClient.jobs == []
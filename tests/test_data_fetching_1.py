@@ -0,0 +1,189 @@
+import concurrent.futures
+import datetime
+import hashlib
+import hmac
+import json
+import time
+import types
+
+import pytest
+
+import bench
+from conftest import objects
+
+
+def test_list_org_is_complete_for_every_thread(fn1, api, transport,
+                                               monkeypatch):
+    import github.Organization
+
+    bench.new_scenario(fn1, bench.DEFAULT_CONF)
+    get_members = github.Organization.Organization.get_members
+
+    def slow_get_members(self, *args, **kwargs):
+        # the second thread comes while the members are being listed
+        time.sleep(0.2)
+        return get_members(self, *args, **kwargs)
+    monkeypatch.setattr(
+        github.Organization.Organization, "get_members", slow_get_members)
+    run_context = fn1.RunContext()
+    data_fetcher = fn1.DataFetcher(run_context)
+
+    def list_org(delay):
+        time.sleep(delay)
+        run_context.list_org()
+        return len(run_context.repos), len(data_fetcher.org_members)
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        listed = list(executor.map(list_org, (0, 0.05)))
+    assert listed == [(api.repos, api.members)] * 2
+
+
+def issue(number, created_at, closed_at=""):
+    return {"title": f"issue { number }", "user": "user-1000",
+            "number": number, "created_at": created_at,
+            "closed_at": closed_at, "closed_by": ""}
+
+
+def archive_snapshot(fn1, day, repos, skipped_repos=()):
+    folder_date = datetime.date.fromisoformat(day) + datetime.timedelta(1)
+    bench.StorageClient().bucket(fn1.BUCKET).blob(
+        f"records/{ folder_date }/{ fn1.GCS_RECORD_NAME['github_activity'] }"
+    ).upload_from_string(json.dumps({
+        "date": day, "repos": repos, "skipped_repos": list(skipped_repos)}))
+
+
+def activity(open_issues=(), closed_issues=()):
+    return {"merged_prs": [], "open_issues": list(open_issues),
+            "closed_issues": list(closed_issues)}
+
+
+def test_issue_closed_in_the_window_is_not_open(fn1):
+    bench.new_scenario(fn1, bench.DEFAULT_CONF)
+    archive_snapshot(fn1, "2021-09-20", {"repo-0": activity(open_issues=[
+        issue(5, "2021-09-20 10:00:00"), issue(6, "2021-09-20 11:00:00")])})
+    archive_snapshot(fn1, "2021-09-21", {})
+    archive_snapshot(fn1, "2021-09-22", {"repo-0": activity(closed_issues=[
+        issue(5, "2021-09-20 10:00:00", "2021-09-22 09:00:00")])})
+    data_fetcher = fn1.DataFetcher(fn1.RunContext())
+    data_fetcher.get_report_data("2021-09-20", "2021-09-22", fetch=False)
+    assert [i["number"] for i in data_fetcher.open_issues["repo-0"]] == [6]
+    assert [i["number"] for i in data_fetcher.closed_issues["repo-0"]] == [5]
+
+
+def test_repos_skipped_by_a_snapshot_are_searched(fn1, transport,
+                                                  monkeypatch):
+    bench.new_scenario(fn1, bench.DEFAULT_CONF)
+    archive_snapshot(fn1, "2021-09-20", {}, skipped_repos=["repo-1"])
+    archive_snapshot(fn1, "2021-09-21", {})
+    searched = []
+    monkeypatch.setattr(
+        fn1.DataFetcher, "get_data",
+        lambda self, left=None, right=None, repo_names=None:
+            searched.append((left, right, repo_names)))
+    data_fetcher = fn1.DataFetcher(fn1.RunContext())
+    data_fetcher.get_report_data("2021-09-20", "2021-09-21")
+    assert searched == [("2021-09-20", "2021-09-20", {"repo-1"})]
+
+
+def test_skipped_repos_are_told_by_the_snapshot(fn1, transport, monkeypatch):
+    bench.new_scenario(fn1, bench.DEFAULT_CONF)
+    get_issues = fn1.DataFetcher.get_issues
+
+    def get_issues_failing(self, gh, org, repo, *args, **kwargs):
+        if repo.name == "repo-1":
+            raise fn1.github.GithubException(502, "bad gateway", {})
+        return get_issues(self, gh, org, repo, *args, **kwargs)
+    monkeypatch.setattr(fn1.DataFetcher, "get_issues", get_issues_failing)
+    data_fetcher = fn1.DataFetcher(fn1.RunContext())
+    data_fetcher.get_data()
+    snapshot = data_fetcher.build_activity_snapshot(
+        str(data_fetcher.get_yesterday()))
+    assert snapshot["skipped_repos"] == ["repo-1"]
+
+
+SECRET = "webhook secret"
+
+
+def delivery(body, secret=SECRET, event="issues"):
+    """request of a webhook delivery as flask gives it"""
+    signature = "sha256=" + hmac.new(
+        secret.encode(), body, hashlib.sha256).hexdigest()
+    return types.SimpleNamespace(
+        get_data=lambda: body,
+        headers={"X-Hub-Signature-256": signature, "X-GitHub-Event": event,
+                 "X-GitHub-Delivery": "delivery-1",
+                 "Content-Type": "application/json"})
+
+
+def issue_event(number):
+    return json.dumps({
+        "action": "opened", "repository": {"name": "nebula", "id": 1},
+        "issue": {"number": number, "title": "bug", "state": "open"},
+        "sender": {"login": "user-1"}}).encode()
+
+
+def archived_events(fn1):
+    return [name for name in objects(fn1)
+        if f"/{ fn1.WEBHOOK_FOLDER }/" in name]
+
+
+@pytest.fixture
+def webhook_conf(fn1, monkeypatch):
+    monkeypatch.setattr(fn1, "EVENT_BUFFER", fn1.EventBuffer())
+    bench.new_scenario(fn1, dict(bench.DEFAULT_CONF, webhook={
+        "secret": SECRET, "batch_size": 2, "batch_seconds": 300}))
+    yield
+    fn1.EVENT_BUFFER.drain()
+
+
+def test_webhook_rejects_a_bad_signature(fn1, webhook_conf):
+    assert fn1.webhook(delivery(issue_event(1), secret="guessed")) \
+        == ("bad signature", 401)
+    body = issue_event(1)
+    request = delivery(body)
+    request.get_data = lambda: body + b" "
+    assert fn1.webhook(request) == ("bad signature", 401)
+    assert fn1.EVENT_BUFFER.events == []
+
+
+def test_webhook_events_are_flushed_by_batch(fn1, webhook_conf):
+    assert fn1.webhook(delivery(issue_event(1))) == ("accepted", 202)
+    assert archived_events(fn1) == []
+    assert fn1.webhook(delivery(b"{}", event="ping")) == ("", 204)
+    assert fn1.webhook(delivery(issue_event(2))) == ("accepted", 202)
+
+    events, = archived_events(fn1)
+    assert [json.loads(line)["number"]
+        for line in objects(fn1)[events].splitlines()] == [1, 2]
+    assert fn1.EVENT_BUFFER.events == []
+
+
+def test_event_buffer_flushes_a_batch_old_enough(fn1):
+    buffer = fn1.EventBuffer()
+    assert buffer.add({"number": 1}, size=10, seconds=300) == []
+    assert buffer.due(seconds=300) == []
+    buffer.started_at -= 300
+    assert buffer.due(seconds=300) == [{"number": 1}]
+    assert buffer.timer is None
+
+    buffer.add({"number": 2}, size=10, seconds=300)
+    buffer.restore([{"number": 1}])
+    assert buffer.drain() == [{"number": 1}, {"number": 2}]
+
+
+def test_failed_flush_keeps_the_events(fn1, monkeypatch, webhook_conf):
+    def archive_events(self, events):
+        raise ConnectionError("gcs is down")
+    monkeypatch.setattr(fn1.DataFetcher, "archive_events", archive_events)
+    fn1.webhook(delivery(issue_event(1)))
+    fn1.webhook(delivery(issue_event(2)))
+    assert [event["number"] for event in fn1.EVENT_BUFFER.events] == [1, 2]
+
+
+def test_timer_flushes_without_requests(fn1, monkeypatch, webhook_conf):
+    monkeypatch.setattr(fn1, "EVENT_BUFFER", fn1.EventBuffer())
+    flushed = []
+    monkeypatch.setattr(fn1, "flush_events",
+        lambda events, run_context=None, seconds=None: flushed.append(events))
+    fn1.EVENT_BUFFER.add({"number": 1}, size=10, seconds=0.05)
+    time.sleep(0.2)
+    assert flushed == [[{"number": 1}]]